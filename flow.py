@@ -4,6 +4,28 @@ import platform
 import subprocess
 import re
 import json
+import mimetypes
+import time
+import base64
+import binascii
+import itertools
+import bisect
+import gzip
+import hashlib
+import heapq
+import marshal
+import queue
+import sqlite3
+import statistics
+import tarfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import zipfile
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timedelta
 
@@ -18,34 +40,1810 @@ except Exception:
     # Non-fatal: proceed if environment cannot be modified
     pass
 
-from PyQt6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QLineEdit, QPushButton, QHBoxLayout, QTabWidget, QListWidget, QSplitter, QDialog, QLabel, QFormLayout, QComboBox, QCheckBox, QToolBar, QMenu, QFileDialog, QMessageBox, QProgressBar
+from PyQt6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QLineEdit, QPushButton, QHBoxLayout, QTabWidget, QListWidget, QListView, QSplitter, QDialog, QLabel, QFormLayout, QComboBox, QCheckBox, QToolBar, QMenu, QFileDialog, QMessageBox, QProgressBar, QSpinBox, QCompleter, QAbstractItemView, QDateEdit
 from PyQt6.QtGui import QAction, QPalette, QColor, QShortcut, QKeySequence, QIcon
 from PyQt6.QtWebEngineWidgets import QWebEngineView
-from PyQt6.QtWebEngineCore import QWebEnginePage, QWebEngineSettings, QWebEngineProfile, QWebEngineDownloadRequest
+from PyQt6.QtWebEngineCore import QWebEnginePage, QWebEngineSettings, QWebEngineProfile, QWebEngineDownloadRequest, QWebEngineScript, QWebEngineUrlRequestInterceptor, QWebEngineUrlRequestInfo, QWebEngineUrlRequestJob, QWebEngineUrlScheme, QWebEngineUrlSchemeHandler
 from PyQt6.QtWebChannel import QWebChannel
-from PyQt6.QtCore import QUrl, Qt, QObject, pyqtSlot
+from PyQt6.QtCore import QUrl, Qt, QDate, QObject, QTimer, QEventLoop, QFile, QBuffer, QIODevice, QStringListModel, QFileSystemWatcher, QAbstractListModel, QModelIndex, QEvent, pyqtSignal, pyqtSlot
 from PyQt6.QtWidgets import QStatusBar, QStyle, QDialogButtonBox
-from PyQt6.QtNetwork import QNetworkProxy
+from PyQt6.QtNetwork import QNetworkProxy, QNetworkCookie
 
 
 # Global persistent profile
 _PERSISTENT_PROFILE = None
+# Request interceptor installed on it (see ContentBlocker)
+_CONTENT_BLOCKER = None
+# flow-games:// handler installed on it (see OfflineGamesSchemeHandler)
+_OFFLINE_GAMES = None
+
+# Defaults for ./flow-settings/settings.json (missing keys fall back to these)
+_DEFAULT_SETTINGS = {
+    # Background tabs are frozen after this many idle seconds (0 = never).
+    "tab_freeze_idle_secs": 300,
+    # Least-recently-used tabs are discarded when renderers exceed this (0 = unlimited).
+    "tab_memory_budget_mb": 4096,
+    # Preconnect to the origins of hovered links and confident omnibox matches.
+    "preconnect_hints": True,
+    # Block requests matching the filter lists in ./flow-filters/*.txt.
+    "content_blocking": True,
+    # HTTP cache: "disk", "memory" or "none"; size cap in MB (0 = Chromium's default).
+    "http_cache_type": "disk",
+    "http_cache_max_mb": 0,
+    # "allow" keeps persistent cookies, "force" keeps session cookies too,
+    # "session" forgets every cookie on exit.
+    "persistent_cookies": "allow",
+    # Downloads at least this large are fetched over parallel range requests (1 = off).
+    # Opt-in: the re-request is a plain GET with cookies only, so it loses POST bodies,
+    # HTTP auth, client certificates and content blocking.
+    "download_segments": 1,
+    "segmented_download_min_mb": 32,
+    # Downloads beyond these limits wait as "Queued"; bandwidth cap in KB/s (0 = unlimited).
+    "max_concurrent_downloads": 3,
+    "max_downloads_per_host": 2,
+    "download_bandwidth_kbps": 0,
+    # Finished downloads are hashed (SHA-256) and checked against a checksum sidecar;
+    # zip/tar archives are unpacked next to themselves if enabled.
+    "post_process_downloads": True,
+    "extract_downloaded_archives": False,
+}
+
+# Setting values -> QWebEngineProfile enum member names
+_HTTP_CACHE_TYPES = {"disk": "DiskHttpCache", "memory": "MemoryHttpCache", "none": "NoCache"}
+_COOKIE_POLICIES = {"allow": "AllowPersistentCookies", "force": "ForcePersistentCookies", "session": "NoPersistentCookies"}
+
+# Downloads with these suffixes are unpacked when "extract_downloaded_archives" is on
+_ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
 
 def _get_persistent_profile():
     """Get or create a persistent WebEngine profile for cookies and cache."""
-    global _PERSISTENT_PROFILE
+    global _PERSISTENT_PROFILE, _CONTENT_BLOCKER, _OFFLINE_GAMES
     if _PERSISTENT_PROFILE is None:
         profile_path = str(Path.home() / ".flow-browser")
         _PERSISTENT_PROFILE = QWebEngineProfile("flow")
         _PERSISTENT_PROFILE.setCachePath(profile_path + "/cache")
         _PERSISTENT_PROFILE.setPersistentStoragePath(profile_path + "/storage")
+        _install_profile_scripts(_PERSISTENT_PROFILE)
+        # Filter lists live next to flow.py, in ./flow-filters/*.txt
+        _CONTENT_BLOCKER = ContentBlocker(Path(__file__).resolve().parent / "flow-filters")
+        _PERSISTENT_PROFILE.setUrlRequestInterceptor(_CONTENT_BLOCKER)
+        # Offline games live next to flow.py, in ./flow-offlinegames/<game>/
+        _OFFLINE_GAMES = OfflineGamesSchemeHandler(OfflineGameIndex(Path(__file__).resolve().parent / "flow-offlinegames"))
+        _PERSISTENT_PROFILE.installUrlSchemeHandler(_GAMES_SCHEME, _OFFLINE_GAMES)
     return _PERSISTENT_PROFILE
 
+def _apply_profile_policy(profile: QWebEngineProfile, settings: dict) -> None:
+    """Apply the HTTP cache and cookie persistence settings to ``profile`` (startup or runtime)."""
+    cache_type = _HTTP_CACHE_TYPES.get(settings.get("http_cache_type"), "DiskHttpCache")
+    profile.setHttpCacheType(getattr(QWebEngineProfile.HttpCacheType, cache_type))
+    profile.setHttpCacheMaximumSize(max(0, int(settings.get("http_cache_max_mb", 0) or 0)) * 1024 * 1024)
+    policy = _COOKIE_POLICIES.get(settings.get("persistent_cookies"), "AllowPersistentCookies")
+    profile.setPersistentCookiesPolicy(getattr(QWebEngineProfile.PersistentCookiesPolicy, policy))
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def _process_rss_bytes(pid: int) -> int:
+    """Best-effort resident set size of a process, or 0 if it can't be read."""
+    if pid <= 0:
+        return 0
+    try:
+        import psutil  # optional
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            return int(psutil.Process(pid).memory_info().rss)
+        except Exception:
+            return 0
+    try:
+        # Linux: second field of statm is the resident page count.
+        with open(f"/proc/{pid}/statm", "r", encoding="ascii") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+class BookmarkStore:
+    """Bookmarks kept in one append-only journal file (``bookmarks.jsonl``).
+
+    Each line is a JSON record: ``{"op": "add", "id", "title", "url"}`` or
+    ``{"op": "remove", "id"}``, so adding or removing a bookmark appends one line.
+    Once removals make up most of the journal it is compacted by writing the live
+    bookmarks to a temp file and swapping it in. The parsed bookmarks are cached
+    until the file's mtime or size changes. Legacy ``bkN.txt`` files are migrated
+    on first run.
+    """
+
+    FILENAME = "bookmarks.jsonl"
+    COMPACT_SLACK = 64
+
+    _LEGACY_RE = re.compile(r"bk(\d+)\.txt", re.IGNORECASE)
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.path = directory / self.FILENAME
+        self._items: dict[int, dict] = {}
+        self._url_counts: dict[str, int] = {}
+        self._next_id = 1
+        self._journal_lines = 0
+        self._torn_tail = False  # last line has no newline (interrupted write)
+        self._stamp = None  # (mtime_ns, size) of the file as last read or written
+
+        directory.mkdir(parents=True, exist_ok=True)
+        if not self.path.exists():
+            self._migrate_legacy()
+            self._stamp = None
+        self._reload_if_changed()
+
+    def _file_stamp(self):
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _reload_if_changed(self) -> None:
+        stamp = self._file_stamp()
+        if stamp is not None and stamp == self._stamp:
+            return
+
+        items: dict[int, dict] = {}
+        lines = 0
+        self._torn_tail = False
+        if stamp is not None:
+            with open(self.path, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    self._torn_tail = not line.endswith("\n")
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rec = json.loads(line)
+                        lines += 1
+                        if rec.get("op") == "add":
+                            items[int(rec["id"])] = {"id": int(rec["id"]), "title": rec.get("title") or "", "url": rec["url"]}
+                        elif rec.get("op") == "remove":
+                            items.pop(int(rec["id"]), None)
+                    except (ValueError, KeyError, TypeError):
+                        # A torn last line from a crash; everything before it is intact.
+                        continue
+
+        self._items = items
+        self._url_counts = {}
+        for b in items.values():
+            self._url_counts[b["url"]] = self._url_counts.get(b["url"], 0) + 1
+        self._next_id = max(items, default=0) + 1
+        self._journal_lines = lines
+        self._stamp = stamp
+
+    def _append(self, rec: dict) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            if self._torn_tail:
+                f.write("\n")
+                self._torn_tail = False
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self._journal_lines += 1
+        self._stamp = self._file_stamp()
+
+    def _write_all(self, items) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        lines = 0
+        with open(tmp, "w", encoding="utf-8") as f:
+            for b in items:
+                f.write(json.dumps({"op": "add", **b}, ensure_ascii=False) + "\n")
+                lines += 1
+        os.replace(tmp, self.path)
+        self._journal_lines = lines
+        self._stamp = self._file_stamp()
+
+    def _maybe_compact(self) -> None:
+        if self._journal_lines > 2 * len(self._items) + self.COMPACT_SLACK:
+            self._write_all(self._items.values())
+
+    def _migrate_legacy(self) -> None:
+        legacy = []
+        for p in self.directory.glob("bk*.txt"):
+            m = self._LEGACY_RE.fullmatch(p.name)
+            if m:
+                legacy.append((int(m.group(1)), p))
+        if not legacy:
+            return
+
+        legacy.sort(key=lambda t: t[0])
+        items = []
+        for idx, p in legacy:
+            url = p.read_text(encoding="utf-8", errors="ignore").strip()
+            if url:
+                # Legacy files store the URL only; keep the label they used to show.
+                items.append({"id": len(items) + 1, "title": f"bk{idx}", "url": url})
+        self._write_all(items)
+        for _idx, p in legacy:
+            try:
+                p.unlink()
+            except OSError as e:
+                print(f"Could not remove migrated bookmark file {p}: {e}")
+
+    def bookmarks(self) -> list[dict]:
+        """Current bookmarks in insertion order (re-read only if the file changed)."""
+        self._reload_if_changed()
+        return list(self._items.values())
+
+    def has_url(self, url: str) -> bool:
+        return self._url_counts.get(url, 0) > 0
+
+    def add(self, title: str, url: str) -> dict:
+        self._reload_if_changed()
+        bookmark = {"id": self._next_id, "title": title, "url": url}
+        self._next_id += 1
+        self._append({"op": "add", **bookmark})
+        self._items[bookmark["id"]] = bookmark
+        self._url_counts[url] = self._url_counts.get(url, 0) + 1
+        return bookmark
+
+    def remove(self, bookmark_id: int) -> None:
+        self._reload_if_changed()
+        bookmark = self._items.pop(bookmark_id, None)
+        if bookmark is None:
+            return
+        self._url_counts[bookmark["url"]] -= 1
+        self._append({"op": "remove", "id": bookmark_id})
+        self._maybe_compact()
+
+
+class HistoryStore(QObject):
+    """Browsing history persisted in SQLite.
+
+    There is one row per URL; repeat visits bump ``visit_count`` and ``last_visit``
+    instead of adding rows. Visits are queued and committed in batches by a
+    background writer thread so the page-load path never waits on disk. Reads
+    use a separate connection (WAL mode lets them run alongside the writer).
+    ``has_pending_writes()`` tells readers whether waiting on ``flush()`` would
+    change what they see, and ``removed`` is emitted once a clear or delete has
+    been committed.
+
+    ``search()`` pages through the history newest first with keyset paging on
+    ``(last_visit, id)``. A text filter first scans the ``last_visit`` index with
+    LIKE, which finds a page of a common term almost at once; if that takes more
+    than SCAN_BUDGET SQLite steps the term is rare, and an FTS5 trigram index over
+    URL and title (kept in sync by triggers, built by the writer thread the first
+    time) answers it instead. Words too short for the trigram index (or every word,
+    without a trigram tokenizer) can only be scanned for; that scan stops at
+    SCAN_BUDGET steps too and returns the rows it found so far.
+    """
+
+    removed = pyqtSignal()
+
+    BATCH_SIZE = 500
+    BATCH_WINDOW_SECS = 1.0
+    SCAN_BUDGET = 200_000
+    FTS_VERSION = 1  # PRAGMA user_version once history_fts holds every row
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY,
+            url TEXT NOT NULL UNIQUE,
+            host TEXT NOT NULL DEFAULT '',
+            title TEXT NOT NULL DEFAULT '',
+            visit_count INTEGER NOT NULL DEFAULT 0,
+            first_visit REAL NOT NULL,
+            last_visit REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS history_host ON history(host);
+        CREATE INDEX IF NOT EXISTS history_last_visit ON history(last_visit);
+    """
+
+    _FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+            url, title, content='history', content_rowid='id', tokenize='trigram'
+        );
+        CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+            INSERT INTO history_fts(rowid, url, title) VALUES (new.id, new.url, new.title);
+        END;
+        CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+            INSERT INTO history_fts(history_fts, rowid, url, title) VALUES ('delete', old.id, old.url, old.title);
+        END;
+        CREATE TRIGGER IF NOT EXISTS history_fts_update AFTER UPDATE OF url, title ON history
+        WHEN old.url IS NOT new.url OR old.title IS NOT new.title BEGIN
+            INSERT INTO history_fts(history_fts, rowid, url, title) VALUES ('delete', old.id, old.url, old.title);
+            INSERT INTO history_fts(rowid, url, title) VALUES (new.id, new.url, new.title);
+        END;
+    """
+
+    _UPSERT_VISIT = """
+        INSERT INTO history (url, host, title, visit_count, first_visit, last_visit)
+        VALUES (?, ?, ?, 1, ?, ?)
+        ON CONFLICT(url) DO UPDATE SET
+            visit_count = visit_count + 1,
+            last_visit = MAX(last_visit, excluded.last_visit),
+            title = CASE WHEN excluded.title != '' THEN excluded.title ELSE title END
+    """
+
+    def __init__(self, path: Path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._read_conn = None
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0  # queued visits/deletes not committed yet
+
+        conn = self._connect()
+        conn.executescript(self._SCHEMA)
+        self._fts = self._create_fts(conn)
+        conn.close()
+        self._thread = threading.Thread(target=self._writer_loop, name="flow-history-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _create_fts(self, conn: sqlite3.Connection) -> bool:
+        """Create the search index; False if unsupported or still to be filled by the writer."""
+        try:
+            conn.executescript(self._FTS_SCHEMA)
+        except sqlite3.Error as e:
+            print(f"History search index unavailable ({e}); filtering without it")
+            return False
+        # The table exists before it is filled, and a rebuild cut short by quitting
+        # rolls back, so only the version stamped by a finished rebuild counts.
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= self.FTS_VERSION:
+            return True
+        if conn.execute("SELECT 1 FROM history LIMIT 1").fetchone():
+            # Indexing an existing history can take a while; LIKE serves searches meanwhile.
+            self._queue.put(("rebuild_fts", None))
+            return False
+        conn.execute(f"PRAGMA user_version = {self.FTS_VERSION}")  # empty: the triggers keep it complete
+        return True
+
+    def _reader(self) -> sqlite3.Connection:
+        if self._read_conn is None:
+            self._read_conn = self._connect()
+            self._read_conn.row_factory = sqlite3.Row
+        return self._read_conn
+
+    # -- writes (queued) --
+
+    def add_visit(self, url: str, title: str = "", when: float | None = None) -> None:
+        host = QUrl(url).host().lower()
+        self._put_write(("visit", (url, host, title or "", when or time.time())))
+
+    def clear(self) -> None:
+        self._put_write(("clear", None))
+
+    def delete_range(self, start: float, end: float) -> None:
+        """Delete entries last visited in ``[start, end)``."""
+        self._put_write(("delete_range", (start, end)))
+
+    def delete_hosts(self, hosts) -> None:
+        self._put_write(("delete_hosts", [h.lower() for h in hosts]))
+
+    def _put_write(self, op: tuple) -> None:
+        with self._lock:
+            self._pending += 1
+        self._queue.put(op)
+
+    def has_pending_writes(self) -> bool:
+        with self._lock:
+            return self._pending > 0
+
+    def flush(self, timeout: float = 2.0) -> None:
+        """Block until every write queued so far has been committed."""
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        done.wait(timeout)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5.0)
+        if self._read_conn is not None:
+            self._read_conn.close()
+            self._read_conn = None
+
+    def _writer_loop(self) -> None:
+        conn = self._connect()
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.BATCH_WINDOW_SECS
+            while batch[-1] is not None and batch[-1][0] != "flush" and len(batch) < self.BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            waiters = []
+            rebuilt = False
+            writes = [op[0] for op in batch if op is not None and op[0] not in ("flush", "rebuild_fts")]
+            try:
+                with conn:
+                    for op in batch:
+                        if op is None:
+                            running = False
+                            break
+                        kind, arg = op
+                        if kind == "visit":
+                            url, host, title, when = arg
+                            conn.execute(self._UPSERT_VISIT, (url, host, title, when, when))
+                        elif kind == "clear":
+                            conn.execute("DELETE FROM history")
+                        elif kind == "delete_range":
+                            conn.execute("DELETE FROM history WHERE last_visit >= ? AND last_visit < ?", arg)
+                        elif kind == "delete_hosts":
+                            conn.executemany("DELETE FROM history WHERE host = ?", [(h,) for h in arg])
+                        elif kind == "rebuild_fts":
+                            conn.execute("INSERT INTO history_fts(history_fts) VALUES ('rebuild')")
+                            # Same transaction: the stamp only lands with a complete index.
+                            conn.execute(f"PRAGMA user_version = {self.FTS_VERSION}")
+                            rebuilt = True
+                        elif kind == "flush":
+                            waiters.append(arg)
+            except sqlite3.Error as e:
+                print(f"History write failed: {e}")
+                rebuilt = False
+            if rebuilt:
+                self._fts = True
+            with self._lock:
+                self._pending -= len(writes)
+            for done in waiters:
+                done.set()
+            if any(kind != "visit" for kind in writes):
+                self.removed.emit()
+        conn.close()
+
+    # -- reads --
+
+    def recent(self, limit: int = 50) -> list[dict]:
+        self.flush()
+        rows = self._reader().execute(
+            "SELECT url, title, host, visit_count, last_visit FROM history ORDER BY last_visit DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def search(self, text: str = "", start: float | None = None, end: float | None = None,
+               before: tuple[float, int] | None = None, limit: int = 200) -> tuple[list[dict], bool]:
+        """Up to ``limit`` entries, newest first, matching ``text`` and last visited in ``[start, end)``.
+
+        Every word of ``text`` must occur in the URL or the title. ``before`` is the
+        ``(last_visit, id)`` of the previous page's last row. Also returns whether the
+        search ran to the end; if not, the rows are those found within the scan
+        budget, and the next page may continue from the last of them.
+        """
+        terms = text.lower().split()
+        fts_terms = [t for t in terms if len(t) >= 3] if self._fts else []
+        if not fts_terms:
+            return self._search(terms, [], start, end, before, limit, budget=self.SCAN_BUDGET if terms else 0, partial=True)
+        try:
+            return self._search(terms, [], start, end, before, limit, budget=self.SCAN_BUDGET)
+        except sqlite3.OperationalError:
+            pass  # scan budget used up: rare term, ask the index
+        like_terms = [t for t in terms if t not in fts_terms]
+        return self._search(like_terms, fts_terms, start, end, before, limit)
+
+    def _search(self, like_terms, fts_terms, start, end, before, limit,
+                budget: int = 0, partial: bool = False) -> tuple[list[dict], bool]:
+        where, args = [], []
+        for term in like_terms:
+            pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where.append("(url LIKE ? ESCAPE '\\' OR title LIKE ? ESCAPE '\\')")
+            args += [pattern, pattern]
+        if fts_terms:
+            where.append("id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+            args.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in fts_terms))
+        if start is not None:
+            where.append("last_visit >= ?")
+            args.append(start)
+        if end is not None:
+            where.append("last_visit < ?")
+            args.append(end)
+        if before is not None:
+            where.append("(last_visit, id) < (?, ?)")
+            args += list(before)
+        sql = "SELECT id, url, title, host, visit_count, last_visit FROM history"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY last_visit DESC, id DESC LIMIT ?"
+
+        conn = self._reader()
+        if budget:
+            # Interrupts the statement (OperationalError) once it has run ``budget`` steps.
+            conn.set_progress_handler(lambda: 1, budget)
+        rows, complete = [], True
+        try:
+            # Rows come off the last_visit index in order, so the ones read before an
+            # interrupt are the newest matches.
+            for row in conn.execute(sql, args + [limit]):
+                rows.append(dict(row))
+        except sqlite3.OperationalError:
+            if not (budget and partial):
+                raise
+            complete = False
+        finally:
+            conn.set_progress_handler(None, 0)
+        return rows, complete
+
+    def iter_visits(self):
+        """Yield ``(url, title, visit_count, last_visit)`` for every row.
+
+        Uses its own connection, so it is safe to call from a worker thread.
+        """
+        conn = self._connect()
+        try:
+            yield from conn.execute("SELECT url, title, visit_count, last_visit FROM history")
+        finally:
+            conn.close()
+
+
+class CookieJar(QObject):
+    """Mirror of the profile's cookie store, indexed by domain.
+
+    QWebEngineCookieStore only reports changes (``cookieAdded``/``cookieRemoved``;
+    ``loadAllCookies()`` replays the persistent ones), so the jar is built from those
+    signals. Expired cookies are swept off a heap once a minute. Changes only mark
+    the jar dirty; a debounced timer hands a snapshot to a writer thread, which
+    writes ``cookies.json`` compactly to a temp file and swaps it in, so a burst of
+    hundreds of cookies costs one write. With ``persist`` off (the "forget cookies
+    on exit" policy) the jar stays in memory only and the file is emptied.
+    """
+
+    WRITE_DELAY_MS = 2000
+    MAX_WRITE_DELAY_SECS = 10.0
+    SWEEP_INTERVAL_MS = 60 * 1000
+    DELETE_BATCH = 200
+
+    changed = pyqtSignal()
+
+    def __init__(self, path: Path, cookie_store=None, parent=None, persist: bool = True):
+        super().__init__(parent)
+        self.path = path
+        self.persist = persist
+        # domain -> {(name, path): cookie dict}. Cookie dicts are never mutated once
+        # stored, so the writer thread can serialize them without copying.
+        self._domains: dict[str, dict[tuple[str, str], dict]] = {}
+        self._count = 0
+        self._expiry_heap: list[tuple[float, str, str, str]] = []
+
+        self._generation = 0
+        self._written_generation = 0
+        self._dirty_since = None
+
+        self._write_timer = QTimer(self)
+        self._write_timer.setSingleShot(True)
+        self._write_timer.setInterval(self.WRITE_DELAY_MS)
+        self._write_timer.timeout.connect(self._schedule_write)
+
+        self._sweep_timer = QTimer(self)
+        self._sweep_timer.setInterval(self.SWEEP_INTERVAL_MS)
+        self._sweep_timer.timeout.connect(self.sweep_expired)
+        self._sweep_timer.start()
+
+        # The writer only ever needs the newest snapshot, so this is a slot, not a queue.
+        self._cond = threading.Condition()
+        self._pending = None
+        self._closing = False
+        self._thread = threading.Thread(target=self._writer_loop, name="flow-cookie-writer", daemon=True)
+        self._thread.start()
+
+        # Cookies waiting to be deleted from the store, drained DELETE_BATCH at a time.
+        self._delete_queue: deque = deque()
+        self._delete_timer = QTimer(self)
+        self._delete_timer.setInterval(0)
+        self._delete_timer.timeout.connect(self._delete_next_batch)
+
+        self._store = cookie_store
+        if cookie_store is not None:
+            cookie_store.cookieAdded.connect(self._on_cookie_added)
+            cookie_store.cookieRemoved.connect(self._on_cookie_removed)
+
+        if not persist:
+            self.set_persistent(False)  # empty what an earlier session left on disk
+
+    def set_persistent(self, persist: bool) -> None:
+        """Switch between mirroring the jar to ``cookies.json`` and keeping that file empty."""
+        self.persist = persist
+        self._generation += 1
+        self._write_timer.start(0)
+
+    def load(self) -> None:
+        """Ask the store to replay its persisted cookies into the jar."""
+        if self._store is not None:
+            self._store.loadAllCookies()
+
+    @staticmethod
+    def _text(data) -> str:
+        return bytes(data).decode("utf-8", errors="replace")
+
+    def _cookie_dict(self, cookie) -> dict:
+        expires_at = None
+        if not cookie.isSessionCookie():
+            expires_at = cookie.expirationDate().toSecsSinceEpoch()
+        return {
+            "name": self._text(cookie.name()),
+            "value": self._text(cookie.value()),
+            "domain": cookie.domain(),
+            "path": cookie.path() or "/",
+            "expires": datetime.fromtimestamp(expires_at).isoformat(timespec="seconds") if expires_at is not None else "Session",
+            "expiresAt": expires_at,
+            "secure": cookie.isSecure(),
+            "httpOnly": cookie.isHttpOnly(),
+        }
+
+    # -- store signals --
+
+    def _on_cookie_added(self, cookie) -> None:
+        self.put(self._cookie_dict(cookie))
+
+    def _on_cookie_removed(self, cookie) -> None:
+        self.discard(cookie.domain(), self._text(cookie.name()), cookie.path() or "/")
+
+    # -- jar --
+
+    def put(self, c: dict) -> None:
+        expires_at = c.get("expiresAt")
+        if expires_at is not None and expires_at <= time.time():
+            self.discard(c["domain"], c["name"], c["path"])
+            return
+        cookies = self._domains.setdefault(c["domain"], {})
+        key = (c["name"], c["path"])
+        if cookies.get(key) == c:
+            return
+        if key not in cookies:
+            self._count += 1
+        cookies[key] = c
+        if expires_at is not None:
+            heapq.heappush(self._expiry_heap, (expires_at, c["domain"], c["name"], c["path"]))
+        self._mark_dirty()
+
+    def discard(self, domain: str, name: str, path: str) -> bool:
+        cookies = self._domains.get(domain)
+        if not cookies or cookies.pop((name, path), None) is None:
+            return False
+        self._count -= 1
+        if not cookies:
+            del self._domains[domain]
+        self._mark_dirty()
+        return True
+
+    def clear(self) -> None:
+        self._domains.clear()
+        self._expiry_heap.clear()
+        self._count = 0
+        self._mark_dirty()
+
+    def delete_domains(self, domains) -> int:
+        """Delete every cookie of ``domains`` from the jar and the profile store.
+
+        The jar drops them at once; the store deletions are issued in batches from
+        a timer so deleting thousands of cookies doesn't block the UI.
+        """
+        removed = 0
+        for domain in domains:
+            cookies = self._domains.pop(domain, None)
+            if not cookies:
+                continue
+            removed += len(cookies)
+            self._delete_queue.extend(cookies.values())
+        if removed:
+            self._count -= removed
+            self._mark_dirty()
+            if self._store is not None:
+                self._delete_timer.start()
+            else:
+                self._delete_queue.clear()
+        return removed
+
+    def _delete_next_batch(self) -> None:
+        for _ in range(min(self.DELETE_BATCH, len(self._delete_queue))):
+            c = self._delete_queue.popleft()
+            cookie = QNetworkCookie(c["name"].encode("utf-8"), c["value"].encode("utf-8"))
+            cookie.setDomain(c["domain"])
+            cookie.setPath(c["path"])
+            self._store.deleteCookie(cookie)
+        if not self._delete_queue:
+            self._delete_timer.stop()
+
+    def sweep_expired(self) -> int:
+        """Drop cookies whose expiry has passed; returns how many were removed."""
+        now = time.time()
+        heap = self._expiry_heap
+        removed = 0
+        while heap and heap[0][0] <= now:
+            expires_at, domain, name, path = heapq.heappop(heap)
+            c = self._domains.get(domain, {}).get((name, path))
+            # Heap entries of cookies that were since replaced or removed are skipped.
+            if c is not None and c.get("expiresAt") == expires_at and self.discard(domain, name, path):
+                removed += 1
+        return removed
+
+    def __len__(self):
+        return self._count
+
+    def domains(self) -> list[str]:
+        return list(self._domains)
+
+    def for_domain(self, domain: str) -> list[dict]:
+        return list(self._domains.get(domain, {}).values())
+
+    @staticmethod
+    def host_domains(host: str) -> list[str]:
+        """The jar domains whose cookies are sent to ``host``: its own and its parents'."""
+        labels = host.lower().split(".")
+        domains = [".".join(labels), "." + ".".join(labels)]
+        domains.extend("." + ".".join(labels[i:]) for i in range(1, len(labels)))
+        return domains
+
+    def for_host(self, host: str) -> list[dict]:
+        """Cookies that would be sent to ``host`` (its own and its parent domains')."""
+        found = []
+        for domain in self.host_domains(host):
+            found.extend(self._domains.get(domain, {}).values())
+        return found
+
+    def snapshot(self) -> dict[str, list[dict]]:
+        """``{domain: [cookie, ...]}``, the same shape as ``cookies.json``."""
+        return {domain: list(cookies.values()) for domain, cookies in self._domains.items()}
+
+    # -- persistence --
+
+    def _mark_dirty(self) -> None:
+        self._generation += 1
+        if not self.persist:
+            self.changed.emit()
+            return
+        now = time.monotonic()
+        if self._dirty_since is None:
+            self._dirty_since = now
+        # Keep pushing the write back while a burst lasts, but not forever.
+        if now - self._dirty_since < self.MAX_WRITE_DELAY_SECS:
+            self._write_timer.start()
+        elif not self._write_timer.isActive():
+            self._write_timer.start(0)
+        self.changed.emit()
+
+    def _schedule_write(self) -> None:
+        self._dirty_since = None
+        if self._generation == self._written_generation:
+            return
+        self._written_generation = self._generation
+        with self._cond:
+            self._pending = self.snapshot() if self.persist else {}
+            self._cond.notify()
+
+    def close(self) -> None:
+        """Write any pending changes and stop the writer thread."""
+        self._write_timer.stop()
+        self._schedule_write()
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout=5.0)
+
+    def _writer_loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closing:
+                    self._cond.wait()
+                data, self._pending = self._pending, None
+                closing = self._closing
+            if data is not None:
+                self._write(data)
+            if closing:
+                return
+
+    def _write(self, data: dict) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Cookie values are session credentials: readable by the user only.
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Error saving cookies: {e}")
+
+
+class OmniboxIndex:
+    """Prefix index over history and bookmarks for omnibox completion, ranked by frecency.
+
+    Each entry's URL and title are split into lowercase word tokens. Unique tokens
+    are kept sorted, and each token points at a run of entry ids in one flat array,
+    so the ids for every token starting with a prefix are one contiguous slice found
+    with two bisects. New tokens go to a small delta that a background thread merges
+    in once it grows. Words matching a large share of all entries are answered by
+    walking entries in frecency order and stopping at the first hits. Deleted
+    history is flagged as removed (its postings are skipped at query time);
+    bookmarked entries only lose their visits.
+    """
+
+    MAX_TOKENS = 16
+    MAX_TOKEN_LEN = 32
+    SLICE_LIMIT = 32768
+    MERGE_THRESHOLD = 4096
+    TOUCHED_THRESHOLD = 1024
+    BOOKMARK_BONUS = 5
+
+    _TOKEN_RE = re.compile(r"[^\W_]+")
+    _SCHEME_RE = re.compile(r"^[a-z][a-z0-9+.-]*://(www\.)?")
+    _QUERY_PREFIX_RE = re.compile(r"^(?:[a-z][a-z0-9+.-]*://)?(?:www\.)?")  # typed text may lack the scheme
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ready = False
+        self._pending: list[tuple] = []  # updates received while building
+
+        # Per-entry columns, indexed by entry id.
+        self._urls: list[str] = []
+        self._titles: list[str] = []
+        self._visits = array("I")
+        self._last_visit = array("d")
+        self._bookmarked = bytearray()
+        self._removed = bytearray()
+        self._score = array("f")
+        self._ids: dict[str, int] = {}
+
+        # Token -> ids, as sorted unique tokens plus offsets into a flat id array.
+        self._tokens: list[str] = []
+        self._offsets = array("I", [0])
+        self._postings = array("I")
+
+        # Token -> ids added since the last merge, and ids whose score changed.
+        self._delta: dict[str, list[int]] = {}
+        self._delta_size = 0
+        self._merging: dict[str, list[int]] = {}
+        self._touched: set[int] = set()
+        self._merge_thread = None
+
+        # Entry ids sorted by frecency as of the last merge.
+        self._order = array("I")
+
+    @classmethod
+    def tokenize(cls, url: str, title: str = "") -> set[str]:
+        tokens = set()
+        for text in (cls._SCHEME_RE.sub("", url.lower()), title.lower()):
+            # Long tokens and long digit runs are ids/hashes nobody types.
+            words = [
+                w for w in cls._TOKEN_RE.findall(text)
+                if len(w) <= cls.MAX_TOKEN_LEN and not (len(w) > 6 and w.isdigit())
+            ]
+            tokens.update(words[:cls.MAX_TOKENS])
+        return tokens
+
+    def frecency(self, entry_id: int, now: float) -> float:
+        age_days = (now - self._last_visit[entry_id]) / 86400.0
+        if age_days < 4:
+            weight = 100
+        elif age_days < 14:
+            weight = 70
+        elif age_days < 31:
+            weight = 50
+        elif age_days < 90:
+            weight = 30
+        else:
+            weight = 10
+        return (self._visits[entry_id] + self.BOOKMARK_BONUS * self._bookmarked[entry_id]) * weight
+
+    # -- building --
+
+    def build(self, history_rows, bookmarks=()) -> None:
+        """Index history rows ``(url, title, visit_count, last_visit)`` and bookmark dicts.
+
+        Meant to run on a worker thread; queries return nothing until it finishes.
+        """
+        for url, title, visits, last_visit in history_rows:
+            self._add_entry(url, title or "", int(visits), float(last_visit), 0)
+        for b in bookmarks:
+            self._apply_bookmark(b.get("url") or "", b.get("title") or "", True)
+
+        rebuilt = self._rebuild(self._delta, reorder=True)
+        with self._lock:
+            self._tokens, self._offsets, self._postings, self._order = rebuilt
+            self._delta, self._delta_size = {}, 0
+            self._touched = set()
+            self.ready = True
+            pending, self._pending = self._pending, []
+        for op in pending:
+            op[0](*op[1:])
+
+    def _add_entry(self, url: str, title: str, visits: int, last_visit: float, bookmarked: int) -> int:
+        entry_id = len(self._urls)
+        self._urls.append(url)
+        self._titles.append(title)
+        self._visits.append(visits)
+        self._last_visit.append(last_visit)
+        self._bookmarked.append(bookmarked)
+        self._removed.append(0)
+        self._score.append(0.0)
+        self._score[entry_id] = self.frecency(entry_id, time.time())
+        self._ids[url] = entry_id
+        self._add_tokens(entry_id, self.tokenize(url, title))
+        return entry_id
+
+    def _add_tokens(self, entry_id: int, tokens) -> None:
+        delta = self._delta
+        for tok in tokens:
+            ids = delta.get(tok)
+            if ids is None:
+                delta[tok] = [entry_id]
+            else:
+                ids.append(entry_id)
+        self._delta_size += len(tokens)
+
+    def _rebuild(self, delta: dict, reorder: bool) -> tuple:
+        # Splice the delta into new token/offset/postings arrays. The current arrays
+        # are only ever replaced, never mutated, so this runs without the lock.
+        old_tokens, old_offsets, old_postings = self._tokens, self._offsets, self._postings
+        tokens: list[str] = []
+        offsets = array("I", [0])
+        postings = array("I")
+        start = 0  # next old token to copy
+        for tok in sorted(delta):
+            pos = bisect.bisect_left(old_tokens, tok, start)
+            # Copy the untouched run of old tokens in one go, shifting their offsets.
+            if pos > start:
+                shift = len(postings) - old_offsets[start]
+                tokens.extend(old_tokens[start:pos])
+                postings.extend(old_postings[old_offsets[start]:old_offsets[pos]])
+                offsets.extend(o + shift for o in old_offsets[start + 1:pos + 1])
+            tokens.append(tok)
+            if pos < len(old_tokens) and old_tokens[pos] == tok:
+                postings.extend(old_postings[old_offsets[pos]:old_offsets[pos + 1]])
+                pos += 1
+            postings.extend(delta[tok])
+            offsets.append(len(postings))
+            start = pos
+        if start < len(old_tokens):
+            shift = len(postings) - old_offsets[start]
+            tokens.extend(old_tokens[start:])
+            postings.extend(old_postings[old_offsets[start]:])
+            offsets.extend(o + shift for o in old_offsets[start + 1:])
+
+        order = self._order
+        if reorder:
+            score = self._score
+            order = array("I", sorted(range(len(score)), key=score.__getitem__, reverse=True))
+        return tokens, offsets, postings, order
+
+    # -- incremental updates (UI thread) --
+
+    def add_visit(self, url: str, title: str = "", when: float | None = None) -> None:
+        with self._lock:
+            if not self.ready:
+                self._pending.append((self.add_visit, url, title, when))
+                return
+            when = when or time.time()
+            entry_id = self._ids.get(url)
+            if entry_id is None:
+                entry_id = self._add_entry(url, title or "", 1, when, 0)
+            else:
+                self._visits[entry_id] += 1
+                self._last_visit[entry_id] = max(self._last_visit[entry_id], when)
+                self._score[entry_id] = self.frecency(entry_id, time.time())
+                self._retitle(entry_id, title)
+            self._touched.add(entry_id)
+        self._maybe_merge()
+
+    def set_bookmarked(self, url: str, title: str = "", bookmarked: bool = True) -> None:
+        with self._lock:
+            if not self.ready:
+                self._pending.append((self.set_bookmarked, url, title, bookmarked))
+                return
+            self._apply_bookmark(url, title, bookmarked)
+        self._maybe_merge()
+
+    def _apply_bookmark(self, url: str, title: str, bookmarked: bool) -> None:
+        if not url:
+            return
+        entry_id = self._ids.get(url)
+        if entry_id is None:
+            if not bookmarked:
+                return
+            entry_id = self._add_entry(url, title, 0, time.time(), 1)
+        else:
+            self._bookmarked[entry_id] = 1 if bookmarked else 0
+            self._score[entry_id] = self.frecency(entry_id, time.time())
+            self._retitle(entry_id, title)
+        self._touched.add(entry_id)
+
+    def remove_hosts(self, hosts) -> None:
+        """Forget the history of ``hosts`` (as ``HistoryStore.delete_hosts``)."""
+        hosts = {h.lower() for h in hosts}
+        with self._lock:
+            if not self.ready:
+                self._pending.append((self.remove_hosts, hosts))
+                return
+            for entry_id in self._host_candidates(hosts):
+                if (urllib.parse.urlsplit(self._urls[entry_id]).hostname or "") in hosts:
+                    self._forget_visits(entry_id)
+
+    def remove_range(self, start: float, end: float) -> None:
+        """Forget entries last visited in ``[start, end)`` (as ``HistoryStore.delete_range``)."""
+        with self._lock:
+            if not self.ready:
+                self._pending.append((self.remove_range, start, end))
+                return
+            for entry_id, last_visit in enumerate(self._last_visit):
+                if start <= last_visit < end and self._visits[entry_id]:
+                    self._forget_visits(entry_id)
+
+    def clear(self) -> None:
+        """Forget all history; bookmarks stay."""
+        with self._lock:
+            if not self.ready:
+                self._pending.append((self.clear,))
+                return
+            for entry_id, visits in enumerate(self._visits):
+                if visits:
+                    self._forget_visits(entry_id)
+
+    def _host_candidates(self, hosts: set[str]):
+        # A host's longest label is indexed as a whole token (the scheme and "www."
+        # are stripped before tokenizing); labels that aren't indexed mean a full scan.
+        ids = set()
+        for host in hosts:
+            label = max(self._TOKEN_RE.findall(host.removeprefix("www.")), key=len, default="")
+            if not label or label not in self.tokenize(label):
+                return range(len(self._urls))
+            pos = bisect.bisect_left(self._tokens, label)
+            if pos < len(self._tokens) and self._tokens[pos] == label:
+                ids.update(self._postings[self._offsets[pos]:self._offsets[pos + 1]])
+            for delta in (self._delta, self._merging):
+                ids.update(delta.get(label, ()))
+        return ids
+
+    def _forget_visits(self, entry_id: int) -> None:
+        if self._removed[entry_id]:
+            return
+        self._visits[entry_id] = 0
+        self._touched.discard(entry_id)
+        if self._bookmarked[entry_id]:
+            self._score[entry_id] = self.frecency(entry_id, time.time())
+            return
+        # Postings still point here until the next full build; queries skip it.
+        self._removed[entry_id] = 1
+        self._score[entry_id] = -1.0
+        del self._ids[self._urls[entry_id]]
+
+    def _retitle(self, entry_id: int, title: str) -> None:
+        old = self._titles[entry_id]
+        if not title or title == old:
+            return
+        self._titles[entry_id] = title
+        # Tokens of the old title stay indexed; matches are re-checked at query time.
+        known = self.tokenize(self._urls[entry_id], old)
+        self._add_tokens(entry_id, self.tokenize("", title) - known)
+
+    def _maybe_merge(self) -> None:
+        if self._delta_size < self.MERGE_THRESHOLD and len(self._touched) < self.TOUCHED_THRESHOLD:
+            return
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return
+        with self._lock:
+            # Touched ids get re-ranked by the new frecency order.
+            self._merging, self._delta, self._delta_size = self._delta, {}, 0
+            self._touched = set()
+        self._merge_thread = threading.Thread(target=self._merge, name="flow-omnibox-merge", daemon=True)
+        self._merge_thread.start()
+
+    def _merge(self) -> None:
+        rebuilt = self._rebuild(self._merging, reorder=True)
+        with self._lock:
+            self._tokens, self._offsets, self._postings, self._order = rebuilt
+            self._merging = {}
+
+    # -- queries --
+
+    def query(self, text: str, limit: int = 8) -> list[str]:
+        """Return up to ``limit`` URLs with a token starting with each word of ``text``."""
+        # "www." is stripped before indexing, so it must not become a word to match.
+        terms = self._TOKEN_RE.findall(self._QUERY_PREFIX_RE.sub("", text.lower()))
+        if not terms or not self.ready:
+            return []
+
+        with self._lock:
+            tokens, offsets, postings, order = self._tokens, self._offsets, self._postings, self._order
+            recent = [(tok, ids) for d in (self._delta, self._merging) for tok, ids in d.items()]
+            touched = set(self._touched)
+            urls, titles, score, removed = self._urls, self._titles, self._score, self._removed
+
+        patterns = [re.compile(r"(?:^|[\W_])" + re.escape(t)) for t in terms]
+
+        def matches(entry_id):
+            if removed[entry_id]:
+                return False
+            haystack = f"{urls[entry_id]} {titles[entry_id]}".lower()
+            return all(p.search(haystack) for p in patterns)
+
+        # How many indexed ids each word's prefix range covers, most selective first.
+        ranges = []
+        for term in terms:
+            lo = bisect.bisect_left(tokens, term)
+            hi = bisect.bisect_left(tokens, term + "\uffff", lo)
+            ranges.append((offsets[hi] - offsets[lo], term, offsets[lo], offsets[hi]))
+        ranges.sort()
+
+        count, term, start, end = ranges[0]
+        if count <= self.SLICE_LIMIT:
+            candidates = postings[start:end]
+            for other_count, _term, other_start, other_end in ranges[1:]:
+                if other_count > self.SLICE_LIMIT:
+                    break
+                candidates = set(candidates).intersection(postings[other_start:other_end])
+            candidates = set(candidates)
+            for tok, ids in recent:
+                if tok.startswith(term):
+                    candidates.update(ids)
+            # Pre-rank on the stored score (C-level key), then check and re-rank exactly.
+            shortlist = heapq.nlargest(limit * 8, candidates, key=score.__getitem__)
+            # Also for one word: tokens of a replaced title stay indexed.
+            shortlist = [i for i in shortlist if matches(i)]
+        else:
+            # Every word is common: walk the frecency order and stop once enough match.
+            shortlist = [i for i in touched if matches(i)]
+            found = 0
+            for entry_id in order:
+                if found >= limit * 4:
+                    break
+                if matches(entry_id):
+                    shortlist.append(entry_id)
+                    found += 1
+            shortlist.extend(i for _tok, ids in recent for i in ids if i not in touched and matches(i))
+
+        now = time.time()
+        ranked = heapq.nlargest(limit, set(shortlist), key=lambda i: self.frecency(i, now))
+        return [urls[i] for i in ranked]
+
+
+# EasyList type options -> QWebEngineUrlRequestInfo.ResourceType names.
+_FILTER_TYPE_OPTIONS = {
+    "script": ("ResourceTypeScript",),
+    "image": ("ResourceTypeImage", "ResourceTypeFavicon"),
+    "stylesheet": ("ResourceTypeStylesheet",),
+    "object": ("ResourceTypeObject", "ResourceTypePluginResource"),
+    "xmlhttprequest": ("ResourceTypeXhr", "ResourceTypeJson"),
+    "subdocument": ("ResourceTypeSubFrame",),
+    "ping": ("ResourceTypePing", "ResourceTypeCspReport"),
+    "media": ("ResourceTypeMedia",),
+    "font": ("ResourceTypeFontResource",),
+    "websocket": ("ResourceTypeWebSocket",),
+    "other": (),
+}
+_FILTER_TYPE_BITS = {name: 1 << i for i, name in enumerate(_FILTER_TYPE_OPTIONS)}
+_FILTER_ALL_TYPES = (1 << len(_FILTER_TYPE_OPTIONS)) - 1
+_RESOURCE_TYPE_BITS = {
+    rt: _FILTER_TYPE_BITS[option] for option, names in _FILTER_TYPE_OPTIONS.items() for rt in names
+}
+
+# Options that change what a rule does rather than what it matches; rules using
+# them (and the cosmetic/HTML filters) are skipped rather than misapplied.
+_FILTER_UNSUPPORTED_OPTIONS = {
+    "popup", "csp", "redirect", "redirect-rule", "removeparam", "rewrite", "replace",
+    "document", "doc", "elemhide", "ehide", "generichide", "ghide", "specifichide",
+    "shide", "genericblock", "header", "permissions", "badfilter", "empty", "mp4",
+    "inline-script", "inline-font", "to", "denyallow", "method", "all", "cname",
+}
+
+
+def _registrable_domain(host: str) -> str:
+    # Approximation without a public-suffix list: keep three labels for
+    # "example.co.uk"-style hosts, otherwise two.
+    labels = host.split(".")
+    if len(labels) > 2 and len(labels[-2]) <= 3 and len(labels[-1]) == 2:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def _host_suffixes(host: str):
+    labels = host.split(".")
+    for i in range(len(labels)):
+        yield ".".join(labels[i:])
+
+
+class FilterListCompiler:
+    """Compile EasyList-style network filters into ContentBlocker's lookup tables.
+
+    ``||example.com^`` rules (the bulk of tracker lists) go into a dict keyed by
+    domain, matched by walking the request host's suffixes. Every other URL rule
+    is filed under one token that any matching URL must contain as a whole token
+    (the rarest candidate, to keep buckets short), so a request only tests the
+    rules filed under its own tokens. Rules without such a token are "generic"
+    and always tested. Patterns with wildcards/anchors become regex sources that
+    are compiled on first use.
+
+    A rule is ``(kind, pattern, options)``: kind "s" is a plain substring, "r" a
+    regex source; options are ``(type_bits, third_party, include, exclude)``.
+    """
+
+    FORMAT_VERSION = 1
+
+    _TOKEN_RE = re.compile(r"[a-z0-9%]{2,}")
+
+    def __init__(self):
+        self.tables = {
+            "block_domains": {}, "allow_domains": {},
+            "block_tokens": {}, "allow_tokens": {},
+            "block_generic": [], "allow_generic": [],
+        }
+        self._token_counts: dict[str, int] = {}
+        self.rules = 0
+        self.skipped = 0
+
+    def add_file(self, path: Path) -> None:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                self.add_line(line.strip())
+
+    def add_line(self, line: str) -> None:
+        if not line or line[0] in "![" or "##" in line or "#@#" in line or "#?#" in line or "#$#" in line:
+            return
+        allow = line.startswith("@@")
+        if allow:
+            line = line[2:]
+
+        pattern, options = line, ""
+        if "$" in line and not (line.startswith("/") and line.endswith("/")):
+            pattern, _, options = line.rpartition("$")
+        opts = self._parse_options(options)
+        if opts is None or not pattern:
+            self.skipped += 1
+            return
+
+        pattern = pattern.lower()
+        side = "allow" if allow else "block"
+        self.rules += 1
+
+        # ||domain^ and ||domain (nothing after the host)
+        if pattern.startswith("||"):
+            host = pattern[2:].rstrip("^")
+            if host and all(c.isalnum() or c in ".-" for c in host):
+                self.tables[f"{side}_domains"].setdefault(host, []).append(opts)
+                return
+
+        rule = self._compile_pattern(pattern, opts)
+        if rule is None:
+            self.rules -= 1
+            self.skipped += 1
+            return
+        token = self._pick_token(pattern)
+        if token is None:
+            self.tables[f"{side}_generic"].append(rule)
+        else:
+            self.tables[f"{side}_tokens"].setdefault(token, []).append(rule)
+
+    def result(self) -> dict:
+        """The compiled tables as plain, immutable-by-convention tuples/dicts."""
+        t = self.tables
+        return {
+            "block_domains": {d: tuple(o) for d, o in t["block_domains"].items()},
+            "allow_domains": {d: tuple(o) for d, o in t["allow_domains"].items()},
+            "block_tokens": {k: tuple(v) for k, v in t["block_tokens"].items()},
+            "allow_tokens": {k: tuple(v) for k, v in t["allow_tokens"].items()},
+            "block_generic": tuple(t["block_generic"]),
+            "allow_generic": tuple(t["allow_generic"]),
+        }
+
+    def _parse_options(self, options: str):
+        type_bits, negated_bits, third_party = 0, 0, None
+        include, exclude = (), ()
+        for opt in filter(None, options.lower().split(",")):
+            negate = opt.startswith("~")
+            name = opt.lstrip("~")
+            if name in _FILTER_TYPE_BITS:
+                if negate:
+                    negated_bits |= _FILTER_TYPE_BITS[name]
+                else:
+                    type_bits |= _FILTER_TYPE_BITS[name]
+            elif name in ("third-party", "3p"):
+                third_party = not negate
+            elif name in ("first-party", "1p"):
+                third_party = negate
+            elif name.startswith("domain="):
+                domains = name[len("domain="):].split("|")
+                include = tuple(d for d in domains if d and not d.startswith("~"))
+                exclude = tuple(d[1:] for d in domains if d.startswith("~"))
+            elif name in ("match-case", "important"):
+                pass
+            else:
+                # _FILTER_UNSUPPORTED_OPTIONS, or something newer than this parser
+                return None
+        if not type_bits:
+            type_bits = _FILTER_ALL_TYPES
+        return (type_bits & ~negated_bits, third_party, include, exclude)
+
+    @staticmethod
+    def _compile_pattern(pattern: str, opts):
+        if len(pattern) > 2 and pattern.startswith("/") and pattern.endswith("/"):
+            source = pattern[1:-1]
+            try:
+                re.compile(source)
+            except re.error:
+                return None
+            return ("r", source, opts)
+
+        if not any(c in pattern for c in "*^|"):
+            return ("s", pattern, opts)
+
+        out = []
+        i = 0
+        if pattern.startswith("||"):
+            out.append(r"^[a-z][a-z0-9+.-]*://(?:[^/?#]*\.)?")
+            i = 2
+        elif pattern.startswith("|"):
+            out.append("^")
+            i = 1
+        end = len(pattern)
+        anchored_end = end > i and pattern.endswith("|")
+        if anchored_end:
+            end -= 1
+        for c in pattern[i:end]:
+            if c == "*":
+                out.append(".*")
+            elif c == "^":
+                out.append(r"(?:[^\w.%-]|$)")
+            else:
+                out.append(re.escape(c))
+        if anchored_end:
+            out.append("$")
+        return ("r", "".join(out), opts)
+
+    def _pick_token(self, pattern: str) -> str | None:
+        if pattern.startswith("/") and pattern.endswith("/") and len(pattern) > 2:
+            return None  # regex rules have no reliable literal token
+        best = None
+        for m in self._TOKEN_RE.finditer(pattern):
+            start, end = m.span()
+            before = pattern[start - 1] if start > 0 else None
+            after = pattern[end] if end < len(pattern) else None
+            # The run must be a whole URL token: bounded by a separator or an anchor,
+            # never by a wildcard or the unanchored pattern start/end.
+            if before is None or before == "*" or after is None or after == "*":
+                continue
+            token = m.group()
+            if best is None or self._token_counts.get(token, 0) < self._token_counts.get(best, 0):
+                best = token
+        if best is not None:
+            self._token_counts[best] = self._token_counts.get(best, 0) + 1
+        return best
+
+
+class ContentBlocker(QWebEngineUrlRequestInterceptor):
+    """Block subresource requests matching the filter lists in ``flow-filters/*.txt``.
+
+    Lists are compiled by FilterListCompiler on a background thread, or loaded
+    from a marshal cache keyed by the lists' names, sizes and mtimes (marshal only
+    rebuilds plain values, so a tampered cache can't run code). The compiled
+    tables are never modified after they are built; a new set is swapped in with
+    one attribute assignment, so ``interceptRequest`` reads them without a lock.
+    Main-frame navigations are never blocked.
+    """
+
+    CACHE_NAME = ".compiled.marshal"
+
+    def __init__(self, directory: Path, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.enabled = True
+        self.blocked = 0
+        self._tables = None
+        self._regex: dict[str, re.Pattern] = {}
+        self.reload()
+
+    def reload(self) -> None:
+        """(Re)load the lists in the background; the current tables stay active meanwhile."""
+        threading.Thread(target=self._load, name="flow-filter-compile", daemon=True).start()
+
+    def _list_files(self) -> list[Path]:
+        try:
+            return sorted(p for p in self.directory.glob("*.txt") if p.is_file())
+        except OSError:
+            return []
+
+    def _load(self) -> None:
+        files = self._list_files()
+        if not files:
+            self._tables = None
+            return
+        key = [FilterListCompiler.FORMAT_VERSION]
+        for p in files:
+            st = p.stat()
+            key.append((p.name, st.st_size, st.st_mtime_ns))
+
+        cache = self.directory / self.CACHE_NAME
+        try:
+            with open(cache, "rb") as f:
+                cached_key, tables = marshal.load(f)
+            if cached_key == key and isinstance(tables, dict):
+                self._tables = tables
+                return
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+        started = time.perf_counter()
+        compiler = FilterListCompiler()
+        for p in files:
+            try:
+                compiler.add_file(p)
+            except OSError as e:
+                print(f"Error reading filter list {p}: {e}")
+        tables = compiler.result()
+        self._tables = tables
+        print(
+            f"Content blocker: compiled {compiler.rules} rules from {len(files)} list(s) "
+            f"in {time.perf_counter() - started:.2f}s ({compiler.skipped} skipped)"
+        )
+
+        tmp = cache.with_name(cache.name + ".tmp")
+        try:
+            with open(tmp, "wb") as f:
+                marshal.dump((key, tables), f)
+            os.replace(tmp, cache)
+        except OSError as e:
+            print(f"Error caching compiled filters: {e}")
+
+    def interceptRequest(self, info) -> None:
+        tables = self._tables
+        if tables is None or not self.enabled:
+            return
+        resource_type = info.resourceType()
+        if resource_type == QWebEngineUrlRequestInfo.ResourceType.ResourceTypeMainFrame:
+            return
+        url = info.requestUrl()
+        if url.scheme() not in ("http", "https", "ws", "wss"):
+            return
+        first_party = info.firstPartyUrl().host().lower()
+        type_bit = _RESOURCE_TYPE_BITS.get(resource_type.name, _FILTER_TYPE_BITS["other"])
+        if self.should_block(tables, url.toString().lower(), url.host().lower(), first_party, type_bit):
+            self.blocked += 1
+            info.block(True)
+
+    def should_block(self, tables: dict, url: str, host: str, first_party: str, type_bit: int) -> bool:
+        third_party = bool(first_party) and _registrable_domain(host) != _registrable_domain(first_party)
+        ctx = (url, first_party, third_party, type_bit)
+        tokens = None
+        if not self._match_domains(tables["block_domains"], host, ctx):
+            tokens = set(FilterListCompiler._TOKEN_RE.findall(url))
+            if not self._match_rules(tables["block_tokens"], tables["block_generic"], tokens, ctx):
+                return False
+        if self._match_domains(tables["allow_domains"], host, ctx):
+            return False
+        if tokens is None:
+            tokens = set(FilterListCompiler._TOKEN_RE.findall(url))
+        return not self._match_rules(tables["allow_tokens"], tables["allow_generic"], tokens, ctx)
+
+    def _match_domains(self, domains: dict, host: str, ctx) -> bool:
+        if not domains:
+            return False
+        for suffix in _host_suffixes(host):
+            opts_list = domains.get(suffix)
+            if opts_list is not None and any(self._options_match(opts, ctx) for opts in opts_list):
+                return True
+        return False
+
+    def _match_rules(self, by_token: dict, generic: tuple, tokens: set, ctx) -> bool:
+        url = ctx[0]
+        for token in tokens:
+            rules = by_token.get(token)
+            if rules is not None:
+                for rule in rules:
+                    if self._rule_matches(rule, url, ctx):
+                        return True
+        for rule in generic:
+            if self._rule_matches(rule, url, ctx):
+                return True
+        return False
+
+    def _rule_matches(self, rule, url: str, ctx) -> bool:
+        kind, pattern, opts = rule
+        if not self._options_match(opts, ctx):
+            return False
+        if kind == "s":
+            return pattern in url
+        regex = self._regex.get(pattern)
+        if regex is None:
+            regex = self._regex[pattern] = re.compile(pattern)
+        return regex.search(url) is not None
+
+    @staticmethod
+    def _options_match(opts, ctx) -> bool:
+        type_bits, third_party, include, exclude = opts
+        _url, first_party, is_third_party, type_bit = ctx
+        if not type_bits & type_bit:
+            return False
+        if third_party is not None and third_party != is_third_party:
+            return False
+        if include or exclude:
+            suffixes = set(_host_suffixes(first_party)) if first_party else set()
+            if include and suffixes.isdisjoint(include):
+                return False
+            if exclude and not suffixes.isdisjoint(exclude):
+                return False
+        return True
+
+
+_GAMES_SCHEME = b"flow-games"
+
+def _register_url_schemes() -> None:
+    """Register flow-games:// (must run before the QApplication is created)."""
+    scheme = QWebEngineUrlScheme(_GAMES_SCHEME)
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Host)
+    flags = QWebEngineUrlScheme.Flag.SecureScheme | QWebEngineUrlScheme.Flag.CorsEnabled
+    if hasattr(QWebEngineUrlScheme.Flag, "FetchApiAllowed"):  # Qt 6.6+
+        flags |= QWebEngineUrlScheme.Flag.FetchApiAllowed
+    scheme.setFlags(flags)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+class OfflineGameIndex:
+    """The games in flow-offlinegames and their entry pages, cached in a manifest.
+
+    Each immediate subfolder is a game. Its entry page (the shallowest
+    ``index.html``, else the first ``*.html``) is found by a breadth-first scan
+    and stored with the folder's mtime in MANIFEST_NAME. ``games()`` only stats
+    the games folder and each game folder, and rescans a game only when its mtime
+    changed or its entry page is gone. Every game gets a host-safe slug:
+    ``flow-games://<slug>/`` (see OfflineGamesSchemeHandler).
+    """
+
+    MANIFEST_NAME = ".flow-games.json"
+
+    _SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._games: list[dict] | None = None
+        self._by_slug: dict[str, dict] = {}
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.root / self.MANIFEST_NAME, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self, games: list[dict]) -> None:
+        try:
+            with open(self.root / self.MANIFEST_NAME, "w", encoding="utf-8") as f:
+                json.dump({g["name"]: {"mtime": g["mtime"], "entry": g["entry"]} for g in games}, f, indent=2)
+        except OSError as e:
+            print(f"Error saving games manifest: {e}")
+
+    @staticmethod
+    def _find_entry(game_dir: Path) -> str | None:
+        fallback = None
+        level = [game_dir]
+        while level:
+            next_level = []
+            for directory in level:
+                try:
+                    entries = sorted(os.scandir(directory), key=lambda e: e.name.lower())
+                except OSError:
+                    continue
+                for entry in entries:
+                    # Like rglob, don't descend into directory symlinks (a loop would never end).
+                    if entry.is_dir(follow_symlinks=False):
+                        next_level.append(Path(entry.path))
+                    elif entry.name.lower() == "index.html":
+                        return Path(entry.path).relative_to(game_dir).as_posix()
+                    elif fallback is None and entry.name.lower().endswith(".html"):
+                        fallback = Path(entry.path).relative_to(game_dir).as_posix()
+            level = next_level
+        return fallback
+
+    def games(self) -> list[dict]:
+        """``[{"name", "slug", "path", "entry", "mtime"}, ...]`` sorted by name (refreshed if changed)."""
+        try:
+            dirs = sorted((e for e in os.scandir(self.root) if e.is_dir()), key=lambda e: e.name.lower())
+        except OSError:
+            dirs = []
+        cached = {g["name"]: g for g in self._games or ()}
+        manifest = None
+        games, changed = [], self._games is None
+        for d in dirs:
+            mtime = d.stat().st_mtime
+            known = cached.get(d.name)
+            if known is None:
+                changed = True
+                if manifest is None:
+                    manifest = self._load_manifest()
+                known = manifest.get(d.name)
+            entry = known.get("entry") if known and known.get("mtime") == mtime else None
+            if entry is None or not (Path(d.path) / entry).is_file():
+                entry = self._find_entry(Path(d.path))
+                changed = True
+            games.append({"name": d.name, "path": Path(d.path), "entry": entry, "mtime": mtime})
+        changed = changed or len(games) != len(cached)  # a game was removed
+
+        if changed:
+            used: set[str] = set()
+            for g in games:
+                slug = self._SLUG_RE.sub("-", g["name"].lower()).strip("-") or "game"
+                candidate, n = slug, 1
+                while candidate in used:
+                    n += 1
+                    candidate = f"{slug}-{n}"
+                used.add(candidate)
+                g["slug"] = candidate
+            self._games = games
+            self._by_slug = {g["slug"]: g for g in games}
+            self._save_manifest(games)
+        return self._games
+
+    def game_for_slug(self, slug: str) -> dict | None:
+        if self._games is None:
+            self.games()
+        return self._by_slug.get(slug)
+
+    @staticmethod
+    def entry_url(game: dict) -> QUrl:
+        url = QUrl()
+        url.setScheme(_GAMES_SCHEME.decode())
+        url.setHost(game["slug"])
+        url.setPath("/" + (game["entry"] or ""))
+        return url
+
+
+class OfflineGamesSchemeHandler(QWebEngineUrlSchemeHandler):
+    """Serves ``flow-games://<slug>/<path>`` from the game's folder.
+
+    Files are streamed from a QFile owned by the request job, with the MIME type
+    from the file name (WASM and JS types are fixed up). If ``<file>.br`` or
+    ``<file>.gz`` exists next to a requested file, it is served instead with a
+    matching ``Content-Encoding``; a directly requested ``.gz``/``.br`` file
+    (Unity's ``Build/*.wasm.gz``) is served the same way. Responses carry
+    COOP/COEP headers so threaded WASM builds get SharedArrayBuffer. Custom
+    headers need Qt 6.6+; older Qt gets gzip inflated in memory instead.
+    """
+
+    _MIME_OVERRIDES = {
+        ".wasm": "application/wasm",
+        ".js": "text/javascript",
+        ".mjs": "text/javascript",
+        ".json": "application/json",
+        ".data": "application/octet-stream",
+        ".unityweb": "application/octet-stream",
+    }
+    _ENCODINGS = ((".br", b"br"), (".gz", b"gzip"))
+    _ISOLATION_HEADERS = {
+        b"Cross-Origin-Opener-Policy": b"same-origin",
+        b"Cross-Origin-Embedder-Policy": b"credentialless",
+    }
+
+    def __init__(self, index: OfflineGameIndex, parent=None):
+        super().__init__(parent)
+        self.index = index
+
+    @classmethod
+    def mime_type(cls, name: str) -> str:
+        suffix = Path(name).suffix.lower()
+        if suffix in cls._MIME_OVERRIDES:
+            return cls._MIME_OVERRIDES[suffix]
+        return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    def _resolve(self, url: QUrl) -> Path | None:
+        game = self.index.game_for_slug(url.host())
+        if game is None:
+            return None
+        root = game["path"].resolve()
+        rel = url.path().lstrip("/")
+        path = (root / rel).resolve() if rel else root
+        if not path.is_relative_to(root):
+            return None
+        if path.is_dir():
+            path = path / "index.html"
+        return path
+
+    def requestStarted(self, job):
+        path = self._resolve(job.requestUrl())
+        if path is None:
+            job.fail(QWebEngineUrlRequestJob.Error.UrlNotFound)
+            return
+
+        can_set_headers = hasattr(job, "setAdditionalResponseHeaders")
+        name, encoding = path.name, None
+        for suffix, coding in self._ENCODINGS:
+            if name.lower().endswith(suffix) and path.is_file():
+                name, encoding = name[: -len(suffix)], coding  # e.g. game.wasm.gz
+                break
+            sibling = path.with_name(path.name + suffix)
+            if can_set_headers and sibling.is_file():
+                path, encoding = sibling, coding
+                break
+        if not path.is_file():
+            job.fail(QWebEngineUrlRequestJob.Error.UrlNotFound)
+            return
+
+        content_type = self.mime_type(name).encode()
+        if not can_set_headers and encoding is not None:
+            if encoding != b"gzip":
+                job.fail(QWebEngineUrlRequestJob.Error.RequestFailed)
+                return
+            # No Content-Encoding before Qt 6.6: hand Chromium the inflated bytes.
+            with gzip.open(path, "rb") as f:
+                buffer = QBuffer(job)
+                buffer.setData(f.read())
+            job.reply(content_type, buffer)
+            return
+
+        if can_set_headers:
+            headers = dict(self._ISOLATION_HEADERS)
+            if encoding is not None:
+                headers[b"Content-Encoding"] = encoding
+            job.setAdditionalResponseHeaders(headers)
+        f = QFile(str(path), job)
+        if not f.open(QIODevice.OpenModeFlag.ReadOnly):
+            job.fail(QWebEngineUrlRequestJob.Error.RequestFailed)
+            return
+        job.reply(content_type, f)
+
+
 class BrowserPage(QWebEnginePage):
     def __init__(self, main_window, parent=None, opener_page: QWebEnginePage | None = None):
         super().__init__(_get_persistent_profile(), parent)
         self._main_window = main_window
         self._opener_page = opener_page
+        self._pending_navigation = None  # redirect chain of the main-frame navigation in flight
+        self._forced_downloads: dict[str, bool] = {}  # url -> opened from a new-window request
+        self.loadFinished.connect(self._on_load_finished)
+
+    def _on_load_finished(self, ok: bool) -> None:
+        chain, self._pending_navigation = self._pending_navigation, None
+        if ok and chain:
+            for url in chain:
+                self._main_window.download_decisions.learn(url, DownloadDecisionCache.PAGE)
+
+    def navigation_became_download(self, download_url: QUrl) -> None:
+        """Called for a download started from this page; learns it if it ended our navigation."""
+        chain = self._pending_navigation
+        # Downloads that didn't come out of the pending navigation (e.g. <a download>
+        # clicked while the page loads) must not be mistaken for it.
+        if not chain or download_url.adjusted(QUrl.UrlFormattingOption.RemoveFragment) not in [
+            u.adjusted(QUrl.UrlFormattingOption.RemoveFragment) for u in chain
+        ]:
+            return
+        self._pending_navigation = None
+        for url in chain:
+            self._main_window.download_decisions.learn(url, DownloadDecisionCache.DOWNLOAD)
+
+    def force_download(self, url: QUrl, new_tab: bool = False) -> None:
+        """Download ``url``, which the decision cache expects to download, without navigating.
+
+        If it turns out to be a page after all (see ``forced_download_was_page``) it is
+        opened here, or in a new tab when ``new_tab`` is set.
+        """
+        self._forced_downloads[url.adjusted(QUrl.UrlFormattingOption.RemoveFragment).toString()] = new_tab
+        # Pass empty filename so the server's Content-Disposition / suggested name wins.
+        self.download(url, "")
+
+    def forced_download_was_page(self, request: QWebEngineDownloadRequest) -> bool:
+        """True (and the URL learned as a page and opened) if a forced download got HTML back."""
+        url = request.url()
+        new_tab = self._forced_downloads.pop(url.adjusted(QUrl.UrlFormattingOption.RemoveFragment).toString(), None)
+        if new_tab is None or request.mimeType().split(";")[0].strip().lower() != "text/html":
+            return False
+        self._main_window.download_decisions.learn(url, DownloadDecisionCache.PAGE)
+        if new_tab:
+            self._main_window.add_new_tab(url.toString(), opener_page=self)
+        else:
+            self.load(url)
+        return True
 
     def acceptNavigationRequest(self, url, nav_type, isMainFrame):
         try:
@@ -59,54 +1857,2490 @@ class BrowserPage(QWebEnginePage):
                 self._main_window._download_blob_from_page(fetch_page, url.toString())
                 return False
 
-            # Many "download buttons" use JS like window.location=... or redirects,
-            # which show up as NavigationTypeOther/Redirect rather than LinkClicked.
-            # If the main-frame navigation looks like a file download, force it.
-            if isMainFrame and self._main_window._looks_like_download_url(url):
-                # Force a download (uses Chromium network stack + cookies).
-                # Pass empty filename so the server's Content-Disposition / suggested name wins.
-                self.download(url, "")
-                return False
+            # A URL already known to download (by URL or by pattern) skips the
+            # navigation. Anything else navigates, and Chromium decides from the
+            # response headers; the outcome is learned for next time.
+            if isMainFrame and url.scheme() in ("http", "https"):
+                if self._main_window.download_decisions.decide(url) == DownloadDecisionCache.DOWNLOAD:
+                    self.force_download(url)
+                    return False
+                if nav_type == QWebEnginePage.NavigationType.NavigationTypeRedirect and self._pending_navigation:
+                    self._pending_navigation.append(url)
+                else:
+                    self._pending_navigation = [url]
+
+            # Clicks and typed URLs are matched against recent preconnect hints.
+            if isMainFrame and nav_type in (
+                QWebEnginePage.NavigationType.NavigationTypeLinkClicked,
+                QWebEnginePage.NavigationType.NavigationTypeTyped,
+            ):
+                self._main_window.preconnect.navigation_started(self, url)
         except Exception as e:
             print(f"acceptNavigationRequest error: {e}")
 
         return super().acceptNavigationRequest(url, nav_type, isMainFrame)
 
 
-class JsBridge(QObject):
+# Blob downloads are streamed from the page in chunks of this many raw bytes.
+_BLOB_CHUNK_SIZE = 1024 * 1024
+# A page waits while more than this many base64 chars are queued for the writer.
+_BLOB_HIGH_WATER = 8 * 1024 * 1024
+
+# Defines window.__flowStreamBlob(bridge, blob, filename), shared by the blob scripts.
+# The blob is read slice by slice and every chunk waits for Python's ack, so at most
+# one chunk is in flight and only a few are queued on the Python side.
+_BLOB_STREAM_JS = r"""
+if (!window.__flowStreamBlob) {
+  window.__flowStreamBlob = function(bridge, blob, filename) {
+    const CHUNK = %CHUNK_SIZE%;
+    const HIGH_WATER = %HIGH_WATER%;
+
+    function call(name, ...args) {
+      return new Promise(function(resolve) { bridge[name](...args, resolve); });
+    }
+
+    function sleep(ms) {
+      return new Promise(function(resolve) { setTimeout(resolve, ms); });
+    }
+
+    function readChunk(start) {
+      return new Promise(function(resolve, reject) {
+        const reader = new FileReader();
+        reader.onload = function() {
+          const s = reader.result;
+          resolve(s.substring(s.indexOf(',') + 1));
+        };
+        reader.onerror = function() { reject(new Error('FileReader failed')); };
+        reader.readAsDataURL(blob.slice(start, start + CHUNK));
+      });
+    }
+
+    (async function() {
+      const id = await call('blobBegin', window.__flowPageId || 0, filename, blob.size, blob.type || '');
+      if (!id) return;
+      try {
+        for (let start = 0; start < blob.size; start += CHUNK) {
+          let pending = await call('blobChunk', id, await readChunk(start));
+          while (pending > HIGH_WATER) {
+            await sleep(50);
+            pending = await call('blobPending', id);
+          }
+          if (pending < 0) return;  // cancelled or failed on the Python side
+        }
+        bridge.blobEnd(id);
+      } catch (err) {
+        bridge.blobAbort(id, String(err));
+      }
+    })();
+  };
+}
+""".replace("%CHUNK_SIZE%", str(_BLOB_CHUNK_SIZE)).replace("%HIGH_WATER%", str(_BLOB_HIGH_WATER))
+
+# Flow's own page scripts run in the application world: they share the DOM with the
+# page but not its JavaScript globals, so pages can neither see nor call the bridge.
+_SCRIPT_WORLD = QWebEngineScript.ScriptWorldId.ApplicationWorld
+
+# Defines window.__flowWithBridge(callback), which calls back with the flowBridge
+# object once the WebChannel is connected (queued until then).
+_BRIDGE_JS = r"""
+if (!window.__flowWithBridge) {
+  (function() {
+    let bridge = null;
+    const waiting = [];
+    window.__flowWithBridge = function(callback) {
+      if (bridge) callback(bridge); else waiting.push(callback);
+    };
+    if (typeof QWebChannel === 'undefined' || !window.qt || !qt.webChannelTransport) {
+      console.log('Flow: WebChannel transport not available');
+      return;
+    }
+    new QWebChannel(qt.webChannelTransport, function(channel) {
+      bridge = channel.objects.flowBridge;
+      waiting.splice(0).forEach(function(callback) { callback(bridge); });
+    });
+  })();
+}
+"""
+
+# Captures clicks on <a href="blob:..." download="..."> and streams the blob to Python.
+# Registered at document creation, so it is in place before the page can be clicked.
+_BLOB_HOOK_JS = r"""
+document.addEventListener('click', function(e) {
+  try {
+    const a = e.target && e.target.closest ? e.target.closest('a') : null;
+    if (!a) return;
+    const href = a.getAttribute('href') || '';
+    if (!href.startsWith('blob:')) return;
+
+    // Prevent the browser's internal handling (which often no-ops in Qt).
+    e.preventDefault();
+    e.stopPropagation();
+
+    const filename = a.getAttribute('download') || a.getAttribute('data-filename') || 'download';
+    window.__flowWithBridge(function(bridge) {
+      fetch(href).then(r => r.blob()).then(blob => {
+        window.__flowStreamBlob(bridge, blob, filename);
+      }).catch(err => {
+        bridge.saveBlobError(window.__flowPageId || 0, String(err));
+      });
+    });
+  } catch (err) {
+    window.__flowWithBridge(function(bridge) { bridge.saveBlobError(window.__flowPageId || 0, String(err)); });
+  }
+}, true);
+"""
+
+
+def _qwebchannel_js() -> str:
+    """Source of qwebchannel.js from the QtWebChannel resources ('' if unavailable)."""
+    f = QFile(":/qtwebchannel/qwebchannel.js")
+    if not f.open(QIODevice.OpenModeFlag.ReadOnly):
+        print("Could not read qwebchannel.js; blob downloads from pages are disabled")
+        return ""
+    try:
+        return bytes(f.readAll()).decode("utf-8")
+    finally:
+        f.close()
+
+
+def _install_profile_scripts(profile: QWebEngineProfile) -> None:
+    """Register the WebChannel bootstrap and blob hook once for every page of ``profile``."""
+    scripts = profile.scripts()
+    if scripts.find("flow-bridge"):
+        return
+    script = QWebEngineScript()
+    script.setName("flow-bridge")
+    script.setSourceCode(_qwebchannel_js() + _BLOB_STREAM_JS + _BRIDGE_JS + _BLOB_HOOK_JS)
+    script.setInjectionPoint(QWebEngineScript.InjectionPoint.DocumentCreation)
+    script.setWorldId(_SCRIPT_WORLD)
+    script.setRunsOnSubFrames(False)
+    scripts.insert(script)
+
+
+class BlobStreamWriter(QObject):
+    """Write blob downloads streamed from pages to disk on a background thread.
+
+    Pages send base64 chunks over the WebChannel (see _BLOB_STREAM_JS). Chunks are
+    queued here and decoded and written by the writer thread, so the UI thread never
+    holds more than the chunks in flight. The queued size is returned to the page,
+    which waits while it is above _BLOB_HIGH_WATER.
+    """
+
+    progress = pyqtSignal(str, int)  # transfer id, bytes written
+    finished = pyqtSignal(str, str)  # transfer id, error message ("" on success)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._lock = threading.Lock()
+        self._transfers: dict[str, dict] = {}
+        self._ids = itertools.count(1)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="flow-blob-writer", daemon=True)
+        self._thread.start()
+
+    def begin(self, path: Path) -> str:
+        # Opening the file here reserves the name before the page sends anything.
+        f = open(path, "wb")
+        transfer_id = f"blob-{next(self._ids)}"
+        with self._lock:
+            self._transfers[transfer_id] = {"file": f, "path": path, "pending": 0, "cancelled": False}
+        return transfer_id
+
+    def write(self, transfer_id: str, b64: str) -> int:
+        with self._lock:
+            t = self._transfers.get(transfer_id)
+            if t is None or t["cancelled"]:
+                return -1
+            t["pending"] += len(b64)
+            pending = t["pending"]
+        self._queue.put(("chunk", transfer_id, b64))
+        return pending
+
+    def pending(self, transfer_id: str) -> int:
+        with self._lock:
+            t = self._transfers.get(transfer_id)
+            if t is None or t["cancelled"]:
+                return -1
+            return t["pending"]
+
+    def end(self, transfer_id: str) -> None:
+        self._queue.put(("end", transfer_id, None))
+
+    def abort(self, transfer_id: str, message: str) -> None:
+        self._queue.put(("abort", transfer_id, message))
+
+    def cancel(self, transfer_id: str) -> None:
+        with self._lock:
+            t = self._transfers.get(transfer_id)
+            if t is None:
+                return
+            t["cancelled"] = True
+        self._queue.put(("abort", transfer_id, "Cancelled"))
+
+    def _run(self) -> None:
+        written: dict[str, int] = {}
+        while True:
+            op, transfer_id, arg = self._queue.get()
+            with self._lock:
+                t = self._transfers.get(transfer_id)
+            if t is None:
+                continue
+
+            if op == "chunk":
+                try:
+                    if not t["cancelled"]:
+                        data = base64.b64decode(arg)
+                        t["file"].write(data)
+                        written[transfer_id] = written.get(transfer_id, 0) + len(data)
+                        self.progress.emit(transfer_id, written[transfer_id])
+                except (binascii.Error, OSError) as e:
+                    self._close(transfer_id, t, f"Write failed: {e}")
+                    written.pop(transfer_id, None)
+                    continue
+                with self._lock:
+                    t["pending"] -= len(arg)
+            elif op == "end":
+                self._close(transfer_id, t, "")
+                written.pop(transfer_id, None)
+            elif op == "abort":
+                self._close(transfer_id, t, arg or "Aborted")
+                written.pop(transfer_id, None)
+
+    def _close(self, transfer_id: str, t: dict, error: str) -> None:
+        with self._lock:
+            self._transfers.pop(transfer_id, None)
+        try:
+            t["file"].close()
+            if error:
+                Path(t["path"]).unlink(missing_ok=True)
+        except OSError as e:
+            print(f"Blob writer cleanup failed: {e}")
+        self.finished.emit(transfer_id, error)
+
+
+def _cookie_header(cookies: list[dict], url: str) -> str:
+    """The ``Cookie`` header value for ``url`` out of its host's ``cookies`` ("" if none apply)."""
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path or "/"
+    now = time.time()
+    pairs = []
+    for c in cookies:
+        if c.get("secure") and parts.scheme != "https":
+            continue
+        if not path.startswith(c.get("path") or "/"):
+            continue
+        expires_at = c.get("expiresAt")
+        if expires_at is not None and expires_at <= now:
+            continue
+        pairs.append(f"{c['name']}={c['value']}")
+    return "; ".join(pairs)
+
+
+class _CookieRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follow redirects without carrying a ``Cookie`` header to where it doesn't belong.
+
+    urllib copies the original request's headers onto the redirected one, so the
+    cookies of the first host would be sent to any host (or over plain http) a
+    redirect names. The header is dropped on every redirect and, if
+    ``cookies_for`` (url -> header value) is given, recomputed for the new URL.
+    """
+
+    def __init__(self, cookies_for=None):
+        super().__init__()
+        self._cookies_for = cookies_for
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        new = super().redirect_request(req, fp, code, msg, headers, newurl)
+        if new is not None:
+            new.remove_header("Cookie")
+            cookie = self._cookies_for(new.full_url) if self._cookies_for else ""
+            if cookie:
+                new.add_header("Cookie", cookie)
+        return new
+
+
+def _direct_opener(proxy_url: str | None = None, cookies_for=None):
+    """A urllib opener for the direct (non-Chromium) fetchers: proxy and redirect-safe cookies."""
+    return urllib.request.build_opener(
+        urllib.request.ProxyHandler({"http": proxy_url, "https": proxy_url} if proxy_url else {}),
+        _CookieRedirectHandler(cookies_for),
+    )
+
+
+class SegmentedDownloader(QObject):
+    """Download large files over several parallel HTTP Range requests.
+
+    ``start()`` probes the URL with ``Range: bytes=0-0``. A 206 answer gives the
+    size and the validator (ETag or Last-Modified), the file is preallocated and
+    split into segments that a shared worker pool fetches concurrently, each
+    writing at its own offset (``If-Range`` makes a changed file fail instead of
+    mixing versions). A server without range support gets the probe's own 200
+    response streamed into the file, so there is no second request. Failed
+    segments are retried from where they stopped. Workers wait on ``limiter`` (a
+    BandwidthLimiter, if given) after every chunk.
+    """
+
+    MAX_WORKERS = 16
+    MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+    CHUNK_SIZE = 256 * 1024
+    RETRIES = 3
+    TIMEOUT_SECS = 30
+    PROGRESS_INTERVAL_SECS = 0.1
+
+    progress = pyqtSignal(str, object)  # job id, bytes received
+    finished = pyqtSignal(str, str)  # job id, error message ("" on success)
+
+    _CONTENT_RANGE_RE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+    def __init__(self, limiter: "BandwidthLimiter | None" = None, parent=None):
+        super().__init__(parent)
+        self.limiter = limiter
+        self._jobs: dict[str, dict] = {}
+        self._ids = itertools.count(1)
+        self._pool = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix="flow-segment")
+
+    def start(self, url: str, path: Path, headers: dict, proxy_url: str | None = None,
+              segments: int = 4, state: dict | None = None, cookies_for=None) -> str:
+        """Start downloading ``url`` to ``path``; ``state`` (from ``state()``) resumes a job.
+
+        ``cookies_for`` (url -> ``Cookie`` header, callable from any thread) supplies
+        the cookies of redirect targets; without it redirects are followed cookieless.
+        """
+        job_id = f"seg-{next(self._ids)}"
+        job = {
+            "url": url,
+            "path": Path(path),
+            "headers": dict(headers),
+            "opener": _direct_opener(proxy_url, cookies_for),
+            "segments_wanted": max(1, segments),
+            "segments": [list(s) for s in state["segments"]] if state else [],  # [start, end, next offset]
+            "total": state.get("total", -1) if state else -1,
+            "validator": state.get("validator") if state else None,
+            "received": 0,
+            "lock": threading.Lock(),
+            "cancelled": threading.Event(),
+            "last_progress": 0.0,
+        }
+        job["received"] = sum(pos - start for start, _end, pos in job["segments"])
+        self._jobs[job_id] = job
+        threading.Thread(target=self._run, args=(job_id, job), name=f"flow-{job_id}", daemon=True).start()
+        return job_id
+
+    def cancel(self, job_id: str) -> None:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job["cancelled"].set()
+
+    def forget(self, job_id: str) -> None:
+        """Drop a job that has finished (or been cancelled) and won't be resumed."""
+        job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job["cancelled"].set()
+
+    def state(self, job_id: str) -> dict | None:
+        """What ``start(state=...)`` needs to continue the job: size, validator, segment offsets."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        with job["lock"]:
+            return {"total": job["total"], "validator": job["validator"], "segments": [list(s) for s in job["segments"]]}
+
+    # -- worker side --
+
+    def _request(self, job: dict, first: int, last: int | None = None, if_range: bool = True):
+        headers = dict(job["headers"])
+        headers["Accept-Encoding"] = "identity"  # byte ranges of the raw file, not of a compressed body
+        headers["Range"] = f"bytes={first}-" if last is None else f"bytes={first}-{last}"
+        if if_range and job["validator"]:
+            headers["If-Range"] = job["validator"]
+        req = urllib.request.Request(job["url"], headers=headers)
+        return job["opener"].open(req, timeout=self.TIMEOUT_SECS)
+
+    def _run(self, job_id: str, job: dict) -> None:
+        error = ""
+        try:
+            if not job["segments"]:
+                self._probe(job_id, job)
+            if job["segments"] and not job["cancelled"].is_set():
+                futures = [
+                    self._pool.submit(self._fetch_segment, job_id, job, segment)
+                    for segment in job["segments"]
+                    if segment[2] <= segment[1]
+                ]
+                for future in futures:
+                    future.result()
+            if job["cancelled"].is_set():
+                error = "Cancelled"
+            elif job["total"] >= 0 and job["received"] != job["total"]:
+                error = f"Incomplete: {job['received']} of {job['total']} bytes"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            job["cancelled"].set()  # stop sibling segments
+        self.progress.emit(job_id, job["received"])
+        self.finished.emit(job_id, error)
+
+    def _probe(self, job_id: str, job: dict) -> None:
+        with self._request(job, 0, 0, if_range=False) as resp:
+            job["validator"] = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+            m = self._CONTENT_RANGE_RE.match(resp.headers.get("Content-Range", ""))
+            if resp.status == 206 and m and m.group(3) != "*":
+                job["total"] = int(m.group(3))
+            else:
+                # No range support: this response is the whole file.
+                length = resp.headers.get("Content-Length")
+                job["total"] = int(length) if length and length.isdigit() else -1
+                with open(job["path"], "wb") as f:
+                    self._copy(job_id, job, resp, f, None)
+                return
+
+        total = job["total"]
+        with open(job["path"], "wb") as f:
+            f.truncate(total)
+            if hasattr(os, "posix_fallocate") and total > 0:
+                try:
+                    os.posix_fallocate(f.fileno(), 0, total)
+                except OSError:
+                    pass  # sparse file it is
+        count = max(1, min(job["segments_wanted"], total // self.MIN_SEGMENT_SIZE or 1))
+        size = -(-total // count)
+        with job["lock"]:
+            job["segments"] = [[start, min(start + size, total) - 1, start] for start in range(0, total, size)]
+
+    def _fetch_segment(self, job_id: str, job: dict, segment: list) -> None:
+        attempts = 0
+        while segment[2] <= segment[1] and not job["cancelled"].is_set():
+            try:
+                with self._request(job, segment[2], segment[1]) as resp:
+                    if resp.status != 206:
+                        raise RuntimeError("File changed on the server (range request refused)")
+                    # Without a validator (a resumed browser download) the size is the only check.
+                    m = self._CONTENT_RANGE_RE.match(resp.headers.get("Content-Range", ""))
+                    if m and m.group(3) != "*" and job["total"] >= 0 and int(m.group(3)) != job["total"]:
+                        raise RuntimeError("File changed on the server (size differs)")
+                    with open(job["path"], "r+b") as f:
+                        f.seek(segment[2])
+                        self._copy(job_id, job, resp, f, segment)
+                if segment[2] <= segment[1] and not job["cancelled"].is_set():
+                    raise ConnectionError("Connection closed before the end of the segment")
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                attempts += 1
+                if attempts > self.RETRIES or job["cancelled"].is_set():
+                    raise
+                time.sleep(min(2 ** attempts, 10))
+
+    def _copy(self, job_id: str, job: dict, resp, f, segment: list | None) -> None:
+        while not job["cancelled"].is_set():
+            want = self.CHUNK_SIZE if segment is None else min(self.CHUNK_SIZE, segment[1] - segment[2] + 1)
+            if want <= 0:
+                break
+            data = resp.read(want)
+            if not data:
+                break
+            f.write(data)
+            with job["lock"]:
+                if segment is not None:
+                    segment[2] += len(data)
+                job["received"] += len(data)
+                received = job["received"]
+                now = time.monotonic()
+                emit = now - job["last_progress"] >= self.PROGRESS_INTERVAL_SECS
+                if emit:
+                    job["last_progress"] = now
+            if emit:
+                self.progress.emit(job_id, received)
+            if self.limiter is not None:
+                self.limiter.take(len(data), job["cancelled"])
+
+
+# Serializes a copy of the DOM for PageAssetSaver. Every http(s) subresource
+# reference becomes a %%FLOW_ASSET_<n>%% placeholder indexing the returned urls.
+_SAVE_PAGE_JS = r"""
+(function() {
+  const urls = [];
+  const index = new Map();
+  function token(raw) {
+    if (!raw) return raw;
+    let abs;
+    try { abs = new URL(raw.trim(), document.baseURI); } catch (e) { return raw; }
+    if (abs.protocol !== 'http:' && abs.protocol !== 'https:') return raw;
+    abs.hash = '';
+    let i = index.get(abs.href);
+    if (i === undefined) { i = urls.length; urls.push(abs.href); index.set(abs.href, i); }
+    return '%%FLOW_ASSET_' + i + '%%';
+  }
+  function cssUrls(text) {
+    return text.replace(/url\(\s*(['"]?)([^'")]+)\1\s*\)/g, (m, q, u) => 'url(' + q + token(u) + q + ')');
+  }
+
+  const root = document.documentElement.cloneNode(true);
+  const attrs = [
+    ['img', 'src'], ['script', 'src'], ['link[rel~="stylesheet" i]', 'href'], ['link[rel~="icon" i]', 'href'],
+    ['source', 'src'], ['video', 'src'], ['video', 'poster'], ['audio', 'src'], ['track', 'src'],
+    ['embed', 'src'], ['input[type="image" i]', 'src'],
+  ];
+  for (const [sel, attr] of attrs) {
+    for (const el of root.querySelectorAll(sel + '[' + attr + ']')) {
+      el.setAttribute(attr, token(el.getAttribute(attr)));
+      // Local copies would fail integrity/CORS checks on file:// pages.
+      el.removeAttribute('integrity');
+      el.removeAttribute('crossorigin');
+    }
+  }
+  for (const el of root.querySelectorAll('img[srcset], source[srcset]')) {
+    el.setAttribute('srcset', el.getAttribute('srcset').split(',').map(part => {
+      const bits = part.trim().split(/\s+/);
+      bits[0] = token(bits[0]);
+      return bits.join(' ');
+    }).join(', '));
+  }
+  for (const el of root.querySelectorAll('style')) el.textContent = cssUrls(el.textContent);
+  for (const el of root.querySelectorAll('[style]')) el.setAttribute('style', cssUrls(el.getAttribute('style')));
+  // Links keep pointing at the live site; a <base> would redirect the local paths.
+  for (const el of root.querySelectorAll('base')) el.remove();
+  for (const a of root.querySelectorAll('a[href]')) {
+    try { a.setAttribute('href', new URL(a.getAttribute('href'), document.baseURI).href); } catch (e) {}
+  }
+
+  const doctype = document.doctype ? '<!DOCTYPE ' + document.doctype.name + '>\n' : '';
+  return {html: doctype + root.outerHTML, urls: urls};
+})();
+"""
+
+
+class PageAssetSaver(QObject):
+    """Save a page together with its images, stylesheets, scripts and media.
+
+    ``start()`` takes the DOM serialized by _SAVE_PAGE_JS. The HTML is written
+    first, with each placeholder pointing into ``<name>_files/``. Then a bounded
+    worker pool fetches the assets and streams each one to disk in chunks.
+    Stylesheets are read whole so their ``url()`` and ``@import`` references
+    (up to CSS_DEPTH levels) can be fetched the same way and rewritten. An asset
+    that fails is counted and skipped.
+    """
+
+    MAX_WORKERS = 8
+    CHUNK_SIZE = 256 * 1024
+    TIMEOUT_SECS = 30
+    CSS_DEPTH = 3
+    MAX_CSS_SIZE = 8 * 1024 * 1024
+    MAX_NAME_LEN = 80
+
+    progress = pyqtSignal(str, int, int)  # save id, files done, files total
+    finished = pyqtSignal(str, int)  # save id, failed files
+
+    _ASSET_TOKEN_RE = re.compile(r"%%FLOW_ASSET_(\d+)%%")
+    _CSS_REF_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)|@import\s+(['"])([^'"]+)\3""")
+    _UNSAFE_NAME_RE = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._ids = itertools.count(1)
+        self._pool = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix="flow-save-page")
+
+    def start(self, html_path: Path, html: str, urls: list[str], headers: dict[str, dict],
+              default_headers: dict, proxy_url: str | None = None, cookies_for=None) -> str:
+        """Save ``html`` to ``html_path`` and fetch ``urls`` (``headers`` by URL, else ``default_headers``).
+
+        ``cookies_for`` (url -> ``Cookie`` header, callable from any thread) gives the
+        cookies of redirect targets and of files referenced from stylesheets.
+        """
+        html_path = Path(html_path)
+        save_id = f"page-{next(self._ids)}"
+        job = {
+            "dir": html_path.with_name(html_path.stem + "_files"),
+            "opener": _direct_opener(proxy_url, cookies_for),
+            "headers": dict(headers),
+            "default_headers": default_headers,
+            "cookies_for": cookies_for,
+            "names": {},  # url -> local file name
+            "used": set(),
+            "lock": threading.Lock(),
+            # Counted up front: a task finishing while the rest are being submitted
+            # must not see done == total.
+            "total": 1 + len(urls),
+            "done": 0,
+            "failed": 0,
+        }
+        names = [self._local_name(job, url)[0] for url in urls]
+        prefix = urllib.parse.quote(job["dir"].name) + "/"
+        html = self._ASSET_TOKEN_RE.sub(lambda m: prefix + urllib.parse.quote(names[int(m.group(1))]), html)
+
+        self._pool.submit(self._task, save_id, job, self._write_html, html_path, html)
+        for url, name in zip(urls, names):
+            self._pool.submit(self._task, save_id, job, self._fetch, url, name, 0)
+        return save_id
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _local_name(self, job: dict, url: str) -> tuple[str, bool]:
+        """The file name ``url`` is saved under, and whether it was just assigned."""
+        with job["lock"]:
+            name = job["names"].get(url)
+            if name is not None:
+                return name, False
+            base = urllib.parse.unquote(urllib.parse.urlsplit(url).path.rsplit("/", 1)[-1])
+            base = self._UNSAFE_NAME_RE.sub("_", base).strip(" .") or "asset"
+            stem, suffix = os.path.splitext(base)
+            stem, suffix = stem[: self.MAX_NAME_LEN], suffix[:16]
+            name, n = stem + suffix, 1
+            while name.lower() in job["used"]:
+                n += 1
+                name = f"{stem}-{n}{suffix}"
+            job["used"].add(name.lower())
+            job["names"][url] = name
+            return name, True
+
+    def _submit(self, save_id: str, job: dict, fn, *args) -> None:
+        with job["lock"]:
+            job["total"] += 1
+        self._pool.submit(self._task, save_id, job, fn, *args)
+
+    def _task(self, save_id: str, job: dict, fn, *args) -> None:
+        failed = False
+        try:
+            fn(save_id, job, *args)
+        except Exception as e:
+            print(f"Save page: {args[0]}: {e}")
+            failed = True
+        with job["lock"]:
+            job["done"] += 1
+            job["failed"] += failed
+            done, total, failures = job["done"], job["total"], job["failed"]
+        self.progress.emit(save_id, done, total)
+        # Stylesheets submit their references before they count as done, so this is the end.
+        if done == total:
+            self.finished.emit(save_id, failures)
+
+    def _write_html(self, save_id: str, job: dict, path: Path, html: str) -> None:
+        job["dir"].mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(html)
+
+    def _fetch(self, save_id: str, job: dict, url: str, name: str, depth: int) -> None:
+        headers = dict(job["headers"].get(url) or job["default_headers"])
+        req = urllib.request.Request(url, headers=headers)
+        with job["opener"].open(req, timeout=self.TIMEOUT_SECS) as resp:
+            job["dir"].mkdir(parents=True, exist_ok=True)
+            path = job["dir"] / name
+            if resp.headers.get_content_type() == "text/css" or name.lower().endswith(".css"):
+                data = resp.read(self.MAX_CSS_SIZE + 1)
+                if len(data) <= self.MAX_CSS_SIZE:
+                    # surrogateescape round-trips whatever the stylesheet's encoding is.
+                    css = data.decode("utf-8", "surrogateescape")
+                    data = self._rewrite_css(save_id, job, url, css, depth).encode("utf-8", "surrogateescape")
+                with open(path, "wb") as f:
+                    f.write(data)
+                    if len(data) > self.MAX_CSS_SIZE:
+                        # Too big to rewrite; copied as is.
+                        while chunk := resp.read(self.CHUNK_SIZE):
+                            f.write(chunk)
+                return
+            with open(path, "wb") as f:
+                while data := resp.read(self.CHUNK_SIZE):
+                    f.write(data)
+
+    def _rewrite_css(self, save_id: str, job: dict, css_url: str, css: str, depth: int) -> str:
+        def replace(m):
+            raw = (m.group(2) if m.group(2) is not None else m.group(4)).strip()
+            url = urllib.parse.urljoin(css_url, raw)
+            if urllib.parse.urlsplit(url).scheme not in ("http", "https") or raw.startswith("#"):
+                return m.group(0)
+            url = urllib.parse.urldefrag(url)[0]
+            if depth >= self.CSS_DEPTH and url not in job["names"]:
+                local = url  # too deep: keep loading it from the site
+            else:
+                name, new = self._local_name(job, url)
+                if new:
+                    headers = dict(job["default_headers"], Referer=css_url)
+                    cookie = job["cookies_for"](url) if job["cookies_for"] else ""
+                    if cookie:
+                        headers["Cookie"] = cookie
+                    job["headers"].setdefault(url, headers)
+                    self._submit(save_id, job, self._fetch, url, name, depth + 1)
+                local = urllib.parse.quote(name)  # same directory as the stylesheet
+            return f'url("{local}")' if m.group(2) is not None else f'@import "{local}"'
+
+        return self._CSS_REF_RE.sub(replace, css)
+
+
+class DownloadNameAllocator(QObject):
+    """Hand out unique file names in download directories without probing the disk.
+
+    The first allocation in a directory lists it once and records every name plus,
+    for each (stem, suffix), the next free "stem (N)" counter. A filesystem watcher
+    rescans the directory when it changes. Handed-out names are reserved at once, so
+    downloads that start at the same moment never get the same name. A reservation
+    ends when a rescan finds the file on disk (the file itself holds the name from
+    then on) or when ``release()`` is called for a download that never wrote one.
+    """
+
+    RESCAN_DELAY_MS = 500
+
+    _COPY_RE = re.compile(r"^(.*) \((\d+)\)$")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._lock = threading.Lock()
+        # normcase(directory) -> {"names": set[str], "reserved": set[str], "next": {(stem, suffix): int}}
+        self._dirs: dict[str, dict] = {}
+        self._dirty: set[str] = set()
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        self._rescan_timer = QTimer(self)
+        self._rescan_timer.setSingleShot(True)
+        self._rescan_timer.setInterval(self.RESCAN_DELAY_MS)
+        self._rescan_timer.timeout.connect(self._rescan_dirty)
+
+    @staticmethod
+    def _split(name: str) -> tuple[str, str]:
+        p = Path(name)
+        return os.path.normcase(p.stem), os.path.normcase(p.suffix)
+
+    def _scan(self, directory: str, index: dict) -> None:
+        names = set()
+        counters = index["next"]
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    name = os.path.normcase(entry.name)
+                    names.add(name)
+                    stem, suffix = self._split(name)
+                    m = self._COPY_RE.match(stem)
+                    if m:
+                        key = (m.group(1), suffix)
+                        counters[key] = max(counters.get(key, 1), int(m.group(2)) + 1)
+        except OSError as e:
+            print(f"Error listing {directory}: {e}")
+        index["names"] = names
+
+    def _index(self, directory: Path) -> dict:
+        key = os.path.normcase(str(directory))
+        index = self._dirs.get(key)
+        if index is None:
+            index = {"names": set(), "reserved": set(), "next": {}}
+            self._scan(str(directory), index)
+            self._dirs[key] = index
+            self._watcher.addPath(str(directory))
+        return index
+
+    def allocate(self, directory: Path, filename: str) -> str:
+        """Reserve and return a name in ``directory`` based on ``filename``."""
+        with self._lock:
+            index = self._index(directory)
+            taken = index["names"]
+            reserved = index["reserved"]
+
+            if os.path.normcase(filename) not in taken and os.path.normcase(filename) not in reserved:
+                reserved.add(os.path.normcase(filename))
+                return filename
+
+            stem, suffix = Path(filename).stem, Path(filename).suffix
+            key = self._split(filename)
+            n = index["next"].get(key, 1)
+            while True:
+                candidate = f"{stem} ({n}){suffix}"
+                folded = os.path.normcase(candidate)
+                n += 1
+                # Only gaps left by a rescan can make this loop more than once.
+                if folded not in taken and folded not in reserved:
+                    break
+            index["next"][key] = n
+            reserved.add(folded)
+            return candidate
+
+    def release(self, directory: Path, name: str) -> None:
+        """Give back a name whose download was cancelled, removed or failed."""
+        with self._lock:
+            index = self._dirs.get(os.path.normcase(str(directory)))
+            if index is not None:
+                index["reserved"].discard(os.path.normcase(name))
+
+    def _on_directory_changed(self, path: str) -> None:
+        self._dirty.add(path)
+        self._rescan_timer.start()
+
+    def _rescan_dirty(self) -> None:
+        dirty, self._dirty = self._dirty, set()
+        for path in dirty:
+            with self._lock:
+                index = self._dirs.get(os.path.normcase(path))
+                if index is not None:
+                    # Counters only ever grow, so names handed out stay unique.
+                    self._scan(path, index)
+                    index["reserved"] -= index["names"]
+
+
+class DownloadDecisionCache:
+    """Remembers which navigations turned out to be downloads.
+
+    Chromium already decides from the response (``Content-Disposition: attachment``
+    or a MIME type it can't render) whether a main-frame navigation becomes a
+    download; the outcome is learned from ``downloadRequested`` (download) and a
+    successful ``loadFinished`` (page). Outcomes are kept in two bounded LRUs: one
+    by exact URL, and one by URL pattern (origin, path with numeric/opaque id
+    segments folded, the file name's stem folded only if it is such an id, and
+    query keys). A URL that is known to
+    download, or whose pattern has only ever downloaded (at least
+    PATTERN_MIN_HITS times), is handed straight to ``page.download()``; everything
+    else navigates normally.
+    """
+
+    MAX_URLS = 2048
+    MAX_PATTERNS = 512
+    PATTERN_MIN_HITS = 2
+
+    DOWNLOAD = "download"
+    PAGE = "page"
+
+    _ID_RE = re.compile(r"^(?:\d+|[0-9a-fA-F-]{16,}|[A-Za-z0-9_-]{24,})$")
+
+    def __init__(self):
+        self._urls: OrderedDict[str, str] = OrderedDict()
+        self._patterns: OrderedDict[str, list[int]] = OrderedDict()  # pattern -> [downloads, pages]
+        self.hits = 0
+
+    @staticmethod
+    def _url_key(url: QUrl) -> str:
+        return url.adjusted(QUrl.UrlFormattingOption.RemoveFragment).toString()
+
+    @classmethod
+    def pattern_of(cls, url: QUrl) -> str:
+        segments = (url.path() or "/").split("/")
+        stem, dot, ext = segments[-1].partition(".")
+        # "/files/1234.pdf" and "/files/1235.pdf" share a pattern; "/docs/report.pdf"
+        # and "/docs/index.html" don't.
+        name = ("#" if cls._ID_RE.match(stem) else stem) + dot + ext.lower()
+        dirs = "/".join("#" if cls._ID_RE.match(seg) else seg for seg in segments[:-1])
+        keys = sorted({pair.split("=", 1)[0] for pair in url.query().split("&") if pair})
+        query = "?" + "&".join(keys) if keys else ""
+        port = f":{url.port()}" if url.port() != -1 else ""
+        return f"{url.scheme()}://{url.host().lower()}{port}{dirs}/{name}{query}"
+
+    def decide(self, url: QUrl) -> str | None:
+        """``DOWNLOAD`` if ``url`` is expected to download, ``PAGE`` if known to render, else None."""
+        key = self._url_key(url)
+        outcome = self._urls.get(key)
+        if outcome is not None:
+            self._urls.move_to_end(key)
+            self.hits += outcome == self.DOWNLOAD
+            return outcome
+
+        pattern = self.pattern_of(url)
+        counts = self._patterns.get(pattern)
+        if counts is None:
+            return None
+        self._patterns.move_to_end(pattern)
+        downloads, pages = counts
+        if downloads >= self.PATTERN_MIN_HITS and pages == 0:
+            self.hits += 1
+            return self.DOWNLOAD
+        if pages and not downloads:
+            return self.PAGE
+        return None
+
+    def learn(self, url: QUrl, outcome: str) -> None:
+        if not url.isValid() or url.scheme() not in ("http", "https"):
+            return
+        key = self._url_key(url)
+        self._urls[key] = outcome
+        self._urls.move_to_end(key)
+        if len(self._urls) > self.MAX_URLS:
+            self._urls.popitem(last=False)
+
+        pattern = self.pattern_of(url)
+        counts = self._patterns.setdefault(pattern, [0, 0])
+        counts[0 if outcome == self.DOWNLOAD else 1] += 1
+        self._patterns.move_to_end(pattern)
+        if len(self._patterns) > self.MAX_PATTERNS:
+            self._patterns.popitem(last=False)
+
+
+class TabRegistry:
+    """Index of browser tabs by web view and by page.
+
+    View/page -> tab are plain dict lookups. Tab indices are cached in a dict that
+    is rebuilt lazily after tabs are added, closed or moved (a cached index that no
+    longer matches the tab bar also triggers a rebuild), so the title/icon/url
+    signal handlers don't scan the tab bar on every call.
+    """
+
+    def __init__(self, tabs: QTabWidget):
+        self._tabs = tabs
+        self._by_view: dict = {}
+        self._by_page: dict = {}
+        self._index: dict | None = None
+        tabs.tabBar().tabMoved.connect(self.invalidate)
+
+    def register(self, tab) -> None:
+        view = tab.web_view
+        self._by_view[view] = tab
+        self._by_page[view.page()] = tab
+        self.invalidate()
+
+    def unregister(self, tab) -> None:
+        view = getattr(tab, "web_view", None)
+        if view is not None and self._by_view.get(view) is tab:
+            del self._by_view[view]
+            self._by_page.pop(view.page(), None)
+        self.invalidate()
+
+    def invalidate(self, *_args) -> None:
+        self._index = None
+
+    def tab_for_view(self, view):
+        return self._by_view.get(view)
+
+    def tab_for_page(self, page):
+        return self._by_page.get(page)
+
+    def index_of(self, tab) -> int:
+        index = -1 if self._index is None else self._index.get(tab, -1)
+        # A cached index is checked against the tab bar, so a stale cache heals itself.
+        if index < 0 or self._tabs.widget(index) is not tab:
+            self._index = {self._tabs.widget(i): i for i in range(self._tabs.count())}
+            index = self._index.get(tab, -1)
+        return index
+
+    def index_for_view(self, view) -> int:
+        tab = self._by_view.get(view)
+        return -1 if tab is None else self.index_of(tab)
+
+
+class DownloadRegistry:
+    """The ordered list of download entries (``MainWindow.downloads``) plus indexes.
+
+    Entries are the same dicts as before. Each gets a stable integer ``"id"`` and is
+    indexed by id, by QWebEngineDownloadRequest, by blob transfer id and by
+    segmented-download job id, so progress signals find their entry without scanning. Row numbers are cached; appends
+    extend the cache and removals drop it to be rebuilt on the next lookup.
+    """
+
+    def __init__(self):
+        self._entries: list[dict] = []
+        self._ids = itertools.count(1)
+        self._by_id: dict[int, dict] = {}
+        self._by_request: dict = {}
+        self._by_blob: dict[str, dict] = {}
+        self._by_job: dict[str, dict] = {}
+        self._rows: dict[int, int] | None = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __getitem__(self, row):
+        return self._entries[row]
+
+    def __delitem__(self, row: int):
+        entry = self._entries.pop(row)
+        self._by_id.pop(entry["id"], None)
+        if entry.get("request") is not None:
+            self._by_request.pop(entry["request"], None)
+        if entry.get("blob_id"):
+            self._by_blob.pop(entry["blob_id"], None)
+        if entry.get("job_id"):
+            self._by_job.pop(entry["job_id"], None)
+        self._rows = None
+
+    def append(self, entry: dict) -> None:
+        entry.setdefault("id", next(self._ids))
+        self._entries.append(entry)
+        self._by_id[entry["id"]] = entry
+        if entry.get("request") is not None:
+            self._by_request[entry["request"]] = entry
+        if entry.get("blob_id"):
+            self._by_blob[entry["blob_id"]] = entry
+        if entry.get("job_id"):
+            self._by_job[entry["job_id"]] = entry
+        if self._rows is not None:
+            self._rows[entry["id"]] = len(self._entries) - 1
+
+    def by_id(self, entry_id: int) -> dict | None:
+        return self._by_id.get(entry_id)
+
+    def by_request(self, request) -> dict | None:
+        return self._by_request.get(request)
+
+    def by_blob(self, transfer_id: str) -> dict | None:
+        return self._by_blob.get(transfer_id)
+
+    def by_job(self, job_id: str) -> dict | None:
+        return self._by_job.get(job_id)
+
+    def requests(self):
+        return self._by_request.keys()
+
+    def row_of(self, entry: dict) -> int:
+        if self._rows is None:
+            self._rows = {d["id"]: row for row, d in enumerate(self._entries)}
+        return self._rows.get(entry.get("id"), -1)
+
+    def set_job(self, entry: dict, job_id: str | None) -> None:
+        """Point ``entry`` at a new segmented-download job (None detaches it)."""
+        if entry.get("job_id"):
+            self._by_job.pop(entry["job_id"], None)
+        entry["job_id"] = job_id
+        if job_id:
+            self._by_job[job_id] = entry
+
+
+class DownloadStateStore(QObject):
+    """Download entries persisted to ``downloads.json`` so they survive a restart.
+
+    ``snapshot`` is called on the UI thread and returns the records to save (see
+    ``MainWindow._download_records``). ``mark_dirty()`` starts a timer instead of
+    writing; while downloads are running the file is rewritten at most once per
+    WRITE_DELAY_MS, by a writer thread that writes a temp file and swaps it in.
+    """
+
+    WRITE_DELAY_MS = 2000
+
+    def __init__(self, path: Path, snapshot, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self._snapshot = snapshot
+
+        self._write_timer = QTimer(self)
+        self._write_timer.setSingleShot(True)
+        self._write_timer.setInterval(self.WRITE_DELAY_MS)
+        self._write_timer.timeout.connect(self._schedule_write)
+
+        # Only the newest snapshot matters, so this is a slot, not a queue.
+        self._cond = threading.Condition()
+        self._pending = None
+        self._closing = False
+        self._thread = threading.Thread(target=self._writer_loop, name="flow-downloads-writer", daemon=True)
+        self._thread.start()
+
+    def load(self) -> list[dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error loading downloads: {e}")
+            return []
+        return [r for r in records if isinstance(r, dict) and r.get("path")] if isinstance(records, list) else []
+
+    def mark_dirty(self, *_args) -> None:
+        if not self._write_timer.isActive():
+            self._write_timer.start()
+
+    def _schedule_write(self) -> None:
+        with self._cond:
+            self._pending = self._snapshot()
+            self._cond.notify()
+
+    def close(self) -> None:
+        """Write the current state and stop the writer thread."""
+        self._write_timer.stop()
+        self._schedule_write()
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout=5.0)
+
+    def _writer_loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closing:
+                    self._cond.wait()
+                data, self._pending = self._pending, None
+                closing = self._closing
+            if data is not None:
+                self._write(data)
+            if closing:
+                return
+
+    def _write(self, records: list) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(records, f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Error saving downloads: {e}")
+
+
+class BandwidthLimiter:
+    """Token bucket shared by all downloads; ``rate`` is bytes per second (0 = unlimited)."""
+
+    BURST_SECS = 0.5
+
+    def __init__(self, rate: int = 0):
+        self._lock = threading.Lock()
+        self.rate = max(0, int(rate))
+        self._tokens = 0.0
+        self._stamp = time.monotonic()
+
+    def set_rate(self, rate: int) -> None:
+        with self._lock:
+            self.rate = max(0, int(rate))
+            self._tokens = 0.0
+            self._stamp = time.monotonic()
+
+    def charge(self, nbytes: int) -> float:
+        """Spend ``nbytes``; returns the seconds until the bucket is out of debt (0 = not in debt)."""
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.rate * self.BURST_SECS, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= nbytes
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def take(self, nbytes: int, cancelled: threading.Event | None = None) -> None:
+        """Spend ``nbytes`` and block (worker threads only) until the bucket is out of debt."""
+        delay = self.charge(nbytes)
+        if delay > 0:
+            if cancelled is not None:
+                cancelled.wait(delay)
+            else:
+                time.sleep(delay)
+
+
+class DownloadScheduler(QObject):
+    """Starts downloads under a global and a per-host concurrency limit.
+
+    ``submit()`` starts a download at once if a slot is free. Otherwise the entry
+    is marked ``"queued"`` and its start callback waits in a heap ordered by
+    priority, then arrival. ``release()`` (finished, interrupted or removed) frees
+    the slot and starts the queued downloads that now fit. Chromium downloads are
+    cancelled unless accepted inside ``downloadRequested``, so a queued one is
+    accepted and paused (``hold``), and resumed when its turn comes.
+
+    The optional bandwidth cap is a BandwidthLimiter: segmented jobs wait on it
+    between chunks, while Chromium downloads are charged every
+    THROTTLE_INTERVAL_MS for what they received and paused while it is in debt.
+    """
+
+    THROTTLE_INTERVAL_MS = 250
+
+    started = pyqtSignal(object)  # entry that left the queue
+
+    def __init__(self, max_active: int = 3, per_host: int = 2, bandwidth_kbps: int = 0, parent=None):
+        super().__init__(parent)
+        self.max_active = max(1, int(max_active))
+        self.per_host = max(1, int(per_host))
+        self.limiter = BandwidthLimiter(int(bandwidth_kbps) * 1024)
+        self._heap: list[tuple[int, int, int]] = []  # (priority, seq, entry id)
+        self._seq = itertools.count()
+        self._waiting: dict[int, tuple[dict, object]] = {}  # entry id -> (entry, start)
+        self._active: dict[int, dict] = {}
+        self._host_counts: dict[str, int] = {}
+        self._throttled: set[int] = set()
+
+        self._throttle_timer = QTimer(self)
+        self._throttle_timer.setInterval(self.THROTTLE_INTERVAL_MS)
+        self._throttle_timer.timeout.connect(self._throttle)
+
+    @staticmethod
+    def _host(entry: dict) -> str:
+        return QUrl(entry.get("url", "")).host().lower()
+
+    def configure(self, max_active: int, per_host: int, bandwidth_kbps: int) -> None:
+        self.max_active = max(1, int(max_active))
+        self.per_host = max(1, int(per_host))
+        self.limiter.set_rate(int(bandwidth_kbps) * 1024)
+        self._pump()
+        self._update_timer()
+
+    def submit(self, entry: dict, start, hold=None, priority: int = 0) -> None:
+        """Run ``start()`` now or when a slot frees up; ``hold()`` parks a download that must wait."""
+        if self._can_start(entry):
+            self._activate(entry)
+            start()
+            return
+        if hold is not None:
+            hold()
+        entry["queued"] = True
+        self._waiting[entry["id"]] = (entry, start)
+        self._push(entry, priority)
+
+    def prioritize(self, entry: dict) -> bool:
+        """Move a queued entry to the front of the queue."""
+        if entry.get("id") not in self._waiting:
+            return False
+        top = self._heap[0][0] if self._heap else 0
+        self._push(entry, min(top, 0) - 1)
+        self._pump()
+        return True
+
+    def release(self, entry: dict) -> None:
+        entry_id = entry.get("id")
+        if self._waiting.pop(entry_id, None) is not None:
+            entry.pop("queued", None)
+        if self._active.pop(entry_id, None) is not None:
+            host = self._host(entry)
+            self._host_counts[host] -= 1
+            if not self._host_counts[host]:
+                del self._host_counts[host]
+            self._throttled.discard(entry_id)
+            self._pump()
+        self._update_timer()
+
+    def _push(self, entry: dict, priority: int) -> None:
+        # Re-pushing supersedes the old heap item, which is skipped when popped.
+        entry["_queue_seq"] = seq = next(self._seq)
+        heapq.heappush(self._heap, (priority, seq, entry["id"]))
+
+    def _can_start(self, entry: dict) -> bool:
+        return len(self._active) < self.max_active and self._host_counts.get(self._host(entry), 0) < self.per_host
+
+    def _activate(self, entry: dict) -> None:
+        self._active[entry["id"]] = entry
+        host = self._host(entry)
+        self._host_counts[host] = self._host_counts.get(host, 0) + 1
+        entry["_charged"] = int(entry.get("received", 0) or 0)
+        self._update_timer()
+
+    def _pump(self) -> None:
+        blocked = []  # host is full; keep their place in the queue
+        while self._heap and len(self._active) < self.max_active:
+            item = heapq.heappop(self._heap)
+            waiting = self._waiting.get(item[2])
+            if waiting is None or waiting[0].get("_queue_seq") != item[1]:
+                continue
+            entry, start = waiting
+            if not self._can_start(entry):
+                blocked.append(item)
+                continue
+            del self._waiting[item[2]]
+            entry.pop("queued", None)
+            self._activate(entry)
+            start()
+            self.started.emit(entry)
+        for item in blocked:
+            heapq.heappush(self._heap, item)
+
+    def _update_timer(self) -> None:
+        wanted = self.limiter.rate > 0 and any(e.get("request") is not None for e in self._active.values())
+        if wanted and not self._throttle_timer.isActive():
+            self._throttle_timer.start()
+        elif not wanted:
+            self._throttle_timer.stop()
+            self._set_throttled(False)
+
+    def _throttle(self) -> None:
+        for entry in self._active.values():
+            if entry.get("request") is None:
+                continue  # segmented jobs charge the limiter themselves
+            received = int(entry.get("received", 0) or 0)
+            if received > entry.get("_charged", 0):
+                self.limiter.charge(received - entry["_charged"])
+            entry["_charged"] = received
+        self._set_throttled(self.limiter.charge(0) > 0)
+
+    def _set_throttled(self, throttled: bool) -> None:
+        for entry_id, entry in self._active.items():
+            req = entry.get("request")
+            if req is None or (entry_id in self._throttled) == throttled:
+                continue
+            try:
+                if throttled:
+                    req.pause()
+                    self._throttled.add(entry_id)
+                else:
+                    req.resume()
+                    self._throttled.discard(entry_id)
+            except RuntimeError:
+                self._throttled.discard(entry_id)
+
+
+class DownloadPostProcessor(QObject):
+    """Runs finished downloads through a list of steps on a worker pool.
+
+    Each step is ``step(path, job, cancelled)``; it reads ``job`` (the options
+    given to ``submit()`` plus what earlier steps recorded) and adds its own
+    results to it. Built in: ``hash_sha256`` streams the file through SHA-256,
+    ``verify_checksum`` compares that against a sidecar (``<file>.sha256``,
+    ``<file>.sha256sum`` or ``SHA256SUMS`` next to it) and ``extract_archive``
+    unpacks zip and tar files when ``job["extract_to"]`` is set. ``add_step()``
+    appends more. Nothing runs on the UI thread; ``stage`` and ``finished`` report
+    back by entry id.
+    """
+
+    MAX_WORKERS = 2
+    CHUNK_SIZE = 1024 * 1024
+    SIDECAR_SUFFIXES = (".sha256", ".sha256sum")
+    SIDECAR_NAMES = ("SHA256SUMS", "SHA256SUMS.txt", "sha256sums.txt")
+
+    stage = pyqtSignal(int, str)  # entry id, step name
+    finished = pyqtSignal(int, object)  # entry id, job dict (with "error" on failure)
+
+    _SUM_LINE_RE = re.compile(r"^([0-9a-fA-F]{64})(?:\s+\*?(.+))?$")
+    _BSD_LINE_RE = re.compile(r"^SHA256 \((.+)\) = ([0-9a-fA-F]{64})$")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.steps = [self.hash_sha256, self.verify_checksum, self.extract_archive]
+        self._cancelled = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix="flow-postprocess")
+
+    def add_step(self, step) -> None:
+        self.steps.append(step)
+
+    def submit(self, entry_id: int, path: Path, **options) -> None:
+        job = dict(options)
+        self._pool.submit(self._run, entry_id, Path(path), job, list(self.steps))
+
+    def shutdown(self) -> None:
+        """Abandon running steps (a multi-GB hash would otherwise hold up exit)."""
+        self._cancelled.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, entry_id: int, path: Path, job: dict, steps: list) -> None:
+        try:
+            for step in steps:
+                if self._cancelled.is_set():
+                    return
+                self.stage.emit(entry_id, step.__name__)
+                step(path, job, self._cancelled)
+        except Exception as e:
+            job["error"] = str(e) or type(e).__name__
+        self.finished.emit(entry_id, job)
+
+    # -- built-in steps --
+
+    def hash_sha256(self, path: Path, job: dict, cancelled: threading.Event) -> None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while not cancelled.is_set():
+                data = f.read(self.CHUNK_SIZE)
+                if not data:
+                    break
+                digest.update(data)
+        job["sha256"] = digest.hexdigest()
+
+    def _expected_sha256(self, path: Path) -> str | None:
+        for suffix in self.SIDECAR_SUFFIXES:
+            sidecar = path.with_name(path.name + suffix)
+            if sidecar.is_file():
+                return self._sum_for(sidecar, path.name, single=True)
+        for name in self.SIDECAR_NAMES:
+            sidecar = path.with_name(name)
+            if sidecar.is_file():
+                found = self._sum_for(sidecar, path.name, single=False)
+                if found:
+                    return found
+        return None
+
+    def _sum_for(self, sidecar: Path, filename: str, single: bool) -> str | None:
+        """The checksum listed for ``filename``; a ``<file>.sha256`` sidecar's first one counts."""
+        try:
+            with open(sidecar, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    line = line.strip()
+                    m = self._BSD_LINE_RE.match(line)
+                    if m:
+                        name, digest = m.group(1), m.group(2)
+                    else:
+                        m = self._SUM_LINE_RE.match(line)
+                        if not m:
+                            continue
+                        digest, name = m.group(1), m.group(2) or ""
+                    # The downloaded file may have been renamed ("name (1).iso").
+                    if single or name.removeprefix("./") == filename:
+                        return digest.lower()
+        except OSError:
+            pass
+        return None
+
+    def verify_checksum(self, path: Path, job: dict, cancelled: threading.Event) -> None:
+        expected = self._expected_sha256(path)
+        if expected and job.get("sha256"):
+            job["verified"] = expected == job["sha256"]
+
+    def extract_archive(self, path: Path, job: dict, cancelled: threading.Event) -> None:
+        target = job.get("extract_to")
+        if not target or job.get("verified") is False or cancelled.is_set():
+            return
+        target = Path(target)
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as zf:
+                root = target.resolve()
+                for name in zf.namelist():
+                    if not (root / name).resolve().is_relative_to(root):
+                        raise ValueError(f"Unsafe path in archive: {name}")
+                zf.extractall(target)
+        elif tarfile.is_tarfile(path):
+            if not hasattr(tarfile, "data_filter"):
+                # Extraction filters arrived in 3.10.12/3.11.4; unfiltered tar members can escape the target.
+                raise RuntimeError("Unpacking tar archives needs Python 3.10.12 or later")
+            with tarfile.open(path) as tf:
+                tf.extractall(target, filter="data")
+        else:
+            return
+        job["extracted_to"] = str(target)
+
+
+def _run_registry_benchmark() -> None:
+    """Print per-signal lookup cost of the linear scans vs the registries (--registry-benchmark)."""
+
+    class _StubView(QWidget):
+        # Enough of QWebEngineView for TabRegistry: a page() to key on.
+        def __init__(self):
+            super().__init__()
+            self._page = QObject(self)
+
+        def page(self):
+            return self._page
+
+    def per_call_us(fn, keys, rounds=5) -> float:
+        best = float("inf")
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for key in keys:
+                fn(key)
+            best = min(best, time.perf_counter() - start)
+        return best / len(keys) * 1e6
+
+    print("tabs  linear scan (us)  TabRegistry (us)  after a move (us)")
+    for n in (10, 100, 500):
+        tabs = QTabWidget()
+        registry = TabRegistry(tabs)
+        views = []
+        for i in range(n):
+            tab = QWidget()
+            tab.web_view = _StubView()
+            tabs.addTab(tab, str(i))
+            registry.register(tab)
+            views.append(tab.web_view)
+
+        def linear(view, tabs=tabs):
+            for i in range(tabs.count()):
+                if getattr(tabs.widget(i), "web_view", None) is view:
+                    return i
+            return -1
+
+        keys = views[-50:] * 20  # tabs at the end are the worst case for the scan
+        scan = per_call_us(linear, keys)
+        indexed = per_call_us(registry.index_for_view, keys)
+        tabs.tabBar().moveTab(0, n - 1)
+        moved = per_call_us(registry.index_for_view, keys, rounds=1)
+        print(f"{n:>4}  {scan:>16.2f}  {indexed:>16.2f}  {moved:>17.2f}")
+        tabs.deleteLater()
+
+    print()
+    print("downloads  linear scan (us)  DownloadRegistry (us)")
+    for n in (100, 1000, 10000):
+        downloads = DownloadRegistry()
+        requests = [object() for _ in range(n)]
+        for req in requests:
+            downloads.append({"request": req, "received": 0})
+
+        def linear(req, downloads=downloads):
+            for d in downloads:
+                if d.get("request") is req:
+                    return d
+            return None
+
+        keys = requests[-50:] * 20
+        print(f"{n:>9}  {per_call_us(linear, keys):>16.2f}  {per_call_us(downloads.by_request, keys):>21.2f}")
+
+
+def _run_bridge_benchmark(tabs: int = 200) -> None:
+    """Compare per-tab WebChannels with the shared bridge on ``tabs`` loaded pages (--bridge-benchmark).
+
+    Each mode runs in a fresh process (see _run_bridge_probe), so memory one
+    mode allocated can't hide in the other's numbers.
+    """
+    keys = ("setup_ms", "load_ms", "browser_mb", "renderer_mb", "total_mb", "renderers")
+    print(f"{tabs} loaded pages; RSS after load minus before the pages were created")
+    print("mode     " + "  ".join(f"{k:>11}" for k in keys))
+    results = {}
+    for mode in ("per-tab", "shared"):  # before / after sharing one channel
+        try:
+            proc = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "--bridge-probe", mode, str(tabs)],
+                capture_output=True, text=True, timeout=300,
+            )
+            lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+            if not lines:
+                errors = proc.stderr.strip().splitlines()
+                print(f"{mode:<7}  probe failed: {errors[-1] if errors else f'exit code {proc.returncode}'}")
+                continue
+            result = results[mode] = json.loads(lines[-1])
+        except (subprocess.TimeoutExpired, json.JSONDecodeError) as e:
+            print(f"{mode:<7}  probe failed: {e}")
+            continue
+        print(f"{mode:<7}  " + "  ".join(f"{result[k]:>11}" for k in keys))
+    if len(results) == 2:
+        saved = results["per-tab"]["total_mb"] - results["shared"]["total_mb"]
+        print(f"shared bridge saves {saved:.1f} MB ({saved / tabs * 1024:.0f} KB per page)")
+
+
+def _run_bridge_probe(mode: str, tabs: int, settle_ms: int = 2000) -> None:
+    """Load ``tabs`` pages with ``mode`` ("per-tab" or "shared") channels and print a JSON line of RSS figures."""
+
+    def rss_mb(pid: int) -> float:
+        return _process_rss_bytes(pid) / (1024 * 1024)
+
+    profile = _get_persistent_profile()
+    QApplication.processEvents()
+    before = rss_mb(os.getpid())
+
+    root = QObject()
+    pages = [QWebEnginePage(profile, root) for _ in range(tabs)]
+    start = time.perf_counter()
+    if mode == "shared":
+        channel = QWebChannel(root)
+        bridge = JsBridge(None, root)
+        channel.registerObject("flowBridge", bridge)
+        for page in pages:
+            bridge.attach(page, channel)
+    else:
+        for page in pages:
+            channel = QWebChannel(page)
+            channel.registerObject("flowBridge", JsBridge(None, page))
+            page.setWebChannel(channel, _SCRIPT_WORLD)
+    setup_ms = (time.perf_counter() - start) * 1000.0
+
+    # Every page runs the profile's bridge script, which connects its channel on load.
+    loop = QEventLoop()
+    pending = {"count": tabs}
+
+    def loaded(_ok):
+        pending["count"] -= 1
+        if pending["count"] == 0:
+            loop.quit()
+
+    start = time.perf_counter()
+    for i, page in enumerate(pages):
+        page.loadFinished.connect(loaded)
+        page.setHtml(f"<!DOCTYPE html><title>Page {i}</title><p>Page {i}</p>")
+    QTimer.singleShot(120_000, loop.quit)
+    loop.exec()
+    load_ms = (time.perf_counter() - start) * 1000.0
+    QTimer.singleShot(settle_ms, loop.quit)  # let the channels finish their handshakes
+    loop.exec()
+
+    browser = rss_mb(os.getpid()) - before
+    pids = {int(page.renderProcessPid() or 0) for page in pages} - {0}
+    renderers = sum(rss_mb(pid) for pid in pids)
+    print(json.dumps({
+        "mode": mode,
+        "setup_ms": round(setup_ms, 1),
+        "load_ms": round(load_ms),
+        "loaded": tabs - pending["count"],
+        "browser_mb": round(browser, 1),
+        "renderer_mb": round(renderers, 1),
+        "total_mb": round(browser + renderers, 1),
+        "renderers": len(pids),
+    }))
+
+
+class TransferRateEstimator:
+    """Throughput and ETA of one transfer over a rolling time window."""
+
+    WINDOW_SECS = 5.0
+
+    def __init__(self):
+        self._samples: deque = deque()  # (monotonic time, bytes received)
+
+    def add(self, received: int, now: float | None = None) -> None:
+        now = time.monotonic() if now is None else now
+        self._samples.append((now, received))
+        # Keep one sample older than the window as the baseline.
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self.WINDOW_SECS:
+            self._samples.popleft()
+
+    def rate(self) -> float:
+        """Bytes per second over the window (0 until there are two samples)."""
+        if len(self._samples) < 2:
+            return 0.0
+        (t0, b0), (t1, b1) = self._samples[0], self._samples[-1]
+        if t1 <= t0:
+            return 0.0
+        return max(0.0, (b1 - b0) / (t1 - t0))
+
+    def eta(self, received: int, total: int) -> float | None:
+        """Seconds left, or None if the total or the rate is unknown."""
+        rate = self.rate()
+        if total <= 0 or rate <= 0:
+            return None
+        return max(0.0, (total - received) / rate)
+
+
+class DownloadsModel(QAbstractListModel):
+    """List model over MainWindow.downloads for the Downloads panel.
+
+    Progress signals only mark an entry as changed; a timer repaints the changed
+    rows at most FRAME_RATE times per second instead of rebuilding the list.
+    """
+
+    FRAME_RATE = 10
+
     def __init__(self, main_window, parent=None):
         super().__init__(parent)
         self._mw = main_window
+        self._changed: set[int] = set()  # ids of changed entries
+
+        self._frame_timer = QTimer(self)
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.setInterval(1000 // self.FRAME_RATE)
+        self._frame_timer.timeout.connect(self._flush)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._mw.downloads)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._mw.downloads):
+            return None
+        d = self._mw.downloads[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self._mw._format_download_item(d)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return d.get("path") + (f"\nSHA-256: {d['sha256']}" if d.get("sha256") else "")
+        return None
+
+    def append(self, entry: dict) -> None:
+        row = len(self._mw.downloads)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._mw.downloads.append(entry)
+        self.endInsertRows()
+
+    def remove_row(self, row: int) -> None:
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._mw.downloads[row]
+        self.endRemoveRows()
+
+    def mark_changed(self, entry: dict) -> None:
+        self._changed.add(entry["id"])
+        if not self._frame_timer.isActive():
+            self._frame_timer.start()
+
+    def _flush(self) -> None:
+        changed, self._changed = self._changed, set()
+        downloads = self._mw.downloads
+        rows = sorted(
+            row for row in (downloads.row_of(d) for d in map(downloads.by_id, changed) if d is not None)
+            if row >= 0
+        )
+        # One dataChanged per contiguous run of rows.
+        start = prev = None
+        for row in rows + [None]:
+            if start is not None and (row is None or row != prev + 1):
+                self.dataChanged.emit(self.index(start), self.index(prev))
+                start = None
+            if start is None:
+                start = row
+            prev = row
+
+
+class CookieListModel(QAbstractListModel):
+    """Lazily populated list model over the cookie jar for the Cookies dialog.
+
+    Rows are references into the jar, sorted by domain; their text is only
+    formatted when the view asks for a visible row, and rows are exposed to the
+    view FETCH_BATCH at a time through canFetchMore()/fetchMore(). The filter
+    matches domain and name; when the new text contains the previous one only
+    the current matches are re-filtered. Jar changes are picked up after a short
+    delay and applied as row inserts, removals and data changes, so the view
+    keeps its selection and scroll position.
+    """
+
+    FETCH_BATCH = 500
+    REFRESH_DELAY_MS = 300
+
+    total_changed = pyqtSignal(int)
 
-    @pyqtSlot(str, str)
-    def saveBlob(self, data_url: str, filename: str):
-        # data_url format: data:<mime>;base64,<payload>
-        self._mw._save_blob_data_url(data_url, filename)
+    def __init__(self, main_window, parent=None):
+        super().__init__(parent)
+        self._mw = main_window
+        self._all: list[tuple[str, dict]] = []  # (lowercased "domain name", cookie)
+        self._rows: list[tuple[str, dict]] = []
+        self._loaded = 0
+        self._filter = ""
+
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(self.REFRESH_DELAY_MS)
+        self._refresh_timer.timeout.connect(self.refresh)
+        main_window.cookie_jar.changed.connect(self._refresh_timer.start)
+
+        self.refresh()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < len(self._rows)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(self.FETCH_BATCH, len(self._rows) - self._loaded)
+        if parent.isValid() or count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= self._loaded:
+            return None
+        c = self._rows[index.row()][1]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self._mw._format_cookie_item(c)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return f"{c['domain']}{c['path']}\n{c['name']}={c['value']}"
+        return None
+
+    def cookie_at(self, row: int) -> dict | None:
+        return self._rows[row][1] if 0 <= row < self._loaded else None
+
+    def total(self) -> int:
+        return len(self._rows)
+
+    def refresh(self) -> None:
+        self._refresh_timer.stop()
+        jar = self._mw.cookie_jar
+        self._all = [
+            (f"{domain} {c['name']}".lower(), c)
+            for domain in sorted(jar.domains(), key=lambda d: d.lstrip("."))
+            for c in jar.for_domain(domain)
+        ]
+        text = self._filter
+        self._update([row for row in self._all if text in row[0]] if text else list(self._all))
+
+    @staticmethod
+    def _key(row) -> tuple[str, str, str]:
+        c = row[1]
+        return c["domain"], c["name"], c["path"]
+
+    def _update(self, new_rows: list) -> None:
+        """Turn the current rows into ``new_rows`` with row-level signals."""
+        old_keys = [self._key(row) for row in self._rows]
+        new_keys = [self._key(row) for row in new_rows]
+        old_set, new_set = set(old_keys), set(new_keys)
+        if [k for k in old_keys if k in new_set] != [k for k in new_keys if k in old_set]:
+            # A cookie re-set within the delay moved to the end of its domain.
+            self._apply(new_rows)
+            return
+
+        # Removals, as runs of adjacent rows from the back so indices stay valid.
+        end = len(old_keys)
+        while end > 0:
+            if old_keys[end - 1] in new_set:
+                end -= 1
+                continue
+            first = end - 1
+            while first > 0 and old_keys[first - 1] not in new_set:
+                first -= 1
+            visible_end = min(end, self._loaded)
+            if first < visible_end:
+                self.beginRemoveRows(QModelIndex(), first, visible_end - 1)
+                del self._rows[first:end]
+                self._loaded -= visible_end - first
+                self.endRemoveRows()
+            else:
+                del self._rows[first:end]
+            end = first
+
+        # Insertions, front to back; the rows before ``start`` now match new_rows.
+        start = 0
+        while start < len(new_keys):
+            if new_keys[start] in old_set:
+                start += 1
+                continue
+            stop = start + 1
+            while stop < len(new_keys) and new_keys[stop] not in old_set:
+                stop += 1
+            if start <= self._loaded:
+                self.beginInsertRows(QModelIndex(), start, stop - 1)
+                self._rows[start:start] = new_rows[start:stop]
+                self._loaded += stop - start
+                self.endInsertRows()
+            else:
+                self._rows[start:start] = new_rows[start:stop]
+            start = stop
+
+        # Cookies whose value or attributes changed, as runs of visible rows.
+        changed = [i for i in range(self._loaded) if self._rows[i][1] is not new_rows[i][1]]
+        self._rows = new_rows
+        for first, last in self._runs(changed):
+            self.dataChanged.emit(self.index(first), self.index(last))
+        self.total_changed.emit(len(self._rows))
+
+    @staticmethod
+    def _runs(indices: list[int]):
+        for _, group in itertools.groupby(enumerate(indices), lambda pair: pair[1] - pair[0]):
+            group = list(group)
+            yield group[0][1], group[-1][1]
+
+    def set_filter(self, text: str) -> None:
+        text = text.strip().lower()
+        if text == self._filter:
+            return
+        # A longer filter can only narrow the current matches.
+        source = self._rows if self._filter and self._filter in text else self._all
+        self._filter = text
+        self._apply(source)
+
+    def _apply(self, source: list) -> None:
+        text = self._filter
+        self.beginResetModel()
+        self._rows = [row for row in source if text in row[0]] if text else list(source)
+        self._loaded = min(self.FETCH_BATCH, len(self._rows))
+        self.endResetModel()
+        self.total_changed.emit(len(self._rows))
+
+
+class HistoryListModel(QAbstractListModel):
+    """Lazily fetched, filterable list model over the whole history (History dialog).
+
+    Rows come from ``HistoryStore.search()`` FETCH_BATCH at a time as the view
+    scrolls, each page continuing from the last row of the previous one, so
+    opening the dialog or changing the filter costs one indexed query however
+    large the history is. The filter is text (URL/title) plus a visit time range.
+    A search cut short by the store's scan budget shows what it found, continues
+    from there on scrolling, and reports ``partial_changed`` when it found nothing
+    (the filter needs more typing).
+    """
+
+    FETCH_BATCH = 200
+
+    partial_changed = pyqtSignal(bool)
+
+    def __init__(self, main_window, parent=None):
+        super().__init__(parent)
+        self._mw = main_window
+        self._rows: list[dict] = []
+        self._more = False
+        self._partial = False
+        self._text = ""
+        self._start = None
+        self._end = None
+        main_window.history_store.removed.connect(self._reload)
+        self.refresh()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self._more:
+            return
+        page = self._page(self._rows[-1] if self._rows else None)
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(page) - 1)
+            self._rows.extend(page)
+            self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._rows):
+            return None
+        entry = self._rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self._mw._format_history_item(entry)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return entry["url"]
+        return None
+
+    def entry_at(self, row: int) -> dict | None:
+        return self._rows[row] if 0 <= row < len(self._rows) else None
+
+    def set_filter(self, text: str, start: float | None = None, end: float | None = None) -> None:
+        text = text.strip()
+        if (text, start, end) == (self._text, self._start, self._end):
+            return
+        self._text, self._start, self._end = text, start, end
+        self._reload()
+
+    def refresh(self) -> None:
+        """Re-read from the store, including writes still queued.
+
+        Deletes reload the model by themselves once committed (``HistoryStore.removed``).
+        """
+        if self._mw.history_store.has_pending_writes():
+            self._mw.history_store.flush()
+        self._reload()
+
+    def _page(self, after: dict | None) -> list[dict]:
+        before = (after["last_visit"], after["id"]) if after else None
+        page, complete = self._mw.history_store.search(self._text, self._start, self._end, before, self.FETCH_BATCH)
+        # A cut-short scan that found rows continues after the last one; one that
+        # found nothing would only start over, so it stops here.
+        self._more = len(page) == self.FETCH_BATCH or (not complete and bool(page))
+        partial = not complete and not page
+        if partial != self._partial:
+            self._partial = partial
+            self.partial_changed.emit(partial)
+        return page
+
+    def _reload(self) -> None:
+        self.beginResetModel()
+        self._rows = self._page(None)
+        self.endResetModel()
+
+
+class JsBridge(QObject):
+    """The ``flowBridge`` object published to every page over one shared QWebChannel.
+
+    ``attach(page)`` gives each page a small id (set as ``window.__flowPageId`` in
+    the script world by a page script), and calls that need to know their page pass
+    it as the first argument, so no channel or bridge object is created per tab.
+    """
+
+    def __init__(self, main_window, parent=None):
+        super().__init__(parent)
+        self._mw = main_window
+        self._pages: dict[int, QWebEnginePage] = {}
+        self._page_ids = itertools.count(1)
+
+    def attach(self, page: QWebEnginePage, channel: QWebChannel) -> int:
+        page_id = next(self._page_ids)
+        script = QWebEngineScript()
+        script.setName("flow-page-id")
+        script.setSourceCode(f"window.__flowPageId = {page_id};")
+        script.setInjectionPoint(QWebEngineScript.InjectionPoint.DocumentCreation)
+        script.setWorldId(_SCRIPT_WORLD)
+        script.setRunsOnSubFrames(False)
+        page.scripts().insert(script)
+        page.setWebChannel(channel, _SCRIPT_WORLD)
+        self._pages[page_id] = page
+        page.destroyed.connect(lambda _obj=None, page_id=page_id: self._pages.pop(page_id, None))
+        return page_id
+
+    def page_for(self, page_id) -> QWebEnginePage | None:
+        return self._pages.get(int(page_id or 0))
+
+    @pyqtSlot(float, str, float, str, result=str)
+    def blobBegin(self, page_id: float, filename: str, size: float, mime: str) -> str:
+        return self._mw._begin_blob_download(filename, int(size), mime, self.page_for(page_id))
+
+    @pyqtSlot(str, str, result=int)
+    def blobChunk(self, transfer_id: str, b64: str) -> int:
+        return self._mw.blob_writer.write(transfer_id, b64)
+
+    @pyqtSlot(str, result=int)
+    def blobPending(self, transfer_id: str) -> int:
+        return self._mw.blob_writer.pending(transfer_id)
 
     @pyqtSlot(str)
-    def saveBlobError(self, message: str):
+    def blobEnd(self, transfer_id: str):
+        self._mw.blob_writer.end(transfer_id)
+
+    @pyqtSlot(str, str)
+    def blobAbort(self, transfer_id: str, message: str):
         print(f"Blob download error: {message}")
+        self._mw.blob_writer.abort(transfer_id, message)
+
+    @pyqtSlot(float, str)
+    def saveBlobError(self, page_id: float, message: str):
+        page = self.page_for(page_id)
+        where = f" ({page.url().toString()})" if page is not None else ""
+        print(f"Blob download error{where}: {message}")
+
+
+class TabLifecycleScheduler(QObject):
+    """Freeze background tabs after they have been idle for a while.
+
+    Hidden tabs keep running timers, animations and JS at full speed. Once a tab
+    has been in the background for ``idle_secs`` its page is moved to the Frozen
+    lifecycle state, and it is thawed again as soon as it becomes the current tab.
+    Tabs playing audio, holding fullscreen or running a download are left alone.
+    """
+
+    SWEEP_INTERVAL_MS = 5000
+
+    def __init__(self, main_window, idle_secs: int = 300, parent=None):
+        super().__init__(parent)
+        self._mw = main_window
+        self._current_tab = None
+        self.idle_secs = 0
+        self.set_idle_secs(idle_secs)
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.SWEEP_INTERVAL_MS)
+        self._timer.timeout.connect(self._sweep)
+        self._timer.start()
+
+    def set_idle_secs(self, secs: int) -> None:
+        # 0 disables freezing; already-frozen tabs stay frozen until activated.
+        self.idle_secs = max(0, int(secs or 0))
+
+    def touch(self, tab) -> None:
+        tab._last_active = time.monotonic()
+
+    def on_tab_activated(self, tab) -> None:
+        # The tab we are leaving starts its idle period now.
+        if self._current_tab is not None and self._current_tab is not tab:
+            self.touch(self._current_tab)
+        self._current_tab = tab
+        self.thaw(tab)
+
+    def thaw(self, tab) -> None:
+        self.touch(tab)
+        try:
+            page = tab.web_view.page()
+            # Activating a discarded page reloads it from its URL.
+            if page.lifecycleState() != QWebEnginePage.LifecycleState.Active:
+                page.setLifecycleState(QWebEnginePage.LifecycleState.Active)
+        except RuntimeError:
+            # The view was deleted together with its tab.
+            pass
+
+    def can_suspend(self, tab) -> bool:
+        """Whether a background tab may be frozen or discarded at all."""
+        # DevTools and the pages they inspect must stay responsive.
+        if getattr(tab, "is_devtools", False) or getattr(tab, "_devtools_tab", None) is not None:
+            return False
+        if getattr(tab, "_fullscreen", False):
+            return False
+
+        page = tab.web_view.page()
+        if page.recentlyAudible():
+            return False
+        if self._mw._page_has_active_download(page):
+            return False
+        return True
+
+    def _can_freeze(self, tab) -> bool:
+        if tab.web_view.page().lifecycleState() != QWebEnginePage.LifecycleState.Active:
+            return False
+        return self.can_suspend(tab)
+
+    def _sweep(self) -> None:
+        if self.idle_secs <= 0:
+            return
+
+        now = time.monotonic()
+        tabs = self._mw.tabs
+        current = tabs.currentWidget()
+        for i in range(tabs.count()):
+            tab = tabs.widget(i)
+            if tab is current or not hasattr(tab, "web_view"):
+                continue
+            if now - getattr(tab, "_last_active", now) < self.idle_secs:
+                continue
+            try:
+                if self._can_freeze(tab):
+                    tab.web_view.page().setLifecycleState(QWebEnginePage.LifecycleState.Frozen)
+            except Exception as e:
+                print(f"Failed to freeze tab {i}: {e}")
+
+
+class TabMemoryGovernor(QObject):
+    """Discard least-recently-used background tabs when renderers use too much memory.
+
+    Every sample the resident size of each tab's renderer process is measured
+    (a renderer shared by several tabs is split evenly between them). While the
+    total is above ``budget_mb``, the background tab that was active longest ago
+    is moved to the Discarded lifecycle state. Its title, icon and URL stay in the
+    tab strip and it reloads when selected again.
+    """
+
+    SAMPLE_INTERVAL_MS = 15000
+
+    def __init__(self, main_window, scheduler: TabLifecycleScheduler, budget_mb: int = 0, parent=None):
+        super().__init__(parent)
+        self._mw = main_window
+        self._scheduler = scheduler
+        self.budget_mb = 0
+        self.set_budget_mb(budget_mb)
+        self._warned_unmeasurable = False
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.SAMPLE_INTERVAL_MS)
+        self._timer.timeout.connect(self._sample)
+        self._timer.start()
+
+    def set_budget_mb(self, mb: int) -> None:
+        self.budget_mb = max(0, int(mb or 0))
+
+    def tab_footprints(self) -> dict:
+        """Map each live tab widget to its share of renderer memory, in bytes."""
+        tabs_by_pid: dict[int, list] = {}
+        tabs = self._mw.tabs
+        for i in range(tabs.count()):
+            tab = tabs.widget(i)
+            if not hasattr(tab, "web_view"):
+                continue
+            pid = int(tab.web_view.page().renderProcessPid() or 0)
+            if pid > 0:
+                tabs_by_pid.setdefault(pid, []).append(tab)
+
+        footprints = {}
+        for pid, sharing in tabs_by_pid.items():
+            share = _process_rss_bytes(pid) // len(sharing)
+            for tab in sharing:
+                tab._renderer_bytes = share
+                footprints[tab] = share
+        return footprints
+
+    def discard(self, tab) -> None:
+        page = tab.web_view.page()
+        # Remember what the tab strip shows; a discarded page reports an empty document.
+        tab._discarded_url = tab.web_view.url()
+        page.setLifecycleState(QWebEnginePage.LifecycleState.Discarded)
+
+    def _sample(self) -> None:
+        if self.budget_mb <= 0:
+            return
+
+        footprints = self.tab_footprints()
+        total = sum(footprints.values())
+        if total == 0:
+            if footprints and not self._warned_unmeasurable:
+                print("Tab memory governor: renderer memory can't be measured here (install psutil)")
+                self._warned_unmeasurable = True
+            return
+
+        budget = self.budget_mb * 1024 * 1024
+        if total <= budget:
+            return
+
+        current = self._mw.tabs.currentWidget()
+        candidates = sorted(
+            (tab for tab in footprints if tab is not current),
+            key=lambda t: getattr(t, "_last_active", 0.0),
+        )
+        for tab in candidates:
+            if total <= budget:
+                break
+            try:
+                if not self._scheduler.can_suspend(tab):
+                    continue
+                self.discard(tab)
+                total -= footprints[tab]
+            except Exception as e:
+                print(f"Failed to discard tab: {e}")
+
+
+class PreconnectPredictor(QObject):
+    """Speculative DNS-prefetch/preconnect hints for likely next navigations.
+
+    A link hovered for HOVER_DWELL_MS, or a confident omnibox match, gets
+    ``<link rel=dns-prefetch>`` and ``<link rel=preconnect>`` for its origin, so
+    Chromium resolves and handshakes with the host before the click (the socket
+    pool is shared by the whole profile). A hovered link's hint goes into the page
+    it is on, which already knows the link. Omnibox matches come from the user's
+    history and typing, so they are never put into a site's DOM; they go into a
+    private blank page that no site can see. Each origin is hinted at most once
+    per HINT_TTL_SECS, and a token bucket caps the overall rate.
+
+    User navigations are matched against recent hints. When the page has loaded,
+    its Navigation Timing entry gives the connect time (DNS + TCP + TLS) and time
+    to first byte, and hinted and unhinted navigations are compared in the log.
+    """
+
+    HOVER_DWELL_MS = 80
+    HINT_TTL_SECS = 10.0  # about how long Chromium keeps an unused preconnected socket
+    BURST = 4
+    HINTS_PER_SEC = 2.0
+    SUMMARY_EVERY = 20
+
+    _HINT_JS = """
+(function(origin) {
+  var head = document.head || document.documentElement;
+  if (!head) return;
+  ['dns-prefetch', 'preconnect'].forEach(function(rel) {
+    var link = document.createElement('link');
+    link.rel = rel;
+    link.href = origin;
+    head.appendChild(link);
+    setTimeout(function() { link.remove(); }, 5000);
+  });
+})(%s);
+"""
+
+    _NAV_TIMING_JS = """
+(function() {
+  var n = performance.getEntriesByType('navigation')[0];
+  if (!n) return null;
+  return {connect: n.connectEnd - n.domainLookupStart, ttfb: n.responseStart - n.startTime};
+})();
+"""
+
+    def __init__(self, enabled: bool = True, parent=None):
+        super().__init__(parent)
+        self.enabled = enabled
+        self._hinted: dict[str, tuple[float, str]] = {}  # origin -> (monotonic time, source)
+        self._tokens = float(self.BURST)
+        self._refilled = time.monotonic()
+        self._pending: dict = {}  # id(page) -> (origin, hint source or None), or None once measured
+        self._private_page = None  # blank page that carries omnibox hints, created on first use
+        self._private_queue: list[str] | None = []  # origins waiting for it to load; None once loaded
+        self._stats = {
+            "hints": 0, "dropped": 0, "navigations": 0, "hits": 0,
+            # Running sums in ms; the counts are "hits" and "navigations" - "hits".
+            "hit_connect": 0.0, "miss_connect": 0.0, "hit_ttfb": 0.0, "miss_ttfb": 0.0,
+        }
+
+        self._hover = None  # (page, url) waiting for the dwell timer
+        self._hover_timer = QTimer(self)
+        self._hover_timer.setSingleShot(True)
+        self._hover_timer.setInterval(self.HOVER_DWELL_MS)
+        self._hover_timer.timeout.connect(self._on_hover_dwell)
+
+    @staticmethod
+    def _origin(url: QUrl) -> str | None:
+        if url.scheme() not in ("http", "https") or not url.host():
+            return None
+        return url.adjusted(QUrl.UrlFormattingOption.RemovePath | QUrl.UrlFormattingOption.RemoveQuery
+                            | QUrl.UrlFormattingOption.RemoveFragment | QUrl.UrlFormattingOption.RemoveUserInfo
+                            ).toString().rstrip("/")
+
+    # -- hints --
+
+    def link_hovered(self, page, url: str) -> None:
+        if not self.enabled:
+            return
+        if not url:
+            self._hover_timer.stop()
+            self._hover = None
+            return
+        self._hover = (page, url)
+        self._hover_timer.start()
+
+    def _on_hover_dwell(self) -> None:
+        if self._hover is not None:
+            page, url = self._hover
+            self._hover = None
+            self.hint(page, QUrl(url), "hover")
+
+    def omnibox_match(self, page, typed: str, suggestions: list[str]) -> None:
+        """Hint the top suggestion if the typed text is a prefix of its host."""
+        if not self.enabled or not suggestions:
+            return
+        typed = re.sub(r"^[a-z]+://", "", typed.strip().lower())
+        if len(typed) < 3 or " " in typed:
+            return
+        url = QUrl(suggestions[0])
+        host = url.host().lower()
+        if host.startswith(typed) or host.removeprefix("www.").startswith(typed):
+            self.hint(page, url, "omnibox")
+
+    def hint(self, page, url: QUrl, source: str) -> bool:
+        origin = self._origin(url)
+        if origin is None or page is None or self._origin(page.url()) == origin:
+            return False
+        now = time.monotonic()
+        last = self._hinted.get(origin)
+        if last is not None and now - last[0] < self.HINT_TTL_SECS:
+            return False
+
+        self._tokens = min(self.BURST, self._tokens + (now - self._refilled) * self.HINTS_PER_SEC)
+        self._refilled = now
+        if self._tokens < 1.0:
+            self._stats["dropped"] += 1
+            return False
+        self._tokens -= 1.0
+
+        if len(self._hinted) > 256:
+            self._hinted = {o: h for o, h in self._hinted.items() if now - h[0] < self.HINT_TTL_SECS}
+        self._hinted[origin] = (now, source)
+        self._stats["hints"] += 1
+        if source == "hover":
+            page.runJavaScript(self._HINT_JS % json.dumps(origin), _SCRIPT_WORLD)
+        else:
+            self._hint_privately(origin)
+        return True
+
+    def _hint_privately(self, origin: str) -> None:
+        if self._private_page is None:
+            self._private_page = QWebEnginePage(_get_persistent_profile(), self)
+            self._private_page.loadFinished.connect(self._on_private_page_loaded)
+            self._private_page.setHtml("<!DOCTYPE html><html><head></head><body></body></html>")
+        if self._private_queue is not None:
+            self._private_queue.append(origin)
+        else:
+            self._private_page.runJavaScript(self._HINT_JS % json.dumps(origin), _SCRIPT_WORLD)
+
+    def _on_private_page_loaded(self, ok: bool) -> None:
+        queued, self._private_queue = self._private_queue or [], None
+        for origin in queued:
+            self._private_page.runJavaScript(self._HINT_JS % json.dumps(origin), _SCRIPT_WORLD)
+
+    # -- measurement --
+
+    def navigation_started(self, page, url: QUrl) -> None:
+        """Record a user-initiated main-frame navigation (link click or typed URL)."""
+        origin = self._origin(url)
+        if origin is None:
+            return
+        hint = self._hinted.get(origin)
+        source = hint[1] if hint is not None and time.monotonic() - hint[0] < self.HINT_TTL_SECS else None
+        page_id = id(page)
+        if page_id not in self._pending:
+            # A tab closed mid-navigation never reports loadFinished; its entry goes with the page.
+            page.destroyed.connect(lambda _obj=None, page_id=page_id: self._pending.pop(page_id, None))
+        self._pending[page_id] = (origin, source)
+
+    def load_finished(self, page, ok: bool) -> None:
+        pending = self._pending.get(id(page))
+        if pending is None:
+            return
+        self._pending[id(page)] = None
+        if not ok:
+            return
+        origin, source = pending
+        # A redirect to another origin means the hinted connection wasn't the one measured.
+        if self._origin(page.url()) != origin:
+            return
+        page.runJavaScript(self._NAV_TIMING_JS, lambda timing: self._record(source, timing))
+
+    def _record(self, source, timing) -> None:
+        if not isinstance(timing, dict):
+            return
+        stats = self._stats
+        stats["navigations"] += 1
+        kind = "hit" if source else "miss"
+        if source:
+            stats["hits"] += 1
+        stats[f"{kind}_connect"] += max(0.0, float(timing.get("connect") or 0.0))
+        stats[f"{kind}_ttfb"] += max(0.0, float(timing.get("ttfb") or 0.0))
+        if stats["navigations"] % self.SUMMARY_EVERY == 0:
+            self.log_summary()
+
+    def summary(self) -> dict:
+        stats = self._stats
+        misses = stats["navigations"] - stats["hits"]
+
+        def mean(key):
+            count = stats["hits"] if key.startswith("hit_") else misses
+            return stats[key] / count if count else None
+
+        hit_connect, miss_connect = mean("hit_connect"), mean("miss_connect")
+        return {
+            "hints": stats["hints"],
+            "dropped": stats["dropped"],
+            "navigations": stats["navigations"],
+            "hits": stats["hits"],
+            "hit_rate": stats["hits"] / stats["navigations"] if stats["navigations"] else None,
+            "hit_connect_ms": hit_connect,
+            "miss_connect_ms": miss_connect,
+            "hit_ttfb_ms": mean("hit_ttfb"),
+            "miss_ttfb_ms": mean("miss_ttfb"),
+            "saved_ms": miss_connect - hit_connect if hit_connect is not None and miss_connect is not None else None,
+        }
+
+    def log_summary(self) -> None:
+        s = self.summary()
+        if not s["navigations"]:
+            return
+
+        def ms(value):
+            return "-" if value is None else f"{value:.0f} ms"
+
+        print(
+            f"Preconnect: {s['hits']}/{s['navigations']} navigations hinted ({s['hit_rate']:.0%}), "
+            f"{s['hints']} hints ({s['dropped']} rate-limited); "
+            f"connect {ms(s['hit_connect_ms'])} hinted vs {ms(s['miss_connect_ms'])} unhinted, "
+            f"TTFB {ms(s['hit_ttfb_ms'])} vs {ms(s['miss_ttfb_ms'])}, ~{ms(s['saved_ms'])} saved per hit"
+        )
 
 
 class MainWindow(QMainWindow):
+    # Emitted from a worker thread with the HTTP cache size in bytes (see _refresh_cache_size)
+    cache_size_measured = pyqtSignal(object)
+
     def __init__(self):
         super().__init__()
         self.current_theme = "dark"
         self.web_dark_mode = False
 
-        # Bookmarks are persisted as text files in ./flow-bookmarks (bk1.txt, bk2.txt, ...)
-        # Each file contains a single URL.
-        self.bookmarks = []
-        self._load_bookmarks_from_disk()
+        self.settings = self._load_settings()
+        # Cache/cookie policy has to be set before the first page uses the profile.
+        profile = _get_persistent_profile()
+        _apply_profile_policy(profile, self.settings)
+        self._cache_size_label = None
+        self.cache_size_measured.connect(self._on_cache_size_measured)
+        if hasattr(profile, "clearHttpCacheCompleted"):  # Qt 6.7+
+            profile.clearHttpCacheCompleted.connect(self._refresh_cache_size)
+
+        # Background tab freezing (see TabLifecycleScheduler)
+        self.tab_scheduler = TabLifecycleScheduler(
+            self, idle_secs=self.settings.get("tab_freeze_idle_secs", 0), parent=self
+        )
+        self.memory_governor = TabMemoryGovernor(
+            self, self.tab_scheduler, budget_mb=self.settings.get("tab_memory_budget_mb", 0), parent=self
+        )
 
-        self.history = []
-        self.downloads = []  # list[dict] (see _on_download_requested)
+        # Bookmarks are persisted in ./flow-bookmarks/bookmarks.jsonl (see BookmarkStore).
+        self.bookmark_store = BookmarkStore(self._bookmarks_dir())
+        self.bookmarks = self.bookmark_store.bookmarks()
+
+        # Browsing history lives in ./flow-history/history.sqlite3 (see HistoryStore)
+        self.history_store = HistoryStore(self._history_db_path())
+
+        # Live cookies, mirrored to ./flow-cookies/cookies.json (see CookieJar)
+        self.cookie_jar = CookieJar(
+            self._cookies_storage_path(), _get_persistent_profile().cookieStore(), self,
+            persist=self.settings.get("persistent_cookies") != "session",
+        )
+        self.downloads = DownloadRegistry()  # dict entries (see _on_download_requested)
+        self.downloads_model = DownloadsModel(self, self)
+
+        # Concurrency and bandwidth limits for downloads (see DownloadScheduler)
+        self.download_scheduler = DownloadScheduler(
+            self.settings.get("max_concurrent_downloads", 3),
+            self.settings.get("max_downloads_per_host", 2),
+            self.settings.get("download_bandwidth_kbps", 0),
+            self,
+        )
+        self.download_scheduler.started.connect(self._note_download_progress)
 
         self.downloads_list = None
         self._downloads_dialog = None
+        self.history_list = None
+
+        # Unique names for new files in download directories
+        self.download_names = DownloadNameAllocator(self)
+
+        # Which navigations turn into downloads (see DownloadDecisionCache)
+        self.download_decisions = DownloadDecisionCache()
+
+        # One WebChannel and bridge object for all pages (see JsBridge)
+        self.web_channel = QWebChannel(self)
+        self.js_bridge = JsBridge(self, self)
+        self.web_channel.registerObject("flowBridge", self.js_bridge)
+
+        # Blob downloads streamed from pages over the WebChannel
+        self.blob_writer = BlobStreamWriter(self)
+        self.blob_writer.progress.connect(self._on_blob_progress)
+        self.blob_writer.finished.connect(self._on_blob_finished)
+
+        # "Save Page as HTML" in complete mode (see PageAssetSaver)
+        self.page_saver = PageAssetSaver(self)
+        self.page_saver.progress.connect(self._on_page_save_progress)
+        self.page_saver.finished.connect(self._on_page_save_finished)
+        self._page_saves: dict[str, Path] = {}
+
+        # Large HTTP downloads fetched over parallel range requests
+        self.segmented_downloader = SegmentedDownloader(self.download_scheduler.limiter, self)
+        self.segmented_downloader.progress.connect(self._on_segmented_progress)
+        self.segmented_downloader.finished.connect(self._on_segmented_finished)
+
+        # Hashing, checksum verification and unpacking of finished downloads
+        self.post_processor = DownloadPostProcessor(self)
+        self.post_processor.stage.connect(self._on_post_process_stage)
+        self.post_processor.finished.connect(self._on_post_process_finished)
+
+        # Download entries survive restarts in ./flow-downloads/downloads.json (see DownloadStateStore)
+        self.download_store = DownloadStateStore(self._downloads_state_path(), self._download_records, self)
+        for record in self.download_store.load():
+            self.downloads_model.append(self._download_entry_from_record(record))
+        self.downloads_model.rowsInserted.connect(self.download_store.mark_dirty)
+        self.downloads_model.rowsRemoved.connect(self.download_store.mark_dirty)
+
+        # Speculative preconnects for hovered links / omnibox matches (see PreconnectPredictor)
+        self.preconnect = PreconnectPredictor(bool(self.settings.get("preconnect_hints", True)), self)
 
         # Hook downloads from the persistent profile (used by all web pages).
         _get_persistent_profile().downloadRequested.connect(self._on_download_requested)
+        _CONTENT_BLOCKER.enabled = bool(self.settings.get("content_blocking", True))
         
         self.setWindowTitle("Flow Browser")
         self.setGeometry(100, 100, 1200, 800)
@@ -126,31 +4360,10 @@ class MainWindow(QMainWindow):
         button_layout.setContentsMargins(0, 0, 0, 0)
         button_layout.setSpacing(2)  # Reduced spacing between buttons
 
-        # App menu (shown from the "..." button on the right)
+        # App menu (shown from the "..." button on the right); filled in on first open
         self.app_menu = QMenu(self)
-
-        # Former "File" actions
-        self.app_menu.addAction("New Tab", self.add_new_tab)
-        self.app_menu.addAction("Close Tab", self.close_current_tab)
-        self.app_menu.addAction("Save Page as HTML", self.save_page_as_html)
-        self.app_menu.addAction("Download current URL", self.download_current_url)
-        self.app_menu.addSeparator()
-
-        # Former "View" actions
-        self.app_menu.addAction("Bookmarks", self.show_bookmarks)
-        self.app_menu.addAction("History", self.show_history)
-        self.app_menu.addAction("Downloads", self.show_downloads)
-        self.app_menu.addAction("Cookies", self.show_cookies)
-        self.app_menu.addAction("Inspect", self.open_devtools)
-        self.app_menu.addAction("Settings", self.show_settings)
-        self.app_menu.addAction("Offline Games", self.open_offline_games)
-        self.app_menu.addSeparator()
-
-        # Proxy Menu
-        self.proxy_menu = self.app_menu.addMenu("Proxy")
-        self.enable_proxy_action = QAction("Enable Proxy", self, checkable=True)
-        self.proxy_menu.addAction(self.enable_proxy_action)
-        self.proxy_menu.addAction("Proxy Settings...", self.show_proxy_settings_dialog)
+        self.app_menu.aboutToShow.connect(self._build_app_menu)
+        self.enable_proxy_action = None
 
         self.new_tab_btn = QPushButton("+")
         self.new_tab_btn.setToolTip("New Tab (Ctrl+T)")
@@ -192,6 +4405,17 @@ class MainWindow(QMainWindow):
         self.url_bar = QLineEdit()
         self.url_bar.setProperty("chromeOmnibox", True)
         self.url_bar.returnPressed.connect(self.load_url)
+        self.url_bar.textEdited.connect(self._update_omnibox_completions)
+
+        # Frecency-ranked suggestions from history and bookmarks (see OmniboxIndex)
+        self.omnibox_index = OmniboxIndex()
+        self._omnibox_model = QStringListModel(self)
+        self._omnibox_completer = QCompleter(self._omnibox_model, self)
+        self._omnibox_completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self._omnibox_completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self.url_bar.setCompleter(self._omnibox_completer)
+        # Keyboard selection is followed by returnPressed; mouse clicks are not.
+        self._omnibox_completer.popup().clicked.connect(lambda _index: self.load_url())
         top_layout.addWidget(self.url_bar, 3)  # URL bar takes 75%
 
         # Menu button on the right
@@ -211,6 +4435,7 @@ class MainWindow(QMainWindow):
         self.tabs.setTabsClosable(True)
         self.tabs.tabCloseRequested.connect(self.close_tab)
         self.tabs.currentChanged.connect(self.on_tab_changed)
+        self.tab_registry = TabRegistry(self.tabs)
         layout.addWidget(self.tabs)
 
         self.status_bar = QStatusBar()
@@ -220,10 +4445,13 @@ class MainWindow(QMainWindow):
         self.progress_bar.setVisible(False)
         self.status_bar.addPermanentWidget(self.progress_bar)
         
-        # Add initial tab
-        self.add_new_tab()
+        # apply_theme() also applies the chrome stylesheet.
         self.apply_theme()
-        self.apply_chrome_style()
+
+        # The proxy has to be in place before the first page starts loading.
+        self.proxy_settings = self._load_proxy_settings()
+        if self.proxy_settings.get("enabled", False):
+            self.apply_proxy()
 
         # DevTools / Inspect shortcuts
         self._inspect_shortcut_f12 = QShortcut(QKeySequence("F12"), self)
@@ -239,17 +4467,68 @@ class MainWindow(QMainWindow):
         self._new_tab_shortcut.setContext(Qt.ShortcutContext.ApplicationShortcut)
         self._new_tab_shortcut.activated.connect(self.add_new_tab)
 
-        # Proxy setup
-        self.proxy_settings = self._load_proxy_settings()
+        # The first tab (and with it the WebEngine runtime), the omnibox index and
+        # the cookie replay wait until the window has been shown.
+        QTimer.singleShot(0, self._finish_startup)
+
+    def _finish_startup(self):
+        if self.tabs.count() == 0:
+            self.add_new_tab()
+        self.cookie_jar.load()
+        threading.Thread(
+            target=self.omnibox_index.build,
+            args=(self.history_store.iter_visits(), list(self.bookmarks)),
+            name="flow-omnibox-build",
+            daemon=True,
+        ).start()
+
+    def _build_app_menu(self):
+        if self.enable_proxy_action is not None:
+            return
+
+        # Former "File" actions
+        self.app_menu.addAction("New Tab", self.add_new_tab)
+        self.app_menu.addAction("Close Tab", self.close_current_tab)
+        self.app_menu.addAction("Save Page as HTML", self.save_page_as_html)
+        self.app_menu.addAction("Download current URL", self.download_current_url)
+        self.app_menu.addSeparator()
+
+        # Former "View" actions
+        self.app_menu.addAction("Bookmarks", self.show_bookmarks)
+        self.app_menu.addAction("History", self.show_history)
+        self.app_menu.addAction("Downloads", self.show_downloads)
+        self.app_menu.addAction("Cookies", self.show_cookies)
+        self.app_menu.addAction("Clear Cache", self.clear_http_cache)
+        self.app_menu.addAction("Inspect", self.open_devtools)
+        self.app_menu.addAction("Settings", self.show_settings)
+        self.app_menu.addAction("Offline Games", self.open_offline_games)
+        self.app_menu.addSeparator()
+
+        # Proxy Menu
+        self.proxy_menu = self.app_menu.addMenu("Proxy")
+        self.enable_proxy_action = QAction("Enable Proxy", self, checkable=True)
         self.enable_proxy_action.setChecked(self.proxy_settings.get("enabled", False))
         self.enable_proxy_action.triggered.connect(self.toggle_proxy)
-        if self.proxy_settings.get("enabled", False):
-            self.apply_proxy()
+        self.proxy_menu.addAction(self.enable_proxy_action)
+        self.proxy_menu.addAction("Proxy Settings...", self.show_proxy_settings_dialog)
 
-        
+    def closeEvent(self, event):
+        # Commit any queued history writes before the process exits.
+        self.history_store.close()
+        self.cookie_jar.close()
+        # Paused (not cancelled) browser downloads keep their partial files for Resume.
+        for req in list(self.downloads.requests()):
+            try:
+                if req.state() == QWebEngineDownloadRequest.DownloadState.DownloadInProgress:
+                    req.pause()
+            except RuntimeError:
+                continue
+        self.download_store.close()
+        self.post_processor.shutdown()
+        self.page_saver.shutdown()
+        self.preconnect.log_summary()
+        super().closeEvent(event)
 
-        
-    
     def enable_pointer_lock(self):
         self.page = self.tabs.currentWidget().web_view.page()
         self.page.setFullScreenRequested(self.handle_full_screen_requested)
@@ -453,18 +4732,17 @@ class MainWindow(QMainWindow):
         web_view = QWebEngineView()
         web_view.setPage(BrowserPage(self, web_view, opener_page=opener_page))
 
-        # WebChannel bridge (used for blob: downloads triggered by JS download buttons)
-        tab._web_channel = QWebChannel(web_view.page())
-        tab._js_bridge = JsBridge(self, tab)
-        tab._web_channel.registerObject("flowBridge", tab._js_bridge)
-        web_view.page().setWebChannel(tab._web_channel)
+        # Shared WebChannel bridge (used for blob: downloads triggered by JS download buttons)
+        self.js_bridge.attach(web_view.page(), self.web_channel)
         web_view.settings().setAttribute(QWebEngineSettings.WebAttribute.JavascriptEnabled, True)
         web_view.settings().setAttribute(QWebEngineSettings.WebAttribute.AutoLoadImages, True)
         web_view.settings().setAttribute(QWebEngineSettings.WebAttribute.PluginsEnabled, True)
         web_view.settings().setAttribute(QWebEngineSettings.WebAttribute.FullScreenSupportEnabled, True)
         layout.addWidget(web_view)
         tab.web_view = web_view  # Store reference
+        self.tab_scheduler.touch(tab)
         index = self.tabs.addTab(tab, "New Tab")
+        self.tab_registry.register(tab)
         self.tabs.setCurrentIndex(index)
         web_view.load(QUrl(url))
         web_view.setFocus()
@@ -476,7 +4754,7 @@ class MainWindow(QMainWindow):
         
         # Handle new windows (like popups or new tabs from links)
         web_view.page().newWindowRequested.connect(self.handle_new_window)
-        web_view.page().fullScreenRequested.connect(self.handle_full_screen)
+        web_view.page().fullScreenRequested.connect(lambda request, t=tab: self.handle_full_screen(request, t))
         web_view.page().featurePermissionRequested.connect(self.handle_feature_permission)
         
         # Connect signals
@@ -484,11 +4762,11 @@ class MainWindow(QMainWindow):
         web_view.iconChanged.connect(lambda icon, view=web_view: self.update_tab_icon(icon, view))
         web_view.urlChanged.connect(lambda url, view=web_view: self.update_url_bar(url, view))
         web_view.urlChanged.connect(lambda _url, view=web_view: self.update_nav_buttons(view=view))
-        web_view.loadFinished.connect(self.add_to_history)
-        web_view.loadFinished.connect(lambda _ok, view=web_view: self._install_blob_download_hook(view))
+        web_view.loadFinished.connect(lambda ok, view=web_view: self.add_to_history(ok, view))
         web_view.loadStarted.connect(lambda: self.status_bar.showMessage("Loading..."))
         web_view.loadFinished.connect(lambda: self.status_bar.clearMessage())
-        web_view.page().linkHovered.connect(self.on_link_hovered)
+        web_view.page().linkHovered.connect(lambda url, page=web_view.page(): self.on_link_hovered(url, page))
+        web_view.loadFinished.connect(lambda ok, page=web_view.page(): self.preconnect.load_finished(page, ok))
         
         return web_view
     
@@ -518,15 +4796,15 @@ class MainWindow(QMainWindow):
     def open_offline_games(self):
         """Show a dialog of available offline games (folders in flow-offlinegames) and open selection."""
         try:
-            base_dir = Path(__file__).resolve().parent
-            games_root = base_dir / "flow-offlinegames"
+            index = _OFFLINE_GAMES.index
+            games_root = index.root
             if not games_root.exists():
                 QMessageBox.information(self, "Offline Games", f"No offline games folder found at:\n{games_root}")
                 return
 
-            # List immediate subfolders as games
-            game_dirs = [p for p in games_root.iterdir() if p.is_dir()]
-            if not game_dirs:
+            # Immediate subfolders are games (see OfflineGameIndex)
+            games = index.games()
+            if not games:
                 QMessageBox.information(self, "Offline Games", "No games found in flow-offlinegames.")
                 return
 
@@ -539,9 +4817,8 @@ class MainWindow(QMainWindow):
             vbox.addWidget(info)
 
             list_widget = QListWidget()
-            sorted_dirs = sorted(game_dirs, key=lambda p: p.name.lower())
-            for d in sorted_dirs:
-                list_widget.addItem(d.name)
+            for game in games:
+                list_widget.addItem(game["name"])
             if list_widget.count() > 0:
                 list_widget.setCurrentRow(0)
             vbox.addWidget(list_widget)
@@ -553,30 +4830,16 @@ class MainWindow(QMainWindow):
             btn_row.addWidget(cancel_btn)
             vbox.addLayout(btn_row)
 
-            def pick_entry_html(game_path: Path) -> Path | None:
-                index_root = game_path / "index.html"
-                if index_root.exists():
-                    return index_root
-                # Look for index.html anywhere under the game directory
-                for p in game_path.rglob("index.html"):
-                    return p
-                # Fallback: any html under the game directory
-                for p in game_path.rglob("*.html"):
-                    return p
-                return None
-
             def launch_selected():
                 row = list_widget.currentRow()
                 if row < 0:
                     return
-                game_path = sorted_dirs[row]
-                html = pick_entry_html(game_path)
-                if html is None:
-                    QMessageBox.warning(self, "Offline Games", f"No HTML entry file (e.g., index.html) found in:\n{game_path}")
+                game = games[row]
+                if game["entry"] is None:
+                    QMessageBox.warning(self, "Offline Games", f"No HTML entry file (e.g., index.html) found in:\n{game['path']}")
                     return
-                url = QUrl.fromLocalFile(str(html))
-                self.add_new_tab(url.toString())
-                self.tabs.setTabText(self.tabs.currentIndex(), game_path.name)
+                self.add_new_tab(index.entry_url(game).toString())
+                self.tabs.setTabText(self.tabs.currentIndex(), game["name"])
                 dialog.accept()
 
             open_btn.clicked.connect(launch_selected)
@@ -588,10 +4851,11 @@ class MainWindow(QMainWindow):
             QMessageBox.critical(self, "Offline Games", f"Failed to list/open offline games:\n{e}")
 
     def save_page_as_html(self):
-        """Save the currently displayed page to a .html file (DOM only).
+        """Save the currently displayed page to a .html file.
 
-        Note: This exports the current DOM via QWebEnginePage.toHtml(). It does not bundle
-        external assets (images/css/js) like an archive format would.
+        "Web Page, Complete" also saves the page's images, stylesheets, scripts and
+        media into a ``<name>_files`` folder (see PageAssetSaver). "HTML Only"
+        exports the current DOM via QWebEnginePage.toHtml().
         """
         current_tab = self.tabs.currentWidget()
         if not current_tab or not hasattr(current_tab, "web_view"):
@@ -601,15 +4865,21 @@ class MainWindow(QMainWindow):
         default_name = f"{self._sanitize_filename(title)}.html"
         default_path = str(self._downloads_dir() / default_name)
 
-        path, _filter = QFileDialog.getSaveFileName(
+        complete_filter = "Web Page, Complete (*.html)"
+        path, selected_filter = QFileDialog.getSaveFileName(
             self,
             "Save Page as HTML",
             default_path,
-            "HTML Files (*.html);;All Files (*.*)",
+            f"{complete_filter};;Web Page, HTML Only (*.html);;All Files (*.*)",
         )
         if not path:
             return
 
+        page = current_tab.web_view.page()
+        if selected_filter == complete_filter:
+            self._save_page_complete(page, Path(path))
+            return
+
         def _write_html(html: str):
             try:
                 with open(path, "w", encoding="utf-8") as f:
@@ -617,48 +4887,130 @@ class MainWindow(QMainWindow):
             except Exception as e:
                 QMessageBox.critical(self, "Save Failed", f"Could not save file:\n{e}")
 
-        current_tab.web_view.page().toHtml(_write_html)
+        page.toHtml(_write_html)
 
-    def _save_blob_data_url(self, data_url: str, filename: str):
-        try:
-            if not data_url.startswith("data:"):
-                raise ValueError("Expected a data: URL")
+    def _save_page_complete(self, page: QWebEnginePage, path: Path):
+        if not self._proxy_allows_direct():
+            # Assets can't be fetched through a SOCKS proxy here; Chromium's own saver can.
+            page.save(str(path), QWebEngineDownloadRequest.SavePageFormat.CompleteHtmlSaveFormat)
+            return
 
-            # Split at the first comma.
-            header, b64 = data_url.split(",", 1)
-            if ";base64" not in header:
-                raise ValueError("Expected base64 data")
+        page_url = page.url().toString()
+
+        def _on_serialized(result):
+            if not isinstance(result, dict) or "html" not in result:
+                QMessageBox.critical(self, "Save Failed", "Could not read the page.")
+                return
+            urls = [str(u) for u in result.get("urls") or []]
+            headers = {url: self._direct_request_headers(QUrl(url), page_url) for url in urls}
+            default_headers = {"User-Agent": _get_persistent_profile().httpUserAgent()}
+            save_id = self.page_saver.start(
+                path, result["html"], urls, headers, default_headers, self._direct_proxy_url(),
+                cookies_for=self._direct_cookie_source(),
+            )
+            self._page_saves[save_id] = path
+            self.status_bar.showMessage(f"Saving page: {len(urls)} files...")
+
+        page.runJavaScript(_SAVE_PAGE_JS, _SCRIPT_WORLD, _on_serialized)
+
+    def _on_page_save_progress(self, save_id: str, done: int, total: int):
+        if save_id in self._page_saves:
+            self.status_bar.showMessage(f"Saving page: {done}/{total} files")
+
+    def _on_page_save_finished(self, save_id: str, failed: int):
+        path = self._page_saves.pop(save_id, None)
+        if path is None:
+            return
+        note = f" ({failed} files could not be fetched)" if failed else ""
+        self.status_bar.showMessage(f"Page saved: {path}{note}", 5000)
+        print(f"Page saved: {path}{note}")
 
+    def _begin_blob_download(self, filename: str, size: int, mime: str, page: QWebEnginePage | None = None) -> str:
+        """Start a streamed blob download; returns the transfer id ("" on failure)."""
+        try:
             directory = self._downloads_dir()
             directory.mkdir(parents=True, exist_ok=True)
 
-            safe_name = filename or "download"
-            safe_name = self._unique_download_filename(directory, safe_name)
+            safe_name = self._unique_download_filename(directory, filename or "download")
             out_path = directory / safe_name
+            transfer_id = self.blob_writer.begin(out_path)
+        except Exception as e:
+            print(f"Blob save failed: {e}")
+            return ""
+
+        self.downloads_model.append(
+            {
+                "request": None,
+                "blob_id": transfer_id,
+                "filename": safe_name,
+                "url": "blob:",
+                "page_url": page.url().toString() if page is not None else "",
+                "mime": mime,
+                "path": str(out_path),
+                "received": 0,
+                "total": max(0, size),
+                "state": None,
+                "completed": False,
+                "status": "In Progress",
+            }
+        )
+        return transfer_id
 
-            import base64
+    def _blob_entry(self, transfer_id: str) -> dict | None:
+        return self.downloads.by_blob(transfer_id)
 
-            data = base64.b64decode(b64)
-            with open(out_path, "wb") as f:
-                f.write(data)
+    def _on_blob_progress(self, transfer_id: str, written: int):
+        d = self._blob_entry(transfer_id)
+        if d is not None:
+            d["received"] = written
+            self._note_download_progress(d)
 
-            self.downloads.append(
-                {
-                    "request": None,
-                    "filename": safe_name,
-                    "url": "blob:",
-                    "path": str(out_path),
-                    "received": len(data),
-                    "total": len(data),
-                    "state": None,
-                    "completed": True,
-                    "status": "Completed",
-                }
-            )
-            self._refresh_downloads_list()
-            print(f"Blob saved: {out_path}")
-        except Exception as e:
-            print(f"Blob save failed: {e}")
+    def _on_blob_finished(self, transfer_id: str, error: str):
+        d = self._blob_entry(transfer_id)
+        if d is None:
+            return
+        d["completed"] = True
+        d["status"] = f"Failed: {error}" if error else "Completed"
+        if error:
+            self._release_download_name(d)  # the writer deleted the partial file
+        else:
+            print(f"Blob saved: {d['path']}")
+            self._post_process_download(d)
+        self._note_download_progress(d)
+
+    def _on_segmented_progress(self, job_id: str, received):
+        d = self.downloads.by_job(job_id)
+        if d is not None:
+            d["received"] = int(received)
+            self._note_download_progress(d)
+
+    def _on_segmented_finished(self, job_id: str, error: str):
+        d = self.downloads.by_job(job_id)
+        if d is None:
+            self.segmented_downloader.forget(job_id)
+            return
+        d["completed"] = True
+        if not error:
+            d["status"] = "Completed"
+            print(f"Download finished: url={d.get('url')} ({d.get('segments')} connections)")
+            self._post_process_download(d)
+        elif error == "Cancelled":
+            d["status"] = "Cancelled"
+            try:
+                os.remove(d["path"])
+            except OSError:
+                pass
+            self._release_download_name(d)
+        else:
+            # Keep the partial file; Resume continues from the segment offsets.
+            d["status"] = f"Interrupted: {error}"
+            if not error.startswith("File changed"):
+                d["resume_state"] = self.segmented_downloader.state(job_id)
+            print(f"Download interrupted: url={d.get('url')} error={error}")
+        self.downloads.set_job(d, None)
+        self.segmented_downloader.forget(job_id)
+        self.download_scheduler.release(d)
+        self._note_download_progress(d)
 
     def _download_blob_from_page(self, page: QWebEnginePage, blob_url: str):
         # Attempt to resolve a filename from any anchor pointing at the blob.
@@ -677,168 +5029,24 @@ class MainWindow(QMainWindow):
     return 'download';
   }
 
-  function doFetch(flowBridge) {
+  window.__flowWithBridge(function(bridge) {
     const filename = pickFilename();
     fetch(blobUrl).then(r => r.blob()).then(blob => {
-      const reader = new FileReader();
-      reader.onloadend = function() {
-        try {
-          flowBridge.saveBlob(reader.result, filename);
-        } catch (err) {
-          flowBridge.saveBlobError(String(err));
-        }
-      };
-      reader.onerror = function() {
-        flowBridge.saveBlobError('FileReader failed');
-      };
-      reader.readAsDataURL(blob);
+      window.__flowStreamBlob(bridge, blob, filename);
     }).catch(err => {
-      flowBridge.saveBlobError(String(err));
-    });
-  }
-
-  function setupWebChannelAndFetch() {
-    if (window.flowBridge) {
-      doFetch(window.flowBridge);
-      return;
-    }
-    if (!window.qt || !qt.webChannelTransport) {
-      console.log('Flow: qt.webChannelTransport not available');
-      return;
-    }
-    new QWebChannel(qt.webChannelTransport, function(channel) {
-      window.flowBridge = channel.objects.flowBridge;
-      doFetch(window.flowBridge);
+      bridge.saveBlobError(window.__flowPageId || 0, String(err));
     });
-  }
-
-  if (typeof QWebChannel === 'undefined') {
-    const s = document.createElement('script');
-    s.src = 'qrc:///qtwebchannel/qwebchannel.js';
-    s.onload = setupWebChannelAndFetch;
-    document.documentElement.appendChild(s);
-  } else {
-    setupWebChannelAndFetch();
-  }
+  });
 })();
 """
 
-        js = js.replace("%BLOB_URL%", repr(blob_url))
+        # The bridge and __flowStreamBlob come from the profile script (same world).
+        js = js.replace("%BLOB_URL%", json.dumps(blob_url))
         try:
-            page.runJavaScript(js)
+            page.runJavaScript(js, _SCRIPT_WORLD)
         except Exception as e:
             print(f"Failed to fetch blob from page: {e}")
 
-    def _install_blob_download_hook(self, web_view: QWebEngineView):
-        # Inject a click handler that captures <a href="blob:..." download="..."> and
-        # streams the blob to Python for saving.
-        js = r"""
-(function() {
-  if (window.__flow_blob_hook_installed) return;
-  window.__flow_blob_hook_installed = true;
-
-  function install() {
-    if (!window.flowBridge) return;
-
-    document.addEventListener('click', function(e) {
-      try {
-        const a = e.target && e.target.closest ? e.target.closest('a') : null;
-        if (!a) return;
-        const href = a.getAttribute('href') || '';
-        if (!href.startsWith('blob:')) return;
-
-        // Prevent the browser's internal handling (which often no-ops in Qt).
-        e.preventDefault();
-        e.stopPropagation();
-
-        const filename = a.getAttribute('download') || a.getAttribute('data-filename') || 'download';
-
-        fetch(href).then(r => r.blob()).then(blob => {
-          const reader = new FileReader();
-          reader.onloadend = function() {
-            try {
-              window.flowBridge.saveBlob(reader.result, filename);
-            } catch (err) {
-              window.flowBridge.saveBlobError(String(err));
-            }
-          };
-          reader.onerror = function() {
-            window.flowBridge.saveBlobError('FileReader failed');
-          };
-          reader.readAsDataURL(blob);
-        }).catch(err => {
-          window.flowBridge.saveBlobError(String(err));
-        });
-      } catch (err) {
-        if (window.flowBridge) window.flowBridge.saveBlobError(String(err));
-      }
-    }, true);
-  }
-
-  // Ensure qwebchannel.js is available and bind window.flowBridge.
-  function setupWebChannel() {
-    if (window.flowBridge) {
-      install();
-      return;
-    }
-    if (!window.qt || !qt.webChannelTransport) {
-      return;
-    }
-    new QWebChannel(qt.webChannelTransport, function(channel) {
-      window.flowBridge = channel.objects.flowBridge;
-      install();
-    });
-  }
-
-  if (typeof QWebChannel === 'undefined') {
-    const s = document.createElement('script');
-    s.src = 'qrc:///qtwebchannel/qwebchannel.js';
-    s.onload = setupWebChannel;
-    document.documentElement.appendChild(s);
-  } else {
-    setupWebChannel();
-  }
-})();
-"""
-        try:
-            web_view.page().runJavaScript(js)
-        except Exception as e:
-            print(f"Failed to install blob hook: {e}")
-
-    def _looks_like_download_url(self, url: QUrl) -> bool:
-        # Heuristic. There is no perfect way to detect "download buttons" without
-        # site-specific logic or deeper JS integration.
-        path = (url.path() or "").lower()
-        query = (url.query() or "").lower()
-
-        exts = (
-            ".zip",
-            ".7z",
-            ".rar",
-            ".tar",
-            ".gz",
-            ".bz2",
-            ".xz",
-            ".jar",
-            ".exe",
-            ".msi",
-            ".apk",
-            ".dmg",
-            ".iso",
-            ".pdf",
-        )
-
-        if any(path.endswith(ext) for ext in exts):
-            return True
-
-        # Common download-ish paths/queries.
-        if "/download" in path or "/downloads" in path:
-            return True
-        if "download" in query:
-            return True
-
-        return False
-
     def download_current_url(self):
         """Force-download the current tab's URL using Chromium's downloader."""
         current_tab = self.tabs.currentWidget()
@@ -852,30 +5060,41 @@ class MainWindow(QMainWindow):
         current_tab.web_view.page().download(url, url.fileName())
     
     def _tab_index_for_view(self, view):
-        for i in range(self.tabs.count()):
-            w = self.tabs.widget(i)
-            if hasattr(w, "web_view") and w.web_view is view:
-                return i
-        return -1
+        return self.tab_registry.index_for_view(view)
 
-    def on_link_hovered(self, url):
+    def on_link_hovered(self, url, page=None):
         self.status_bar.showMessage(url)
+        self.preconnect.link_hovered(page, url)
 
     def on_tab_changed(self, index):
         current_tab = self.tabs.widget(index)
         if not current_tab or not hasattr(current_tab, "web_view"):
             return
 
+        # A frozen tab must be running again before it is shown.
+        self.tab_scheduler.on_tab_activated(current_tab)
+
         # Sync omnibox + nav buttons to the newly selected tab
-        self.url_bar.setText(current_tab.web_view.url().toString())
+        url = current_tab.web_view.url()
+        if url.isEmpty() and getattr(current_tab, "_discarded_url", None) is not None:
+            url = current_tab._discarded_url
+        self.url_bar.setText(url.toString())
         self.update_nav_buttons(view=current_tab.web_view)
 
+    def _is_discarded(self, view) -> bool:
+        return view is not None and view.page().lifecycleState() == QWebEnginePage.LifecycleState.Discarded
+
     def update_tab_title(self, title, view=None):
+        # Keep the old label while discarded; the unloaded page reports an empty title.
+        if not title and self._is_discarded(view):
+            return
         index = self.tabs.currentIndex() if view is None else self._tab_index_for_view(view)
         if index >= 0:
             self.tabs.setTabText(index, title)
 
     def update_tab_icon(self, icon, view=None):
+        if icon.isNull() and self._is_discarded(view):
+            return
         index = self.tabs.currentIndex() if view is None else self._tab_index_for_view(view)
         if index >= 0:
             self.tabs.setTabIcon(index, icon)
@@ -896,14 +5115,18 @@ class MainWindow(QMainWindow):
             self.back_btn.setEnabled(current_tab.web_view.history().canGoBack())
             self.forward_btn.setEnabled(current_tab.web_view.history().canGoForward())
     
-    def add_to_history(self):
-        current_tab = self.tabs.currentWidget()
-        if current_tab:
-            url = current_tab.web_view.url().toString()
-            title = current_tab.web_view.title()
-            from datetime import datetime
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            self.history.append({"url": url, "title": title, "timestamp": timestamp})
+    def add_to_history(self, ok=True, view=None):
+        if view is None:
+            current_tab = self.tabs.currentWidget()
+            if not current_tab or not hasattr(current_tab, "web_view"):
+                return
+            view = current_tab.web_view
+
+        url = view.url().toString()
+        if not ok or not url:
+            return
+        self.history_store.add_visit(url, view.title())
+        self.omnibox_index.add_visit(url, view.title())
     
     def handle_new_window(self, request):
         url = request.requestedUrl()
@@ -921,15 +5144,15 @@ class MainWindow(QMainWindow):
                 print(f"handle_new_window blob error: {e}")
             return
 
-        if url.isValid() and self._looks_like_download_url(url):
-            # Force download instead of opening a new tab.
+        if url.isValid() and self.download_decisions.decide(url) == DownloadDecisionCache.DOWNLOAD:
+            # Known to download (see DownloadDecisionCache): skip the empty tab.
             try:
                 if sender_page is not None:
-                    sender_page.download(url, url.fileName())
+                    sender_page.force_download(url, new_tab=True)
                 else:
                     current_tab = self.tabs.currentWidget()
                     if current_tab and hasattr(current_tab, "web_view"):
-                        current_tab.web_view.page().download(url, url.fileName())
+                        current_tab.web_view.page().force_download(url, new_tab=True)
             except Exception as e:
                 print(f"handle_new_window download error: {e}")
             return
@@ -939,7 +5162,10 @@ class MainWindow(QMainWindow):
         new_view = self.add_new_tab(opener_page=sender_page)
         request.openIn(new_view.page())
     
-    def handle_full_screen(self, request):
+    def handle_full_screen(self, request, tab=None):
+        if tab is not None:
+            # Remembered so the lifecycle scheduler never freezes a fullscreen page.
+            tab._fullscreen = request.toggleOn()
         if request.toggleOn():
             self.showFullScreen()
         else:
@@ -1007,6 +5233,7 @@ class MainWindow(QMainWindow):
             dev_idx = self.tabs.indexOf(devtools)
             if dev_idx >= 0:
                 self.tabs.removeTab(dev_idx)
+                devtools.deleteLater()
 
         # If closing DevTools, clear the linkage on the inspected tab.
         if getattr(tab, "is_devtools", False):
@@ -1014,8 +5241,18 @@ class MainWindow(QMainWindow):
             if inspected is not None and getattr(inspected, "_devtools_tab", None) is tab:
                 inspected._devtools_tab = None
 
-        self.tabs.removeTab(index)
+        # removeTab() leaves the widget (and its renderer) alive, so delete it too.
+        self.tabs.removeTab(self.tabs.indexOf(tab))
+        self.tab_registry.unregister(tab)
+        tab.deleteLater()
     
+    def _update_omnibox_completions(self, text):
+        suggestions = self.omnibox_index.query(text.strip())
+        self._omnibox_model.setStringList(suggestions)
+        current_tab = self.tabs.currentWidget()
+        if current_tab is not None:
+            self.preconnect.omnibox_match(current_tab.web_view.page(), text, suggestions)
+
     def load_url(self):
         url = self.url_bar.text().strip()
         
@@ -1062,15 +5299,245 @@ class MainWindow(QMainWindow):
         self.home_edit = QLineEdit("https://www.startpage.com")
         home_layout.addWidget(self.home_edit)
         layout.addLayout(home_layout)
+
+        # Background tab freezing
+        freeze_layout = QHBoxLayout()
+        freeze_layout.addWidget(QLabel("Freeze background tabs after (s, 0 = never):"))
+        self.freeze_spin = QSpinBox()
+        self.freeze_spin.setRange(0, 24 * 60 * 60)
+        self.freeze_spin.setSingleStep(30)
+        self.freeze_spin.setValue(int(self.settings.get("tab_freeze_idle_secs", 0)))
+        self.freeze_spin.valueChanged.connect(self.change_tab_freeze_setting)
+        freeze_layout.addWidget(self.freeze_spin)
+        layout.addLayout(freeze_layout)
+
+        # Tab memory budget
+        budget_layout = QHBoxLayout()
+        budget_layout.addWidget(QLabel("Tab memory budget (MB, 0 = unlimited):"))
+        self.memory_budget_spin = QSpinBox()
+        self.memory_budget_spin.setRange(0, 1024 * 1024)
+        self.memory_budget_spin.setSingleStep(256)
+        self.memory_budget_spin.setValue(int(self.settings.get("tab_memory_budget_mb", 0)))
+        self.memory_budget_spin.valueChanged.connect(self.change_memory_budget_setting)
+        budget_layout.addWidget(self.memory_budget_spin)
+        layout.addLayout(budget_layout)
+
+        # Speculative preconnect
+        self.preconnect_check = QCheckBox("Preconnect to hovered links and omnibox matches")
+        self.preconnect_check.setChecked(bool(self.settings.get("preconnect_hints", True)))
+        self.preconnect_check.toggled.connect(self.change_preconnect_setting)
+        layout.addWidget(self.preconnect_check)
+
+        # Content blocking
+        self.content_blocking_check = QCheckBox("Block ads and trackers (filter lists in flow-filters)")
+        self.content_blocking_check.setChecked(bool(self.settings.get("content_blocking", True)))
+        self.content_blocking_check.toggled.connect(self.change_content_blocking_setting)
+        layout.addWidget(self.content_blocking_check)
+
+        # HTTP cache
+        cache_layout = QHBoxLayout()
+        cache_layout.addWidget(QLabel("HTTP cache:"))
+        self.cache_type_combo = QComboBox()
+        self.cache_type_combo.addItems(["Disk", "Memory", "None"])
+        self.cache_type_combo.setCurrentText(str(self.settings.get("http_cache_type", "disk")).capitalize())
+        self.cache_type_combo.currentTextChanged.connect(self.change_cache_type_setting)
+        cache_layout.addWidget(self.cache_type_combo)
+        cache_layout.addWidget(QLabel("max (MB, 0 = auto):"))
+        self.cache_size_spin = QSpinBox()
+        self.cache_size_spin.setRange(0, 1024 * 1024)
+        self.cache_size_spin.setSingleStep(64)
+        self.cache_size_spin.setValue(int(self.settings.get("http_cache_max_mb", 0)))
+        self.cache_size_spin.valueChanged.connect(self.change_cache_size_setting)
+        cache_layout.addWidget(self.cache_size_spin)
+        layout.addLayout(cache_layout)
+
+        cache_usage_layout = QHBoxLayout()
+        self._cache_size_label = QLabel("Cache size: measuring...")
+        cache_usage_layout.addWidget(self._cache_size_label)
+        clear_cache_btn = QPushButton("Clear Cache")
+        clear_cache_btn.clicked.connect(self.clear_http_cache)
+        cache_usage_layout.addWidget(clear_cache_btn)
+        layout.addLayout(cache_usage_layout)
+        self._refresh_cache_size()
+
+        # Cookie persistence
+        cookies_layout = QHBoxLayout()
+        cookies_layout.addWidget(QLabel("Cookies:"))
+        self.cookie_policy_combo = QComboBox()
+        self._cookie_policy_labels = {
+            "allow": "Keep persistent cookies",
+            "force": "Keep all cookies (incl. session)",
+            "session": "Forget cookies on exit",
+        }
+        self.cookie_policy_combo.addItems(list(self._cookie_policy_labels.values()))
+        self.cookie_policy_combo.setCurrentText(
+            self._cookie_policy_labels.get(self.settings.get("persistent_cookies"), "Keep persistent cookies")
+        )
+        self.cookie_policy_combo.currentTextChanged.connect(self.change_cookie_policy_setting)
+        cookies_layout.addWidget(self.cookie_policy_combo)
+        layout.addLayout(cookies_layout)
+
+        # Segmented downloads
+        segments_layout = QHBoxLayout()
+        segments_layout.addWidget(QLabel("Connections per large download (1 = off):"))
+        self.download_segments_spin = QSpinBox()
+        self.download_segments_spin.setRange(1, SegmentedDownloader.MAX_WORKERS)
+        self.download_segments_spin.setValue(int(self.settings.get("download_segments", 1)))
+        self.download_segments_spin.valueChanged.connect(self.change_download_segments_setting)
+        segments_layout.addWidget(self.download_segments_spin)
+        layout.addLayout(segments_layout)
+        segments_note = QLabel(
+            "More than 1 re-requests the file outside the browser as a plain GET with cookies: "
+            "downloads that need a POST form, HTTP authentication or a client certificate fail, "
+            "and content blocking doesn't apply."
+        )
+        segments_note.setWordWrap(True)
+        layout.addWidget(segments_note)
+
+        # Download queue
+        queue_layout = QHBoxLayout()
+        queue_layout.addWidget(QLabel("Simultaneous downloads:"))
+        self.max_downloads_spin = QSpinBox()
+        self.max_downloads_spin.setRange(1, 32)
+        self.max_downloads_spin.setValue(int(self.settings.get("max_concurrent_downloads", 3)))
+        self.max_downloads_spin.valueChanged.connect(self.change_download_queue_setting)
+        queue_layout.addWidget(self.max_downloads_spin)
+        queue_layout.addWidget(QLabel("per site:"))
+        self.max_host_downloads_spin = QSpinBox()
+        self.max_host_downloads_spin.setRange(1, 32)
+        self.max_host_downloads_spin.setValue(int(self.settings.get("max_downloads_per_host", 2)))
+        self.max_host_downloads_spin.valueChanged.connect(self.change_download_queue_setting)
+        queue_layout.addWidget(self.max_host_downloads_spin)
+        layout.addLayout(queue_layout)
+
+        bandwidth_layout = QHBoxLayout()
+        bandwidth_layout.addWidget(QLabel("Download bandwidth cap (KB/s, 0 = unlimited):"))
+        self.download_bandwidth_spin = QSpinBox()
+        self.download_bandwidth_spin.setRange(0, 10 * 1024 * 1024)
+        self.download_bandwidth_spin.setSingleStep(256)
+        self.download_bandwidth_spin.setValue(int(self.settings.get("download_bandwidth_kbps", 0)))
+        self.download_bandwidth_spin.valueChanged.connect(self.change_download_queue_setting)
+        bandwidth_layout.addWidget(self.download_bandwidth_spin)
+        layout.addLayout(bandwidth_layout)
+
+        # Post-download processing
+        self.post_process_check = QCheckBox("Hash finished downloads and verify checksum files")
+        self.post_process_check.setChecked(bool(self.settings.get("post_process_downloads", True)))
+        self.post_process_check.toggled.connect(self.change_post_process_setting)
+        layout.addWidget(self.post_process_check)
+        self.extract_archives_check = QCheckBox("Unpack downloaded zip/tar archives")
+        self.extract_archives_check.setChecked(bool(self.settings.get("extract_downloaded_archives", False)))
+        self.extract_archives_check.toggled.connect(self.change_post_process_setting)
+        layout.addWidget(self.extract_archives_check)
         
         dialog.setLayout(layout)
         dialog.exec()
+        self._cache_size_label = None
 
     def change_theme_setting(self, theme):
         self.current_theme = theme.lower()
         self.apply_theme()
         # Apply theme logic here if needed
 
+    def change_tab_freeze_setting(self, secs):
+        self.settings["tab_freeze_idle_secs"] = int(secs)
+        self._save_settings()
+        self.tab_scheduler.set_idle_secs(secs)
+
+    def change_memory_budget_setting(self, mb):
+        self.settings["tab_memory_budget_mb"] = int(mb)
+        self._save_settings()
+        self.memory_governor.set_budget_mb(mb)
+
+    def change_cache_type_setting(self, text):
+        self.settings["http_cache_type"] = text.lower()
+        self._save_settings()
+        _apply_profile_policy(_get_persistent_profile(), self.settings)
+        self._refresh_cache_size()
+
+    def change_cache_size_setting(self, mb):
+        self.settings["http_cache_max_mb"] = int(mb)
+        self._save_settings()
+        _apply_profile_policy(_get_persistent_profile(), self.settings)
+
+    def change_cookie_policy_setting(self, label):
+        for value, text in self._cookie_policy_labels.items():
+            if text == label:
+                self.settings["persistent_cookies"] = value
+        self._save_settings()
+        _apply_profile_policy(_get_persistent_profile(), self.settings)
+        self.cookie_jar.set_persistent(self.settings.get("persistent_cookies") != "session")
+
+    def change_download_segments_setting(self, count):
+        self.settings["download_segments"] = int(count)
+        self._save_settings()
+
+    def change_download_queue_setting(self, *_):
+        self.settings["max_concurrent_downloads"] = self.max_downloads_spin.value()
+        self.settings["max_downloads_per_host"] = self.max_host_downloads_spin.value()
+        self.settings["download_bandwidth_kbps"] = self.download_bandwidth_spin.value()
+        self._save_settings()
+        self.download_scheduler.configure(
+            self.settings["max_concurrent_downloads"],
+            self.settings["max_downloads_per_host"],
+            self.settings["download_bandwidth_kbps"],
+        )
+
+    def change_post_process_setting(self, *_):
+        self.settings["post_process_downloads"] = self.post_process_check.isChecked()
+        self.settings["extract_downloaded_archives"] = self.extract_archives_check.isChecked()
+        self._save_settings()
+
+    def clear_http_cache(self):
+        _get_persistent_profile().clearHttpCache()
+        self.status_bar.showMessage("Clearing cache...", 3000)
+        # Without clearHttpCacheCompleted (Qt < 6.7), re-measure after a moment.
+        if not hasattr(_get_persistent_profile(), "clearHttpCacheCompleted"):
+            QTimer.singleShot(1000, self._refresh_cache_size)
+
+    def _refresh_cache_size(self):
+        """Measure the disk cache on a worker thread; the result updates the Settings readout."""
+        if self._cache_size_label is None:
+            return
+        profile = _get_persistent_profile()
+        if profile.httpCacheType() != QWebEngineProfile.HttpCacheType.DiskHttpCache:
+            self.cache_size_measured.emit(None)
+            return
+        path = profile.cachePath()
+        threading.Thread(
+            target=lambda: self.cache_size_measured.emit(_directory_size(path)),
+            name="flow-cache-size",
+            daemon=True,
+        ).start()
+
+    def _on_cache_size_measured(self, size):
+        label = self._cache_size_label
+        if label is None:
+            return
+        try:
+            if size is None:
+                cache_type = self.settings.get("http_cache_type", "disk")
+                label.setText("Cache size: in memory" if cache_type == "memory" else "Cache size: cache disabled")
+            else:
+                cap = int(self.settings.get("http_cache_max_mb", 0))
+                label.setText(f"Cache size: {self._format_size(size)}" + (f" of {cap} MB" if cap else ""))
+        except RuntimeError:
+            # The Settings dialog (and the label with it) was closed meanwhile.
+            self._cache_size_label = None
+
+    def change_content_blocking_setting(self, enabled):
+        self.settings["content_blocking"] = bool(enabled)
+        self._save_settings()
+        _CONTENT_BLOCKER.enabled = bool(enabled)
+        if enabled:
+            # Pick up lists added or edited since startup.
+            _CONTENT_BLOCKER.reload()
+
+    def change_preconnect_setting(self, enabled):
+        self.settings["preconnect_hints"] = bool(enabled)
+        self._save_settings()
+        self.preconnect.enabled = bool(enabled)
+
     def _cookies_dir(self) -> Path:
         # Store cookies next to flow.py (repo root), in ./flow-cookies
         return Path(__file__).resolve().parent / "flow-cookies"
@@ -1079,110 +5546,17 @@ class MainWindow(QMainWindow):
         # Store cookies in a JSON file for easy inspection and export
         return self._cookies_dir() / "cookies.json"
 
-    def _load_cookies_from_disk(self) -> dict:
-        """Load cookies from disk. Returns dict mapping domain -> list of cookies."""
-        cookies_file = self._cookies_storage_path()
-        if not cookies_file.exists():
-            return {}
-
-        try:
-            with open(cookies_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error loading cookies: {e}")
-            return {}
-
-    def _save_cookies_to_disk(self, cookies_data: dict) -> None:
-        """Save cookies to disk in JSON format."""
-        cookies_dir = self._cookies_dir()
-        cookies_dir.mkdir(parents=True, exist_ok=True)
-
-        try:
-            with open(self._cookies_storage_path(), "w", encoding="utf-8") as f:
-                json.dump(cookies_data, f, indent=2, ensure_ascii=False)
-        except IOError as e:
-            print(f"Error saving cookies: {e}")
-
-    def _extract_cookies_from_profile(self) -> dict:
-        """Extract cookies from the WebEngine profile."""
-        profile = _get_persistent_profile()
-        cookie_store = profile.cookieStore()
-
-        cookies_data = {}
-
-        # Qt doesn't expose a direct way to enumerate cookies, so we store them
-        # when they're set. This is a limitation we'll document.
-        # For now, return the stored cookies from disk.
-        return self._load_cookies_from_disk()
-
-    def _sync_cookies_on_load(self) -> None:
-        """Sync cookies from storage to the web profile on startup."""
-        # This is a placeholder - Qt WebEngine handles cookie persistence
-        # automatically to a default location. Manual sync would require
-        # using Qt's cookie store API which has limited access.
-        pass
+    def _history_db_path(self) -> Path:
+        # Store history next to flow.py (repo root), in ./flow-history
+        return Path(__file__).resolve().parent / "flow-history" / "history.sqlite3"
 
     def _bookmarks_dir(self) -> Path:
         # Store bookmarks next to flow.py (repo root), in ./flow-bookmarks
         return Path(__file__).resolve().parent / "flow-bookmarks"
 
-    def _bookmark_files(self) -> list[tuple[int, Path]]:
-        bookmarks_dir = self._bookmarks_dir()
-        if not bookmarks_dir.exists():
-            return []
-
-        numbered: list[tuple[int, Path]] = []
-        for p in bookmarks_dir.glob("bk*.txt"):
-            m = re.fullmatch(r"bk(\d+)\.txt", p.name, flags=re.IGNORECASE)
-            if not m:
-                continue
-            numbered.append((int(m.group(1)), p))
-
-        numbered.sort(key=lambda t: t[0])
-        return numbered
-
-    def _load_bookmarks_from_disk(self) -> None:
-        # Ensure the folder exists so users can drop files in here manually.
-        self._bookmarks_dir().mkdir(parents=True, exist_ok=True)
-
-        self.bookmarks = []
-        for idx, p in self._bookmark_files():
-            try:
-                url = p.read_text(encoding="utf-8").strip()
-            except UnicodeDecodeError:
-                url = p.read_text(encoding="utf-8", errors="ignore").strip()
-
-            if not url:
-                continue
-
-            # Files store URL only; show a stable label based on the filename.
-            self.bookmarks.append({"title": f"bk{idx}", "url": url})
-
-    def _save_bookmarks_to_disk(self) -> None:
-        bookmarks_dir = self._bookmarks_dir()
-        bookmarks_dir.mkdir(parents=True, exist_ok=True)
-
-        # Keep only valid URLs.
-        self.bookmarks = [b for b in self.bookmarks if (b.get("url") or "").strip()]
-
-        # Remove existing bk*.txt files.
-        for p in bookmarks_dir.glob("bk*.txt"):
-            m = re.fullmatch(r"bk(\d+)\.txt", p.name, flags=re.IGNORECASE)
-            if not m:
-                continue
-            try:
-                p.unlink()
-            except FileNotFoundError:
-                pass
-
-        # Write sequential files (bk1.txt, bk2.txt, ...)
-        for i, bookmark in enumerate(self.bookmarks, start=1):
-            url = (bookmark.get("url") or "").strip()
-            (bookmarks_dir / f"bk{i}.txt").write_text(url + "\n", encoding="utf-8")
-
     def show_bookmarks(self):
-        # Reload from disk each time so the dialog always reflects the folder.
-        self._load_bookmarks_from_disk()
+        # Only re-reads the journal if it changed on disk since we last touched it.
+        self.bookmarks = self.bookmark_store.bookmarks()
 
         dialog = QDialog(self)
         dialog.setWindowTitle("Bookmarks")
@@ -1225,8 +5599,8 @@ class MainWindow(QMainWindow):
             if not url:
                 return
 
-            self.bookmarks.append({"title": title, "url": url})
-            self._save_bookmarks_to_disk()
+            self.bookmarks.append(self.bookmark_store.add(title, url))
+            self.omnibox_index.set_bookmarked(url, title, True)
             self.bookmarks_list.addItem(f"{title} - {url}")
 
     def open_bookmark(self):
@@ -1238,29 +5612,86 @@ class MainWindow(QMainWindow):
     def remove_bookmark(self):
         selected = self.bookmarks_list.currentRow()
         if selected >= 0:
-            del self.bookmarks[selected]
-            self._save_bookmarks_to_disk()
+            removed = self.bookmarks.pop(selected)
+            self.bookmark_store.remove(removed["id"])
+            if not self.bookmark_store.has_url(removed["url"]):
+                self.omnibox_index.set_bookmarked(removed["url"], bookmarked=False)
             self.bookmarks_list.takeItem(selected)
 
     def show_history(self):
         dialog = QDialog(self)
+        dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)  # takes the model (and its store connection) along
         dialog.setWindowTitle("History")
-        dialog.setGeometry(200, 200, 600, 400)
+        dialog.setGeometry(200, 200, 700, 500)
         
         layout = QVBoxLayout()
-        
-        # History list
-        self.history_list = QListWidget()  # Removed redundant import
-        for entry in reversed(self.history[-50:]):  # Show last 50 entries
-            self.history_list.addItem(f"{entry['timestamp']} - {entry['title']} - {entry['url']}")
-        self.history_list.itemDoubleClicked.connect(lambda item: self.open_history_item())
+
+        filter_input = QLineEdit()
+        filter_input.setPlaceholderText("Search history by title or URL")
+        layout.addWidget(filter_input)
+        partial_label = QLabel("No recent matches; type more to search further back.")
+        partial_label.setVisible(False)
+        layout.addWidget(partial_label)
+
+        # Optional visit date range (inclusive days)
+        range_layout = QHBoxLayout()
+        range_check = QCheckBox("Visited from")
+        range_layout.addWidget(range_check)
+        today = QDate.currentDate()
+        from_edit = QDateEdit(today.addDays(-7))
+        to_edit = QDateEdit(today)
+        for edit in (from_edit, to_edit):
+            edit.setCalendarPopup(True)
+            edit.setEnabled(False)
+            range_check.toggled.connect(edit.setEnabled)
+        range_layout.addWidget(from_edit)
+        range_layout.addWidget(QLabel("to"))
+        range_layout.addWidget(to_edit)
+        range_layout.addStretch(1)
+        layout.addLayout(range_layout)
+
+        # History list (pages are fetched as it scrolls, see HistoryListModel)
+        model = HistoryListModel(self, dialog)
+        model.partial_changed.connect(partial_label.setVisible)
+        self.history_list = QListView()
+        self.history_list.setModel(model)
+        self.history_list.setUniformItemSizes(True)
+        self.history_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.history_list.doubleClicked.connect(lambda _index: self.open_history_item())
         layout.addWidget(self.history_list)
+
+        def date_range() -> tuple[float | None, float | None]:
+            if not range_check.isChecked():
+                return None, None
+            start = from_edit.date().startOfDay().toSecsSinceEpoch()
+            end = to_edit.date().addDays(1).startOfDay().toSecsSinceEpoch()
+            return float(start), float(end)
+
+        def apply_filter():
+            model.set_filter(filter_input.text(), *date_range())
+
+        # Debounce typing so a fast typist doesn't queue a query per keystroke.
+        filter_timer = QTimer(dialog)
+        filter_timer.setSingleShot(True)
+        filter_timer.setInterval(100)
+        filter_timer.timeout.connect(apply_filter)
+        filter_input.textChanged.connect(filter_timer.start)
+        for signal in (range_check.toggled, from_edit.dateChanged, to_edit.dateChanged):
+            signal.connect(lambda *_: filter_timer.start())
         
         # Buttons
         button_layout = QHBoxLayout()  # Removed redundant import
         open_btn = QPushButton("Open Selected")  # Removed redundant import
         open_btn.clicked.connect(lambda: self.open_history_item())
         button_layout.addWidget(open_btn)
+
+        delete_sites_btn = QPushButton("Delete Selected Sites")
+        delete_sites_btn.clicked.connect(lambda: self._delete_history_hosts(dialog, model))
+        button_layout.addWidget(delete_sites_btn)
+
+        delete_range_btn = QPushButton("Delete Date Range")
+        delete_range_btn.clicked.connect(lambda: self._delete_history_range(dialog, *date_range()))
+        button_layout.addWidget(delete_range_btn)
         
         clear_btn = QPushButton("Clear History")
         clear_btn.clicked.connect(lambda: self.clear_history(dialog))
@@ -1269,16 +5700,46 @@ class MainWindow(QMainWindow):
         layout.addLayout(button_layout)
         dialog.setLayout(layout)
         dialog.exec()  # Updated from exec_() to exec()
+        self.history_list = None
+
+    def _format_history_item(self, entry: dict) -> str:
+        timestamp = datetime.fromtimestamp(entry["last_visit"]).strftime("%Y-%m-%d %H:%M:%S")
+        return f"{timestamp} - {entry['title']} - {entry['url']}"
 
     def open_history_item(self):
-        selected = self.history_list.currentRow()
-        if selected >= 0:
-            entry = list(reversed(self.history[-50:]))[selected]
+        if self.history_list is None:
+            return
+        entry = self.history_list.model().entry_at(self.history_list.currentIndex().row())
+        if entry is not None:
             self.add_new_tab(entry["url"])
 
+    def _delete_history_hosts(self, dialog, model):
+        rows = {index.row() for index in self.history_list.selectedIndexes()}
+        hosts = sorted({e["host"] for e in map(model.entry_at, rows) if e is not None and e["host"]})
+        if not hosts:
+            QMessageBox.information(dialog, "History", "Select one or more entries first.")
+            return
+        answer = QMessageBox.question(
+            dialog, "Delete History", f"Delete all history for {', '.join(hosts[:5])}{' and more' if len(hosts) > 5 else ''}?"
+        )
+        if answer == QMessageBox.StandardButton.Yes:
+            self.history_store.delete_hosts(hosts)
+            self.omnibox_index.remove_hosts(hosts)
+
+    def _delete_history_range(self, dialog, start, end):
+        if start is None:
+            QMessageBox.information(dialog, "History", "Choose a date range first.")
+            return
+        first = datetime.fromtimestamp(start).strftime("%Y-%m-%d")
+        last = datetime.fromtimestamp(end - 1).strftime("%Y-%m-%d")
+        answer = QMessageBox.question(dialog, "Delete History", f"Delete all history from {first} to {last}?")
+        if answer == QMessageBox.StandardButton.Yes:
+            self.history_store.delete_range(start, end)
+            self.omnibox_index.remove_range(start, end)
+
     def clear_history(self, dialog):
-        self.history.clear()
-        self.history_list.clear()
+        self.history_store.clear()
+        self.omnibox_index.clear()
         dialog.accept()
 
     def _downloads_dir(self) -> Path:
@@ -1292,40 +5753,36 @@ class MainWindow(QMainWindow):
         cleaned = cleaned.strip().strip(".")  # avoid trailing dots/spaces on Windows
         return cleaned or "download"
 
+    def _release_download_name(self, d: dict) -> None:
+        if d.get("path"):
+            path = Path(d["path"])
+            self.download_names.release(path.parent, path.name)
+
     def _unique_download_filename(self, directory: Path, filename: str) -> str:
         filename = self._sanitize_filename(Path(filename).name)
-        base = Path(filename).stem
-        suffix = Path(filename).suffix
-
-        candidate = directory / filename
-        if not candidate.exists():
-            return filename
-
-        i = 1
-        while True:
-            alt = directory / f"{base} ({i}){suffix}"
-            if not alt.exists():
-                return alt.name
-            i += 1
-
-    def _format_download_item(self, d: dict) -> str:
-        received = int(d.get("received", 0) or 0)
-        total = int(d.get("total", 0) or 0)
+        return self.download_names.allocate(directory, filename)
 
+    def _download_status(self, d: dict) -> str:
         # QWebEngine-driven downloads store a DownloadState in d["state"].
-        # Forced HTTP downloads store a human-readable d["status"].
+        # Blob, segmented and restored downloads store a human-readable d["status"].
+        if d.get("queued"):
+            return "Queued"
         state = d.get("state")
         if state is None:
-            status = d.get("status") or ("Completed" if d.get("completed") else "In Progress")
-        elif state == QWebEngineDownloadRequest.DownloadState.DownloadCompleted:
-            status = "Completed"
-        elif state == QWebEngineDownloadRequest.DownloadState.DownloadCancelled:
-            status = "Cancelled"
-        elif state == QWebEngineDownloadRequest.DownloadState.DownloadInterrupted:
+            return d.get("status") or ("Completed" if d.get("completed") else "In Progress")
+        if state == QWebEngineDownloadRequest.DownloadState.DownloadCompleted:
+            return "Completed"
+        if state == QWebEngineDownloadRequest.DownloadState.DownloadCancelled:
+            return "Cancelled"
+        if state == QWebEngineDownloadRequest.DownloadState.DownloadInterrupted:
             reason = (d.get("interrupt_str") or "").strip()
-            status = f"Interrupted: {reason}" if reason else "Interrupted"
-        else:
-            status = "In Progress"
+            return f"Interrupted: {reason}" if reason else "Interrupted"
+        return "In Progress"
+
+    def _format_download_item(self, d: dict) -> str:
+        received = int(d.get("received", 0) or 0)
+        total = int(d.get("total", 0) or 0)
+        status = self._download_status(d)
 
         if total > 0:
             pct = int((received / total) * 100)
@@ -1338,40 +5795,79 @@ class MainWindow(QMainWindow):
         parts = [d.get("filename", "download"), status]
         if progress:
             parts.append(progress)
+        if d.get("segments", 1) > 1 and status == "In Progress":
+            parts.append(f"{d['segments']} connections")
+
+        estimator = d.get("_rate")
+        if estimator is not None and status == "In Progress":
+            rate = estimator.rate()
+            if rate > 0:
+                speed = f"{self._format_size(rate)}/s"
+                eta = estimator.eta(received, total)
+                if eta is not None:
+                    minutes, seconds = divmod(int(eta), 60)
+                    hours, minutes = divmod(minutes, 60)
+                    speed += f", {hours}:{minutes:02d}:{seconds:02d} left" if hours else f", {minutes}:{seconds:02d} left"
+                parts.append(speed)
+
+        post = self._post_process_summary(d) if status == "Completed" else ""
+        if post:
+            parts.append(post)
+
         parts.append(d.get("url", ""))
         return " - ".join(parts)
 
-    def _refresh_downloads_list(self):
-        if self.downloads_list is None:
-            return
-
-        # The dialog can be closed while downloads are still in progress; in that case
-        # the Qt widget is deleted and touching it raises RuntimeError.
-        try:
-            self.downloads_list.clear()
-            for d in self.downloads:
-                self.downloads_list.addItem(self._format_download_item(d))
-        except RuntimeError:
-            self.downloads_list = None
+    def _format_size(self, num_bytes: float) -> str:
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} B"
+        for unit in ("KB", "MB"):
+            num_bytes /= 1024
+            if num_bytes < 1024:
+                return f"{num_bytes:.1f} {unit}"
+        return f"{num_bytes / 1024:.1f} GB"
+
+    def _note_download_progress(self, d: dict):
+        estimator = d.get("_rate")
+        if estimator is None:
+            estimator = d["_rate"] = TransferRateEstimator()
+        estimator.add(int(d.get("received", 0) or 0))
+        self.downloads_model.mark_changed(d)
+        self.download_store.mark_dirty()
+
+    def _page_has_active_download(self, page: QWebEnginePage) -> bool:
+        for req in self.downloads.requests():
+            try:
+                if req.page() is page and req.state() == QWebEngineDownloadRequest.DownloadState.DownloadInProgress:
+                    return True
+            except RuntimeError:
+                continue
+        return False
 
     def _on_download_updated(self, request: QWebEngineDownloadRequest):
-        for d in self.downloads:
-            if d.get("request") is request:
-                d["received"] = int(request.receivedBytes())
-                d["total"] = int(request.totalBytes())
-                d["state"] = request.state()
-                d["interrupt"] = request.interruptReason()
-                d["interrupt_str"] = request.interruptReasonString()
-                d["completed"] = bool(request.isFinished())
-
-                if d["completed"]:
-                    print(
-                        f"Download finished: url={d.get('url')} state={d.get('state')} interrupt={d.get('interrupt_str')}"
-                    )
-                break
+        d = self.downloads.by_request(request)
+        if d is None:
+            return
+
+        d["received"] = int(request.receivedBytes())
+        d["total"] = int(request.totalBytes())
+        d["state"] = request.state()
+        d["interrupt"] = request.interruptReason()
+        d["interrupt_str"] = request.interruptReasonString()
+        d["completed"] = bool(request.isFinished())
+        if d["state"] != QWebEngineDownloadRequest.DownloadState.DownloadInProgress:
+            self.download_scheduler.release(d)
+        if d["state"] == QWebEngineDownloadRequest.DownloadState.DownloadCancelled:
+            self._release_download_name(d)
+        if d["state"] == QWebEngineDownloadRequest.DownloadState.DownloadCompleted:
+            self._post_process_download(d)
+
+        if d["completed"]:
+            print(
+                f"Download finished: url={d.get('url')} state={d.get('state')} interrupt={d.get('interrupt_str')}"
+            )
 
-        # If the Downloads dialog is open, keep it live.
-        self._refresh_downloads_list()
+        # Repainted by the Downloads panel on its next frame.
+        self._note_download_progress(d)
 
     def _on_download_requested(self, request: QWebEngineDownloadRequest):
         directory = self._downloads_dir()
@@ -1380,9 +5876,22 @@ class MainWindow(QMainWindow):
         except Exception as e:
             print(f"Error creating downloads directory {directory}: {e}")
 
+        # Learn from navigations that Chromium turned into downloads (attachment or
+        # non-renderable MIME type). Explicit page.download() calls have no pending
+        # navigation, so "Download current URL" doesn't teach anything.
+        page = request.page()
+        if isinstance(page, BrowserPage) and not request.isSavePageDownload():
+            if page.forced_download_was_page(request):
+                return  # not accepted, so Chromium drops it
+            page.navigation_became_download(request.url())
+
         suggested = request.suggestedFileName() or request.downloadFileName() or "download"
         filename = self._unique_download_filename(directory, suggested)
 
+        if self._should_segment(request):
+            self._start_segmented_download(request, directory / filename)
+            return
+
         request.setDownloadDirectory(str(directory))
         request.setDownloadFileName(filename)
 
@@ -1398,7 +5907,7 @@ class MainWindow(QMainWindow):
             "interrupt_str": request.interruptReasonString(),
             "completed": bool(request.isFinished()),
         }
-        self.downloads.append(entry)
+        self.downloads_model.append(entry)
 
         print(
             f"Download requested: url={request.url().toString()} mime={request.mimeType()} suggested={request.suggestedFileName()}"
@@ -1411,9 +5920,295 @@ class MainWindow(QMainWindow):
         request.interruptReasonChanged.connect(lambda *_: self._on_download_updated(request))
         request.isFinishedChanged.connect(lambda *_: self._on_download_updated(request))
 
-        # Trigger initial UI refresh and start the download.
-        self._refresh_downloads_list()
+        # Start the download; it has to be accepted here, so a queued one is paused at once.
         request.accept()
+        self.download_scheduler.submit(entry, request.resume, request.pause)
+
+    def _should_segment(self, request: QWebEngineDownloadRequest) -> bool:
+        """Large plain HTTP(S) downloads go to SegmentedDownloader instead of Chromium."""
+        segments = int(self.settings.get("download_segments", 1) or 1)
+        min_bytes = int(self.settings.get("segmented_download_min_mb", 0) or 0) * 1024 * 1024
+        if segments <= 1 or request.totalBytes() < max(min_bytes, SegmentedDownloader.MIN_SEGMENT_SIZE):
+            return False
+        if request.url().scheme() not in ("http", "https") or request.isSavePageDownload():
+            return False
+        return self._proxy_allows_direct()
+
+    def _proxy_allows_direct(self) -> bool:
+        # urllib can't speak SOCKS; leave those to Chromium's network stack.
+        return not (self.proxy_settings.get("enabled", False) and self.proxy_settings.get("type", "http").lower() != "http")
+
+    def _direct_request_headers(self, url: QUrl, referer: str = "") -> dict:
+        """The headers Chromium would have sent: user agent, referrer and the jar's cookies."""
+        headers = {"User-Agent": _get_persistent_profile().httpUserAgent()}
+        if referer:
+            headers["Referer"] = referer
+        cookie = _cookie_header(self.cookie_jar.for_host(url.host()), url.toString())
+        if cookie:
+            headers["Cookie"] = cookie
+        return headers
+
+    def _direct_cookie_source(self):
+        """A ``url -> Cookie header`` lookup over a copy of the jar, safe to call from workers.
+
+        The direct fetchers use it for redirect targets, which are only known once
+        the worker sees the redirect.
+        """
+        jar = self.cookie_jar.snapshot()
+
+        def cookies_for(url: str) -> str:
+            host = urllib.parse.urlsplit(url).hostname or ""
+            cookies = [c for domain in CookieJar.host_domains(host) for c in jar.get(domain, ())]
+            return _cookie_header(cookies, url)
+
+        return cookies_for
+
+    def _direct_proxy_url(self) -> str | None:
+        if not self.proxy_settings.get("enabled", False):
+            return None
+        host = self.proxy_settings.get("hostname")
+        port = self.proxy_settings.get("port")
+        if not host or not port:
+            return None
+        user = self.proxy_settings.get("username", "")
+        password = self.proxy_settings.get("password", "")
+        auth = f"{urllib.parse.quote(user, safe='')}:{urllib.parse.quote(password, safe='')}@" if user else ""
+        return f"http://{auth}{host}:{port}"
+
+    def _start_segmented_download(self, request: QWebEngineDownloadRequest, path: Path):
+        page = request.page()
+        referer = page.url().toString() if page is not None else ""
+        segments = int(self.settings.get("download_segments", 1))
+        url = request.url()
+        # Chromium's own transfer is not needed; the job re-requests the URL.
+        request.cancel()
+
+        entry = {
+            "request": None,
+            "filename": path.name,
+            "url": request.url().toString(),
+            "path": str(path),
+            "received": 0,
+            "total": int(request.totalBytes()),
+            "state": None,
+            "completed": False,
+            "status": "In Progress",
+            "segments": segments,
+        }
+        self.downloads_model.append(entry)
+
+        def start():
+            job_id = self.segmented_downloader.start(
+                url.toString(),
+                path,
+                self._direct_request_headers(url, referer),
+                self._direct_proxy_url(),
+                segments,
+                cookies_for=self._direct_cookie_source(),
+            )
+            self.downloads.set_job(entry, job_id)
+            print(f"Segmented download started: url={entry['url']} size={entry['total']} segments={segments}")
+
+        self.download_scheduler.submit(entry, start)
+
+    def _post_process_download(self, d: dict):
+        """Hand a completed download to the post-processing pipeline (once)."""
+        if d.get("_post") or d.get("post_done") or d.get("sha256") or not self.settings.get("post_process_downloads", True):
+            return
+        d["_post"] = "Waiting to hash"
+        path = Path(d["path"])
+        extract_to = None
+        suffix = next((s for s in _ARCHIVE_SUFFIXES if path.name.lower().endswith(s)), None)
+        if suffix and self.settings.get("extract_downloaded_archives", False):
+            stem = path.name[: -len(suffix)] or "archive"
+            extract_to = str(path.parent / self.download_names.allocate(path.parent, stem))
+        self.post_processor.submit(d["id"], path, extract_to=extract_to)
+
+    def _on_post_process_stage(self, entry_id: int, step: str):
+        d = self.downloads.by_id(entry_id)
+        if d is not None:
+            labels = {"hash_sha256": "Hashing", "verify_checksum": "Verifying", "extract_archive": "Extracting"}
+            d["_post"] = labels.get(step, step) + "..."
+            self.downloads_model.mark_changed(d)
+
+    def _on_post_process_finished(self, entry_id: int, job: dict):
+        d = self.downloads.by_id(entry_id)
+        if d is None:
+            return
+        d["_post"] = None
+        d["post_done"] = True  # also after a failure: later state updates must not start it again
+        for key in ("sha256", "verified", "extracted_to"):
+            if key in job:
+                d[key] = job[key]
+        if job.get("error"):
+            d["post_error"] = job["error"]
+        if d.get("verified") is False:
+            print(f"Checksum mismatch: {d['path']}")
+        self.downloads_model.mark_changed(d)
+        self.download_store.mark_dirty()
+
+    def _post_process_summary(self, d: dict) -> str:
+        if d.get("_post"):
+            return d["_post"]
+        if d.get("post_error"):
+            return f"Post-processing failed: {d['post_error']}"
+        if not d.get("sha256"):
+            return ""
+        if d.get("verified") is True:
+            summary = "SHA-256 verified"
+        elif d.get("verified") is False:
+            summary = "CHECKSUM MISMATCH"
+        else:
+            summary = f"SHA-256 {d['sha256'][:12]}"
+        if d.get("extracted_to"):
+            summary += f", extracted to {Path(d['extracted_to']).name}"
+        return summary
+
+    def _downloads_state_path(self) -> Path:
+        # Store download state next to flow.py (repo root), in ./flow-downloads
+        return Path(__file__).resolve().parent / "flow-downloads" / "downloads.json"
+
+    def _download_records(self) -> list[dict]:
+        """``self.downloads`` as plain JSON records (see DownloadStateStore)."""
+        records = []
+        for d in self.downloads:
+            resume = self.segmented_downloader.state(d["job_id"]) if d.get("job_id") else d.get("resume_state")
+            records.append(
+                {
+                    "filename": d.get("filename"),
+                    "url": d.get("url", ""),
+                    "page_url": d.get("page_url", ""),
+                    "mime": d.get("mime", ""),
+                    "path": d.get("path"),
+                    "received": int(d.get("received", 0) or 0),
+                    "total": int(d.get("total", 0) or 0),
+                    "segments": d.get("segments", 1),
+                    "status": self._download_status(d),
+                    "sha256": d.get("sha256"),
+                    "verified": d.get("verified"),
+                    "extracted_to": d.get("extracted_to"),
+                    "post_error": d.get("post_error"),
+                    "resume": resume,  # total, validator and segment offsets, or None
+                }
+            )
+        return records
+
+    def _download_entry_from_record(self, r: dict) -> dict:
+        status = r.get("status") or "Interrupted"
+        if status in ("In Progress", "Queued"):
+            # Still running (or waiting) when the browser closed.
+            status = "Interrupted"
+        entry = {
+            "request": None,
+            "filename": r.get("filename") or Path(r["path"]).name,
+            "url": r.get("url", ""),
+            "page_url": r.get("page_url", ""),
+            "mime": r.get("mime", ""),
+            "path": r["path"],
+            "received": int(r.get("received", 0) or 0),
+            "total": int(r.get("total", 0) or 0),
+            "state": None,
+            "completed": True,
+            "status": status,
+            "segments": int(r.get("segments", 1) or 1),
+        }
+        for key in ("sha256", "verified", "extracted_to", "post_error"):
+            if r.get(key) is not None:
+                entry[key] = r[key]
+        if r.get("resume"):
+            entry["resume_state"] = r["resume"]
+        return entry
+
+    def _partial_download_state(self, d: dict, path: Path) -> dict | None:
+        """Resume state for a browser download's partial file, or None to start over.
+
+        Chromium's validators aren't exposed, so the range requests are checked
+        against the recorded size only.
+        """
+        total = int(d.get("total", 0) or 0)
+        for candidate in (path, path.with_name(path.name + ".crdownload")):
+            try:
+                size = candidate.stat().st_size
+                if candidate != path:
+                    os.replace(candidate, path)
+            except OSError:
+                continue
+            if 0 < size <= total:
+                return {"total": total, "validator": None, "segments": [[0, total - 1, size]]}
+            return None
+        return None
+
+    def resume_download(self):
+        if not self.downloads_list:
+            return
+        selected = self.downloads_list.currentIndex().row()
+        if 0 <= selected < len(self.downloads) and not self._resume_download(self.downloads[selected]):
+            self.status_bar.showMessage("This download can't be resumed.", 3000)
+
+    def prioritize_download(self):
+        if not self.downloads_list:
+            return
+        selected = self.downloads_list.currentIndex().row()
+        if 0 <= selected < len(self.downloads):
+            self.download_scheduler.prioritize(self.downloads[selected])
+
+    def _resume_download(self, d: dict) -> bool:
+        """Resume an interrupted download; returns False if there is nothing to resume."""
+        if d.get("queued"):
+            return False
+        req = d.get("request")
+        if req is not None:
+            try:
+                if req.state() == QWebEngineDownloadRequest.DownloadState.DownloadInterrupted:
+                    # Within a session Chromium resumes with its own validators.
+                    self.download_scheduler.submit(d, req.resume)
+                    self._note_download_progress(d)
+                    return True
+                return False
+            except RuntimeError:
+                pass  # the request object is gone; fall back to range requests
+
+        if not self._download_status(d).startswith("Interrupted"):
+            return False
+        url = QUrl(d.get("url", ""))
+        if url.scheme() not in ("http", "https"):
+            return False
+        if not self._proxy_allows_direct():
+            # Chromium can only start over; its new entry replaces this one.
+            current_tab = self.tabs.currentWidget()
+            if not current_tab or not hasattr(current_tab, "web_view"):
+                return False
+            self.downloads_model.remove_row(self.downloads.row_of(d))
+            current_tab.web_view.page().download(url, d.get("filename") or url.fileName())
+            return True
+
+        path = Path(d["path"])
+        state = d.pop("resume_state", None)
+        if state is None:
+            state = self._partial_download_state(d, path)
+        elif not path.exists():
+            state = None
+        segments = len(state["segments"]) if state and state["segments"] else int(self.settings.get("download_segments", 1) or 1)
+
+        def start():
+            job_id = self.segmented_downloader.start(
+                url.toString(),
+                path,
+                self._direct_request_headers(url, d.get("page_url", "")),
+                self._direct_proxy_url(),
+                segments,
+                state,
+                cookies_for=self._direct_cookie_source(),
+            )
+            self.downloads.set_job(d, job_id)
+            print(f"Download resumed: url={d['url']} from={d['received']} bytes")
+
+        d.pop("_rate", None)
+        d.update(state=None, completed=False, status="In Progress", segments=segments)
+        d["received"] = sum(pos - first for first, _end, pos in state["segments"]) if state else 0
+        self.download_scheduler.submit(d, start)
+        self._note_download_progress(d)
+        return True
 
     def _on_downloads_dialog_finished(self, *_):
         self._downloads_dialog = None
@@ -1429,16 +6224,26 @@ class MainWindow(QMainWindow):
         
         layout = QVBoxLayout()
         
-        # Downloads list
-        self.downloads_list = QListWidget()  # Removed redundant import
+        # Downloads list (a view over self.downloads_model)
+        self.downloads_list = QListView()
+        self.downloads_list.setModel(self.downloads_model)
+        self.downloads_list.setUniformItemSizes(True)
         layout.addWidget(self.downloads_list)
-        self._refresh_downloads_list()
         
         # Buttons
         button_layout = QHBoxLayout()  # Removed redundant import
         open_btn = QPushButton("Open File Location")  # Removed redundant import
         open_btn.clicked.connect(lambda: self.open_download_location())
         button_layout.addWidget(open_btn)
+
+        resume_btn = QPushButton("Resume")
+        resume_btn.clicked.connect(lambda: self.resume_download())
+        button_layout.addWidget(resume_btn)
+
+        start_next_btn = QPushButton("Start Next")
+        start_next_btn.setToolTip("Move the selected queued download to the front of the queue")
+        start_next_btn.clicked.connect(lambda: self.prioritize_download())
+        button_layout.addWidget(start_next_btn)
         
         remove_btn = QPushButton("Remove Selected")
         remove_btn.clicked.connect(lambda: self.remove_download())
@@ -1455,7 +6260,7 @@ class MainWindow(QMainWindow):
 
         selected = -1
         if self.downloads_list is not None:
-            selected = self.downloads_list.currentRow()
+            selected = self.downloads_list.currentIndex().row()
 
         try:
             if selected is not None and selected >= 0 and selected < len(self.downloads):
@@ -1481,7 +6286,7 @@ class MainWindow(QMainWindow):
         if not self.downloads_list:
             return
 
-        selected = self.downloads_list.currentRow()
+        selected = self.downloads_list.currentIndex().row()
         if selected >= 0 and selected < len(self.downloads):
             d = self.downloads[selected]
             req = d.get("request")
@@ -1489,36 +6294,58 @@ class MainWindow(QMainWindow):
                 # If it's still running, cancel before removing.
                 if req and req.state() == QWebEngineDownloadRequest.DownloadState.DownloadInProgress:
                     req.cancel()
+                if d.get("blob_id") and not d.get("completed"):
+                    self.blob_writer.cancel(d["blob_id"])
+                if d.get("job_id") and not d.get("completed"):
+                    self.segmented_downloader.cancel(d["job_id"])
             except Exception:
                 pass
+            if not d.get("completed"):
+                # Its handlers won't find the removed entry, so give the name back here.
+                self._release_download_name(d)
+            self.download_scheduler.release(d)
 
-            del self.downloads[selected]
-            self._refresh_downloads_list()
+            self.downloads_model.remove_row(selected)
 
     def show_cookies(self):
-        """Display and manage cookies from the flow-cookies directory."""
-        # Load cookies from disk
-        cookies_data = self._load_cookies_from_disk()
-
+        """Display and manage the cookies in the browser profile."""
         dialog = QDialog(self)
         dialog.setWindowTitle("Cookies")
+        # Deleted on close, so its model stops following the jar.
+        dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
         dialog.setGeometry(200, 200, 700, 500)
 
         layout = QVBoxLayout()
 
-        # Cookies list
-        cookies_list = QListWidget()
-        if cookies_data:
-            for domain, cookies in cookies_data.items():
-                for cookie in cookies:
-                    cookie_name = cookie.get("name", "Unknown")
-                    cookie_value = cookie.get("value", "")
-                    expires = cookie.get("expires", "Session")
-                    cookies_list.addItem(f"{domain} | {cookie_name}={cookie_value[:30]}{'...' if len(cookie_value) > 30 else ''} (expires: {expires})")
-        else:
-            cookies_list.addItem("No cookies stored")
+        filter_input = QLineEdit()
+        filter_input.setPlaceholderText("Filter by domain or name")
+        layout.addWidget(filter_input)
+
+        # Cookies list (rows are formatted and fetched lazily, see CookieListModel)
+        model = CookieListModel(self, dialog)
+        cookies_list = QListView()
+        cookies_list.setModel(model)
+        cookies_list.setUniformItemSizes(True)
+        cookies_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         layout.addWidget(cookies_list)
 
+        count_label = QLabel()
+        layout.addWidget(count_label)
+
+        def update_count():
+            total = model.total()
+            count_label.setText(f"{total} cookie{'s' if total != 1 else ''}" if total else "No cookies stored")
+
+        model.total_changed.connect(lambda _total: update_count())
+        update_count()
+
+        # Debounce typing so each keystroke doesn't re-filter a large jar.
+        filter_timer = QTimer(dialog)
+        filter_timer.setSingleShot(True)
+        filter_timer.setInterval(150)
+        filter_timer.timeout.connect(lambda: model.set_filter(filter_input.text()))
+        filter_input.textChanged.connect(filter_timer.start)
+
         # Buttons
         button_layout = QHBoxLayout()
         
@@ -1526,12 +6353,16 @@ class MainWindow(QMainWindow):
         open_folder_btn.clicked.connect(lambda: self._open_cookies_folder())
         button_layout.addWidget(open_folder_btn)
 
+        delete_domain_btn = QPushButton("Delete Domain Cookies")
+        delete_domain_btn.clicked.connect(lambda: self._delete_selected_cookie_domains(dialog, cookies_list, model))
+        button_layout.addWidget(delete_domain_btn)
+
         clear_btn = QPushButton("Clear All Cookies")
-        clear_btn.clicked.connect(lambda: self._clear_all_cookies(dialog, cookies_list))
+        clear_btn.clicked.connect(lambda: self._clear_all_cookies(dialog))
         button_layout.addWidget(clear_btn)
 
         refresh_btn = QPushButton("Refresh")
-        refresh_btn.clicked.connect(lambda: self._refresh_cookies_list(dialog, cookies_list))
+        refresh_btn.clicked.connect(model.refresh)
         button_layout.addWidget(refresh_btn)
 
         close_btn = QPushButton("Close")
@@ -1542,6 +6373,13 @@ class MainWindow(QMainWindow):
         dialog.setLayout(layout)
         dialog.exec()
 
+    def _format_cookie_item(self, cookie: dict) -> str:
+        value = cookie.get("value", "")
+        return (
+            f"{cookie.get('domain', '')} | {cookie.get('name', 'Unknown')}="
+            f"{value[:30]}{'...' if len(value) > 30 else ''} (expires: {cookie.get('expires', 'Session')})"
+        )
+
     def _open_cookies_folder(self):
         """Open the flow-cookies folder in the file explorer."""
         cookies_dir = str(self._cookies_dir())
@@ -1558,8 +6396,30 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Could not open cookies folder: {e}")
 
-    def _clear_all_cookies(self, dialog, cookies_list):
-        """Clear all cookies and update the UI."""
+    def _delete_selected_cookie_domains(self, dialog, cookies_list, model):
+        """Delete every cookie of the domains of the selected rows."""
+        domains = set()
+        for index in cookies_list.selectionModel().selectedIndexes():
+            cookie = model.cookie_at(index.row())
+            if cookie is not None:
+                domains.add(cookie["domain"])
+        if not domains:
+            return
+
+        shown = ", ".join(sorted(domains)[:5]) + (", ..." if len(domains) > 5 else "")
+        reply = QMessageBox.question(
+            dialog,
+            "Delete Domain Cookies",
+            f"Delete all cookies for {shown}?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+        )
+        if reply == QMessageBox.StandardButton.Yes:
+            # Removed from the jar now; the profile store deletes them in batches.
+            self.cookie_jar.delete_domains(domains)
+            model.refresh()
+
+    def _clear_all_cookies(self, dialog):
+        """Clear all cookies; the open list refreshes from the jar."""
         reply = QMessageBox.question(
             dialog,
             "Clear All Cookies",
@@ -1568,35 +6428,39 @@ class MainWindow(QMainWindow):
         )
 
         if reply == QMessageBox.StandardButton.Yes:
-            # Clear the stored cookies file
-            self._save_cookies_to_disk({})
-            
-            # Also try to clear WebEngine cookies
+            # The store reports each deletion, but clear the jar up front so the
+            # list (and cookies.json) is empty straight away.
+            self.cookie_jar.clear()
             profile = _get_persistent_profile()
             profile.cookieStore().deleteAllCookies()
-            
-            # Update the list
-            cookies_list.clear()
-            cookies_list.addItem("No cookies stored")
             QMessageBox.information(dialog, "Success", "All cookies have been cleared.")
 
-    def _refresh_cookies_list(self, dialog, cookies_list):
-        """Refresh the cookies list from disk."""
-        cookies_data = self._load_cookies_from_disk()
-        cookies_list.clear()
-
-        if cookies_data:
-            for domain, cookies in cookies_data.items():
-                for cookie in cookies:
-                    cookie_name = cookie.get("name", "Unknown")
-                    cookie_value = cookie.get("value", "")
-                    expires = cookie.get("expires", "Session")
-                    cookies_list.addItem(f"{domain} | {cookie_name}={cookie_value[:30]}{'...' if len(cookie_value) > 30 else ''} (expires: {expires})")
-        else:
-            cookies_list.addItem("No cookies stored")
-
     # ...existing code...
 
+    def _settings_path(self) -> Path:
+        return Path(__file__).resolve().parent / "flow-settings" / "settings.json"
+
+    def _load_settings(self) -> dict:
+        settings = dict(_DEFAULT_SETTINGS)
+        path = self._settings_path()
+        if not path.exists():
+            return settings
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                settings.update(json.load(f))
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Error loading settings: {e}")
+        return settings
+
+    def _save_settings(self):
+        path = self._settings_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.settings, f, indent=2)
+        except IOError as e:
+            print(f"Error saving settings: {e}")
+
     def _proxy_settings_path(self) -> Path:
         return Path(__file__).resolve().parent / "flow-proxy" / "settings.json"
 
@@ -1631,7 +6495,8 @@ class MainWindow(QMainWindow):
                 self.show_proxy_settings_dialog()
                 # Re-check if settings were added
                 if not self.proxy_settings.get("hostname") or not self.proxy_settings.get("port"):
-                    self.enable_proxy_action.setChecked(False)
+                    if self.enable_proxy_action is not None:
+                        self.enable_proxy_action.setChecked(False)
                     self.proxy_settings["enabled"] = False
                     self._save_proxy_settings()
                     return
@@ -1699,11 +6564,130 @@ class MainWindow(QMainWindow):
             self.proxy_settings["password"] = pass_edit.text()
             self._save_proxy_settings()
 
-            if self.enable_proxy_action.isChecked():
+            if self.proxy_settings.get("enabled", False):
                 self.apply_proxy()
 
+_FCP_JS = """
+(function() {
+  var e = performance.getEntriesByName('first-contentful-paint')[0];
+  return e ? performance.timeOrigin + e.startTime : null;
+})();
+"""
+
+
+def _run_startup_probe(spawned_at: float) -> None:
+    """One cold start for --startup-benchmark; prints its timings as a JSON line.
+
+    Times are milliseconds since the parent spawned this process (wall clock), so
+    interpreter start-up and the imports are included.
+    """
+    app = QApplication.instance()
+    result = {"window_shown_ms": None, "chrome_paint_ms": None, "first_paint_ms": None, "load_finished_ms": None}
+
+    def since_spawn(t: float | None = None) -> float:
+        return round(((t if t is not None else time.time()) - spawned_at) * 1000.0, 1)
+
+    class _FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Type.Paint and result["chrome_paint_ms"] is None:
+                result["chrome_paint_ms"] = since_spawn()
+            return False
+
+    def finish():
+        if result.get("done"):
+            return
+        result["done"] = True
+        print(json.dumps({k: v for k, v in result.items() if k != "done"}), flush=True)
+        window.close()
+        app.quit()
+
+    def on_fcp(fcp_epoch_ms):
+        if fcp_epoch_ms:
+            result["first_paint_ms"] = since_spawn(fcp_epoch_ms / 1000.0)
+        finish()
+
+    def on_load_finished(_ok):
+        if result["load_finished_ms"] is None:
+            result["load_finished_ms"] = since_spawn()
+            # Paint timing entries may lag loadFinished a little.
+            QTimer.singleShot(250, lambda: window.tabs.widget(0).web_view.page().runJavaScript(_FCP_JS, on_fcp))
+
+    def on_first_tab(_index):
+        tab = window.tabs.widget(0)
+        if tab is not None and not getattr(tab, "_startup_probe_hooked", False):
+            tab._startup_probe_hooked = True
+            tab.web_view.loadFinished.connect(on_load_finished)
+
+    window = MainWindow()
+    paint_filter = _FirstPaint(window)
+    window.installEventFilter(paint_filter)
+    window.tabs.currentChanged.connect(on_first_tab)
+    window.show()
+    result["window_shown_ms"] = since_spawn()
+    QTimer.singleShot(30000, finish)  # give up on a page that never finishes
+    app.exec()
+
+
+def _run_startup_benchmark(runs: int) -> None:
+    """Launch the browser ``runs`` times in fresh processes and print the cold-start timings."""
+    keys = ("window_shown_ms", "chrome_paint_ms", "first_paint_ms", "load_finished_ms")
+    samples: dict[str, list[float]] = {k: [] for k in keys}
+    print("run  " + "  ".join(f"{k:>16}" for k in keys))
+    for run in range(1, runs + 1):
+        spawned_at = time.time()
+        try:
+            proc = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "--startup-probe", repr(spawned_at)],
+                capture_output=True, text=True, timeout=60,
+            )
+            lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+            if not lines:
+                errors = proc.stderr.strip().splitlines()
+                print(f"{run:>3}  probe failed: {errors[-1] if errors else f'exit code {proc.returncode}'}")
+                continue
+            result = json.loads(lines[-1])
+        except (subprocess.TimeoutExpired, json.JSONDecodeError) as e:
+            print(f"{run:>3}  probe failed: {e}")
+            continue
+        for k in keys:
+            if result.get(k) is not None:
+                samples[k].append(result[k])
+        print(f"{run:>3}  " + "  ".join(f"{result.get(k) if result.get(k) is not None else '-':>16}" for k in keys))
+
+    print()
+    for k in keys:
+        values = samples[k]
+        if values:
+            print(f"{k:>16}: median {statistics.median(values):.1f}  min {min(values):.1f}  max {max(values):.1f}  (n={len(values)})")
+        else:
+            print(f"{k:>16}: no samples")
+
+
 if __name__ == "__main__":
+    if "--startup-benchmark" in sys.argv:
+        # The parent only spawns and times probes; it never starts Qt itself.
+        i = sys.argv.index("--startup-benchmark")
+        runs = int(sys.argv[i + 1]) if i + 1 < len(sys.argv) and sys.argv[i + 1].isdigit() else 10
+        _run_startup_benchmark(runs)
+        sys.exit(0)
+    if "--bridge-benchmark" in sys.argv:
+        # Like the startup benchmark, the parent only spawns probes.
+        i = sys.argv.index("--bridge-benchmark")
+        tabs = int(sys.argv[i + 1]) if i + 1 < len(sys.argv) and sys.argv[i + 1].isdigit() else 200
+        _run_bridge_benchmark(tabs)
+        sys.exit(0)
+    _register_url_schemes()
     app = QApplication(sys.argv)
+    if "--startup-probe" in sys.argv:
+        _run_startup_probe(float(sys.argv[sys.argv.index("--startup-probe") + 1]))
+        sys.exit(0)
+    if "--registry-benchmark" in sys.argv:
+        _run_registry_benchmark()
+        sys.exit(0)
+    if "--bridge-probe" in sys.argv:
+        i = sys.argv.index("--bridge-probe")
+        _run_bridge_probe(sys.argv[i + 1], int(sys.argv[i + 2]))
+        sys.exit(0)
     window = MainWindow()
     window.show()
     sys.exit(app.exec())
\ No newline at end of file
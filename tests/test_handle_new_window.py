@@ -0,0 +1,74 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("PyQt6.QtWebEngineWidgets", exc_type=ImportError)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PyQt6.QtCore import QUrl  # noqa: E402
+
+import flow  # noqa: E402
+
+
+class _Request:
+    def __init__(self, url):
+        self._url = QUrl(url)
+        self.opened_in = None
+
+    def requestedUrl(self):
+        return self._url
+
+    def openIn(self, page):
+        self.opened_in = page
+
+
+class _Page:
+    def __init__(self):
+        self.downloads = []
+
+    def force_download(self, url, new_tab=False):
+        self.downloads.append((url.toString(), new_tab))
+
+
+def _window(decisions):
+    page = _Page()
+    tabs = []
+
+    def add_new_tab(opener_page=None):
+        tabs.append(opener_page)
+        return SimpleNamespace(page=lambda: "new-tab-page")
+
+    window = SimpleNamespace(
+        download_decisions=decisions,
+        sender=lambda: None,
+        add_new_tab=add_new_tab,
+        tabs=SimpleNamespace(currentWidget=lambda: SimpleNamespace(web_view=SimpleNamespace(page=lambda: page))),
+    )
+    return window, page, tabs
+
+
+def test_plain_http_url_opens_new_tab():
+    window, page, tabs = _window(flow.DownloadDecisionCache())
+    request = _Request("http://example.com/article")
+
+    flow.MainWindow.handle_new_window(window, request)
+
+    assert tabs == [None]
+    assert request.opened_in == "new-tab-page"
+    assert page.downloads == []
+
+
+def test_known_download_url_is_downloaded():
+    decisions = flow.DownloadDecisionCache()
+    decisions.learn(QUrl("https://example.com/files/report.pdf"), flow.DownloadDecisionCache.DOWNLOAD)
+    window, page, tabs = _window(decisions)
+    request = _Request("https://example.com/files/report.pdf")
+
+    flow.MainWindow.handle_new_window(window, request)
+
+    assert tabs == []
+    assert request.opened_in is None
+    assert page.downloads == [("https://example.com/files/report.pdf", True)]